@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Customer, Technician, Appointment, AppointmentPhoto
+from .models import Customer, Technician, Appointment, AppointmentPhoto, WorkingHours
 
 @admin.register(Customer)
 class CustomerAdmin(admin.ModelAdmin):
@@ -28,3 +28,8 @@ class AppointmentAdmin(admin.ModelAdmin):
 class AppointmentPhotoAdmin(admin.ModelAdmin):
     list_display = ('appointment', 'uploaded_at')
     list_filter = ('uploaded_at',)
+
+@admin.register(WorkingHours)
+class WorkingHoursAdmin(admin.ModelAdmin):
+    list_display = ('technician', 'weekday', 'start_time', 'end_time')
+    list_filter = ('weekday', 'technician')
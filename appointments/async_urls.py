@@ -0,0 +1,14 @@
+from django.urls import re_path
+
+from . import async_views
+
+# Only numeric ids, so list-level actions such as appointments/bulk/ keep their regular routes
+urlpatterns = [
+    re_path(r'^appointments/$', async_views.AppointmentView.as_view({'get': 'list'})),
+    re_path(r'^appointments/(?P<pk>[0-9]+)/$', async_views.AppointmentView.as_view({'get': 'retrieve'})),
+    re_path(r'^bills/$', async_views.BillView.as_view({'get': 'list'})),
+    re_path(r'^bills/(?P<pk>[0-9]+)/$', async_views.BillView.as_view({'get': 'retrieve'})),
+    re_path(r'^photos/$', async_views.PhotoView.as_view({'get': 'list'})),
+    re_path(r'^photos/upload/$', async_views.PhotoView.as_view({'post': 'upload'})),
+    re_path(r'^photos/(?P<pk>[0-9]+)/$', async_views.PhotoView.as_view({'get': 'retrieve'})),
+]
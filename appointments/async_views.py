@@ -0,0 +1,237 @@
+"""
+Native async variants of the read-heavy endpoints, for the ASGI entry point.
+
+``AsyncRoutesMiddleware`` sends requests that arrive over ASGI through
+``fieldmaster.asgi_urls``, which serves these URLs with the views below
+before falling back to the regular routes:
+
+- ``GET /api/appointments/``, ``/api/bills/``, ``/api/photos/`` and their
+  ``/{id}/`` details
+- ``POST /api/photos/upload/``
+
+Each view drives the same viewset as the WSGI path (filters, query plans,
+pagination, serializers, ETags, permissions), so the responses are the
+same, but authenticates, probes and fetches with the async ORM. The event
+loop keeps serving other requests while one waits on the database, and
+rendering the loaded rows runs no query. Other methods on these URLs, and
+format suffixes, are handed to the regular view.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import SynchronousOnlyOperation, ValidationError as DjangoValidationError
+from django.http import Http404
+from django.urls import resolve
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.authentication import (
+    BaseAuthentication, SessionAuthentication, TokenAuthentication, get_authorization_header,
+)
+from rest_framework.response import Response
+
+from . import blobs, views
+from .mixins import _conditional_response, _set_validators
+from .query_plans import build_query_plan
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+class Authenticated(BaseAuthentication):
+    """Hands DRF the outcome of ``authenticate`` when the viewset asks for ``request.user``."""
+
+    def __init__(self, result):
+        self.result = result
+
+    def authenticate(self, request):
+        return self.result
+
+
+async def authenticate(request):
+    """Run the request's authenticators, awaiting their queries. Return ``(user, auth)`` or None."""
+    for authenticator in request.authenticators:
+        if isinstance(authenticator, TokenAuthentication):
+            result = await _authenticate_token(authenticator, request)
+        elif isinstance(authenticator, SessionAuthentication):
+            result = None
+            auser = getattr(request._request, 'auser', None)
+            user = await auser() if auser is not None else None
+            if user is not None and user.is_active:
+                authenticator.enforce_csrf(request)
+                result = (user, None)
+        else:
+            result = await sync_to_async(authenticator.authenticate)(request)
+        if result is not None:
+            return result
+    return None
+
+
+async def _authenticate_token(authenticator, request):
+    parts = get_authorization_header(request).split()
+    if not parts or parts[0].lower() != authenticator.keyword.lower().encode():
+        return None
+    try:
+        key = parts[1].decode() if len(parts) == 2 else None
+    except UnicodeError:
+        key = None
+    if key is None:
+        # Malformed header: raises the same error as the sync view, before any query
+        return authenticator.authenticate(request)
+    model = authenticator.get_model()
+    token = await model.objects.select_related('user').filter(key=key).afirst()
+    if token is None:
+        raise exceptions.AuthenticationFailed('Invalid token.')
+    if not token.user.is_active:
+        raise exceptions.AuthenticationFailed('User inactive or deleted.')
+    return (token.user, token)
+
+
+async def loaded(func):
+    """
+    Call ``func`` on the event loop; it should only read objects that are
+    already loaded. If it touches the database anyway (a relation no query
+    plan covers), finish it in a thread instead of failing.
+    """
+    try:
+        return func()
+    except SynchronousOnlyOperation:
+        return await sync_to_async(func)()
+
+
+async def serialize(viewset, instance, **kwargs):
+    serializer = await loaded(lambda: viewset.get_serializer(instance, **kwargs))
+    loader = serializer.context.get('photo_loader')
+    if loader is not None:
+        await loader.aload()
+    return await loaded(lambda: serializer.data)
+
+
+async def fallback(request):
+    """Serve ``request`` with the regular view of its URL, in a thread as Django runs sync views."""
+    match = resolve(request.path_info, urlconf=settings.ROOT_URLCONF)
+    request.resolver_match = match
+    return await sync_to_async(match.func)(request, *match.args, **match.kwargs)
+
+
+class AsyncViewSetView:
+    """Serves some actions of ``viewset_class`` natively async; see the module docstring."""
+    viewset_class = None
+
+    @classmethod
+    def as_view(cls, actions):
+        actions = dict(actions)
+        if 'get' in actions:
+            actions.setdefault('head', actions['get'])
+        handler = cls()
+
+        async def view(request, *args, **kwargs):
+            action = actions.get(request.method.lower())
+            if action is None:
+                return await fallback(request)
+            return await handler.dispatch(request, action, kwargs)
+        view = csrf_exempt(view)
+        # Read by ReplicaMiddleware, as on DRF's viewset views
+        view.cls = cls.viewset_class
+        view.actions = actions
+        return view
+
+    async def dispatch(self, request, action, kwargs):
+        viewset = self.viewset_class(action_map={request.method.lower(): action})
+        viewset.setup(request, **kwargs)
+        request = viewset.initialize_request(request, **kwargs)
+        viewset.request = request
+        viewset.headers = viewset.default_response_headers
+        try:
+            if request.method not in SAFE_METHODS:
+                # Parsing a multipart body writes large files to disk; keep that off the event loop
+                await asyncio.to_thread(lambda: request.data)
+            request.authenticators = (Authenticated(await authenticate(request)),)
+            viewset.initial(request, **kwargs)
+            response = await getattr(self, action)(viewset, request)
+        except Exception as exc:
+            response = viewset.handle_exception(exc)
+        return viewset.finalize_response(request, response)
+
+    def get_list_queryset(self, viewset, request):
+        return viewset.filter_queryset(viewset.get_queryset())
+
+    def get_object_queryset(self, viewset):
+        return viewset.filter_queryset(viewset.get_queryset())
+
+    async def get_object(self, viewset):
+        """``GenericAPIView.get_object`` with the async ORM."""
+        queryset = self.get_object_queryset(viewset)
+        lookup_url_kwarg = viewset.lookup_url_kwarg or viewset.lookup_field
+        try:
+            instance = await queryset.aget(**{viewset.lookup_field: viewset.kwargs[lookup_url_kwarg]})
+        except queryset.model.DoesNotExist:
+            raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+        except (TypeError, ValueError, DjangoValidationError):
+            raise Http404
+        viewset.check_object_permissions(viewset.request, instance)
+        return instance
+
+    def list_has_validators(self, viewset):
+        return viewset.uses_validators()
+
+    async def list(self, viewset, request):
+        queryset = self.get_list_queryset(viewset, request)
+        etag = None
+        if self.list_has_validators(viewset):
+            etag = await viewset.aget_list_validators(queryset)
+            response = _conditional_response(request, etag)
+            if response is not None:
+                return _set_validators(response, etag)
+        page = None
+        if viewset.paginator is not None:
+            page = await viewset.paginator.apaginate_queryset(queryset, request, view=viewset)
+        if page is not None:
+            response = viewset.get_paginated_response(await serialize(viewset, page, many=True))
+        else:
+            response = Response(await serialize(viewset, [row async for row in queryset], many=True))
+        return _set_validators(response, etag) if etag else response
+
+    async def retrieve(self, viewset, request):
+        instance = await self.get_object(viewset)
+        if not viewset.uses_validators():
+            return Response(await serialize(viewset, instance))
+        etag, last_modified = await loaded(lambda: viewset.get_object_validators(instance))
+        response = _conditional_response(request, etag, last_modified)
+        if response is None:
+            response = Response(await serialize(viewset, instance))
+        return _set_validators(response, etag, last_modified)
+
+
+class AppointmentView(AsyncViewSetView):
+    viewset_class = views.AppointmentViewSet
+
+
+class BillView(AsyncViewSetView):
+    viewset_class = views.BillViewSet
+
+
+class PhotoView(AsyncViewSetView):
+    viewset_class = views.PhotoViewSet
+
+    def list_has_validators(self, viewset):
+        # PhotoViewSet.list has its own filters and sends no ETag
+        return False
+
+    def get_list_queryset(self, viewset, request):
+        queryset = self.get_object_queryset(viewset)
+        content_type = request.query_params.get('content_type')
+        object_id = request.query_params.get('object_id')
+        if content_type and object_id:
+            queryset = queryset.filter(content_type=content_type, object_id=object_id)
+        return queryset
+
+    def get_object_queryset(self, viewset):
+        # Load the uploader with the photos instead of once per row while rendering
+        return build_query_plan(viewset.get_serializer()).apply(viewset.get_queryset())
+
+    async def upload(self, viewset, request):
+        photo = request.FILES.get('photo')
+        if photo is not None:
+            # Hash off the event loop; the blob store then uses this digest instead of reading the file again
+            photo.sha256, _ = await asyncio.to_thread(blobs.hash_content, photo)
+        return await sync_to_async(viewset.upload)(request)
@@ -0,0 +1,218 @@
+"""
+Technician availability engine.
+
+Busy time comes from an in-process interval index built from ``Appointment``
+rows (``appointment_date`` + ``start_time``/``end_time``); working time comes
+from ``WorkingHours`` templates. Times are handled as integer minutes since
+``date.min`` so the hot loop is plain integer arithmetic over sorted lists.
+
+The index loads days lazily, only the ones a query touches, and is then kept
+current by the ``Appointment`` signal receivers in ``receivers.py``. Changes made
+by other processes are picked up when the loaded days expire after
+``AVAILABILITY_INDEX_TTL`` seconds.
+"""
+import bisect
+import threading
+from collections import defaultdict
+from datetime import date, datetime, time
+from time import monotonic
+
+from django.conf import settings
+
+from .models import Appointment, Technician, WorkingHours
+
+MINUTES_PER_DAY = 24 * 60
+
+# Used when no WorkingHours rows exist at all: Monday to Friday, 8am to 5pm
+DEFAULT_WORKING_HOURS = {weekday: [(8 * 60, 17 * 60)] for weekday in range(5)}
+
+
+def to_minutes(day, moment):
+    return day.toordinal() * MINUTES_PER_DAY + moment.hour * 60 + moment.minute
+
+
+def from_minutes(minutes):
+    day, minute = divmod(minutes, MINUTES_PER_DAY)
+    return datetime.combine(date.fromordinal(day), time(minute // 60, minute % 60))
+
+
+def appointment_interval(appointment_date, start_time, end_time):
+    start = to_minutes(appointment_date, start_time)
+    end = to_minutes(appointment_date, end_time)
+    if end <= start:
+        # Runs past midnight
+        end += MINUTES_PER_DAY
+    return start, end
+
+
+class AvailabilityIndex:
+    """Per-technician sorted busy intervals, loaded by day and updated incrementally."""
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl if ttl is not None else getattr(settings, 'AVAILABILITY_INDEX_TTL', 60)
+        self.lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self._busy = defaultdict(list)  # technician_id -> [(start, end, appointment_id)]
+            self._entries = {}  # appointment_id -> (technician_id, start, end)
+            self._loaded_days = set()
+            self._loaded_at = monotonic()
+
+    def ensure_loaded(self, first_day, last_day):
+        """Load every appointment on days ``first_day``..``last_day`` not already indexed."""
+        with self.lock:
+            if monotonic() - self._loaded_at > self.ttl:
+                self.clear()
+            # A day's busy time can start on the previous day (overnight jobs)
+            wanted = range(first_day.toordinal() - 1, last_day.toordinal() + 1)
+            missing = [day for day in wanted if day not in self._loaded_days]
+            if not missing:
+                return
+            rows = (
+                Appointment.objects
+                .filter(
+                    appointment_date__range=(date.fromordinal(missing[0]), date.fromordinal(missing[-1])),
+                    technician__isnull=False,
+                )
+                .exclude(status='cancelled')
+                .values_list('id', 'technician_id', 'appointment_date', 'start_time', 'end_time')
+            )
+            for appointment_id, technician_id, appointment_date, start_time, end_time in rows:
+                self._put(appointment_id, technician_id, *appointment_interval(appointment_date, start_time, end_time))
+            self._loaded_days.update(range(missing[0], missing[-1] + 1))
+
+    def update(self, appointment):
+        """Re-index one appointment after it was saved."""
+        with self.lock:
+            self._remove(appointment.id)
+            if (appointment.technician_id is None or appointment.status == 'cancelled'
+                    or appointment.appointment_date.toordinal() not in self._loaded_days):
+                return
+            self._put(appointment.id, appointment.technician_id, *appointment_interval(
+                appointment.appointment_date, appointment.start_time, appointment.end_time
+            ))
+
+    def remove(self, appointment_id):
+        with self.lock:
+            self._remove(appointment_id)
+
+    def _put(self, appointment_id, technician_id, start, end):
+        self._remove(appointment_id)
+        bisect.insort(self._busy[technician_id], (start, end, appointment_id))
+        self._entries[appointment_id] = (technician_id, start, end)
+
+    def _remove(self, appointment_id):
+        entry = self._entries.pop(appointment_id, None)
+        if entry is not None:
+            technician_id, start, end = entry
+            self._busy[technician_id].remove((start, end, appointment_id))
+
+    def busy(self, technician_id, start, end):
+        """Merged busy intervals of a technician overlapping ``[start, end)``."""
+        intervals = self._busy.get(technician_id, ())
+        i = bisect.bisect_left(intervals, (start - MINUTES_PER_DAY,))
+        merged = []
+        for busy_start, busy_end, _ in intervals[i:]:
+            if busy_start >= end:
+                break
+            if busy_end <= start:
+                continue
+            if merged and busy_start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], busy_end)
+            else:
+                merged.append([busy_start, busy_end])
+        return merged
+
+
+index = AvailabilityIndex()
+
+
+def working_hours_by_technician():
+    """Return ``{technician_id or None: {weekday: [(start, end), ...]}}``, None being the default template."""
+    templates = defaultdict(lambda: defaultdict(list))
+    for technician_id, weekday, start_time, end_time in WorkingHours.objects.values_list(
+        'technician_id', 'weekday', 'start_time', 'end_time'
+    ):
+        templates[technician_id][weekday].append(
+            (start_time.hour * 60 + start_time.minute, end_time.hour * 60 + end_time.minute)
+        )
+    if None not in templates:
+        templates[None] = DEFAULT_WORKING_HOURS
+    return templates
+
+
+def working_windows(template, start, end):
+    """Yield the working-time windows of ``template`` clipped to ``[start, end)``."""
+    for day in range(start // MINUTES_PER_DAY, (end - 1) // MINUTES_PER_DAY + 1):
+        weekday = date.fromordinal(day).weekday()
+        base = day * MINUTES_PER_DAY
+        for window_start, window_end in sorted(template.get(weekday, ())):
+            window_start, window_end = max(base + window_start, start), min(base + window_end, end)
+            if window_start < window_end:
+                yield window_start, window_end
+
+
+def free_slots(start, end, duration, limit=None, technician_ids=None):
+    """
+    Return free slots of at least ``duration`` minutes for every available
+    technician between the naive datetimes ``start`` and ``end``.
+
+    Each slot is the whole free gap inside a working window. Slots are ranked
+    by start time, then by how little the technician is booked inside the
+    requested range, to spread work evenly.
+    """
+    range_start = to_minutes(start.date(), start.time())
+    range_end = to_minutes(end.date(), end.time())
+    index.ensure_loaded(start.date(), end.date())
+
+    technicians = Technician.objects.filter(is_available=True)
+    if technician_ids is not None:
+        technicians = technicians.filter(id__in=technician_ids)
+    technicians = list(technicians.values_list('id', 'user__first_name', 'user__last_name'))
+    templates = working_hours_by_technician()
+
+    slots = []
+    windows_by_template = {}
+    with index.lock:
+        for technician_id, first_name, last_name in technicians:
+            template = templates.get(technician_id, templates[None])
+            windows = windows_by_template.get(id(template))
+            if windows is None:
+                # Most technicians share the default template, so expand it once
+                windows = windows_by_template[id(template)] = list(working_windows(template, range_start, range_end))
+            busy = index.busy(technician_id, range_start, range_end)
+            booked = sum(min(b_end, range_end) - max(b_start, range_start) for b_start, b_end in busy)
+            name = f"{first_name} {last_name}".strip()
+
+            b = 0
+            for window_start, window_end in windows:
+                while b < len(busy) and busy[b][1] <= window_start:
+                    b += 1
+                cursor, j = window_start, b
+                while cursor < window_end:
+                    gap_end = window_end
+                    if j < len(busy) and busy[j][0] < window_end:
+                        gap_end = max(cursor, busy[j][0])
+                    if gap_end - cursor >= duration:
+                        slots.append((cursor, booked, technician_id, gap_end, name))
+                    if gap_end == window_end:
+                        break
+                    cursor = max(cursor, busy[j][1])
+                    j += 1
+
+    slots.sort()
+    if limit is not None:
+        slots = slots[:limit]
+    return [
+        {
+            'technician_id': technician_id,
+            'technician_name': name,
+            'start': from_minutes(slot_start),
+            'end': from_minutes(slot_end),
+            'minutes': slot_end - slot_start,
+            'booked_minutes': booked,
+        }
+        for slot_start, booked, technician_id, slot_end, name in slots
+    ]
@@ -0,0 +1,171 @@
+"""
+Content-addressed storage for photo files.
+
+``Photo.photo`` and ``AppointmentPhoto.photo`` are
+``ContentAddressedImageField``s: a new file is hashed while it is saved and
+stored as ``blobs/ab/cd/<sha256><ext>``. When a file with the same content
+is already stored nothing is written, and the row just points at the
+existing blob. ``PhotoBlob`` keeps a reference count per blob; derivatives
+(``appointments.derivatives``) are named after the blob, so duplicates share
+those too.
+
+Dropping the last reference does not delete the file straight away, since a
+concurrent upload of the same content may be about to reuse it. ``prune()``
+(run by ``manage.py dedupe_photos``) deletes blobs that have had no
+references for a while, after checking the photo tables themselves.
+"""
+import hashlib
+import os
+import re
+from datetime import timedelta
+
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import AppointmentPhoto, Photo, PhotoBlob
+from .query_plans import has_timestamp
+
+BLOB_PREFIX = 'blobs/'
+PHOTO_MODELS = (Photo, AppointmentPhoto)
+DIGEST_PATTERN = re.compile(r'^blobs/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})')
+EXTENSION_PATTERN = re.compile(r'^\.[a-z0-9]{1,5}$')
+
+
+def blob_name(digest, filename):
+    extension = os.path.splitext(filename or '')[1].lower()
+    if not EXTENSION_PATTERN.match(extension):
+        extension = ''
+    return f'{BLOB_PREFIX}{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+def digest_of(name):
+    """Return the SHA-256 in a blob name, or None for files stored before content addressing."""
+    match = DIGEST_PATTERN.match(name or '')
+    return match.group(1) if match else None
+
+
+def hash_content(content):
+    """
+    Return ``(sha256 hex, size)`` of a file, reading it in chunks, unless the
+    file carries an already verified ``sha256`` attribute.
+    """
+    if getattr(content, 'sha256', None):
+        return content.sha256, content.size
+    if not hasattr(content, 'chunks'):
+        content = File(content)
+    hasher = hashlib.sha256()
+    size = 0
+    for chunk in content.chunks():
+        hasher.update(chunk)
+        size += len(chunk)
+    return hasher.hexdigest(), size
+
+
+def acquire(content, filename, storage):
+    """Store ``content`` unless a blob with its digest exists, add a reference, and return the blob's name."""
+    digest, size = hash_content(content)
+    with transaction.atomic():
+        blob, _ = _store(digest, size, filename, storage, lambda target: storage.save(target, content))
+        _count(digest, 1)
+    return blob.name
+
+
+def adopt(name, digest, size, storage):
+    """
+    Move the rows that use the pre-blob file ``name`` onto the blob for
+    ``digest``, copying the file there if it is the first of its content.
+    The old file is deleted once the change commits. Return ``(rows moved,
+    bytes written)``.
+    """
+    def copy(target):
+        with storage.open(name, 'rb') as source:
+            storage.save(target, source)
+
+    with transaction.atomic():
+        moved = 0
+        blob, written = _store(digest, size, name, storage, copy)
+        for model in PHOTO_MODELS:
+            update_fields = ['photo', 'updated_at'] if has_timestamp(model) else ['photo']
+            for row in model._default_manager.filter(photo=name):
+                row.photo = blob.name
+                row.save(update_fields=update_fields)
+                moved += 1
+        _count(digest, moved)
+        if moved:
+            transaction.on_commit(lambda: storage.delete(name))
+    return moved, written
+
+
+def release(name, references=1):
+    """Drop ``references`` to the blob ``name``. Files stored before content addressing are left alone."""
+    digest = digest_of(name)
+    if digest is not None:
+        PhotoBlob.objects.filter(digest=digest).update(
+            ref_count=Greatest(F('ref_count') - references, 0), updated_at=timezone.now()
+        )
+
+
+def count_references(name):
+    return sum(model._default_manager.filter(photo=name).count() for model in PHOTO_MODELS)
+
+
+def prune(storage, grace=timedelta(hours=1)):
+    """
+    Delete blobs, with their derivatives, that have had no references for
+    ``grace``. Return the number of bytes freed.
+    """
+    freed = 0
+    candidates = PhotoBlob.objects.filter(ref_count=0, updated_at__lt=timezone.now() - grace)
+    for digest in list(candidates.values_list('digest', flat=True)):
+        with transaction.atomic():
+            blob = PhotoBlob.objects.select_for_update().filter(digest=digest).first()
+            if blob is None or blob.ref_count:
+                continue
+            references = count_references(blob.name)
+            if references:
+                # Rows that were pointed at the blob without going through the field
+                blob.ref_count = references
+                blob.save(update_fields=['ref_count', 'updated_at'])
+                continue
+            directory = os.path.dirname(blob.name)
+            try:
+                _, files = storage.listdir(directory)
+            except FileNotFoundError:
+                files = []
+            for filename in files:
+                if filename.startswith(digest):
+                    path = f'{directory}/{filename}'
+                    freed += storage.size(path)
+                    storage.delete(path)
+            blob.delete()
+    return freed
+
+
+def _store(digest, size, filename, storage, write):
+    """
+    Lock or create the blob row and, if its file is missing, call
+    ``write(name)`` to store it. Return ``(blob, bytes written)``.
+    """
+    blob = PhotoBlob.objects.select_for_update().filter(digest=digest).first()
+    if blob is None:
+        try:
+            with transaction.atomic():
+                blob = PhotoBlob.objects.create(digest=digest, name=blob_name(digest, filename), size=size)
+        except IntegrityError:
+            # Created by a concurrent upload of the same content
+            blob = PhotoBlob.objects.select_for_update().get(digest=digest)
+    if storage.exists(blob.name):
+        # Also covers files left by a transaction that rolled back
+        return blob, 0
+    write(blob.name)
+    return blob, size
+
+
+def _count(digest, references):
+    if references:
+        PhotoBlob.objects.filter(digest=digest).update(
+            ref_count=F('ref_count') + references, updated_at=timezone.now()
+        )
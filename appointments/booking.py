@@ -0,0 +1,183 @@
+"""
+Double-booking protection for technicians.
+
+Bookings of a technician are serialized by a database lock held until the
+outermost transaction ends, so processes and hosts wait for each other:
+``pg_advisory_xact_lock`` on PostgreSQL, ``SELECT ... FOR UPDATE`` on the
+technician rows on other backends that support it, and on SQLite a write to
+those rows, which takes the database's single write lock. Under the lock an
+application-level overlap check finds the conflicting appointment to report.
+
+On PostgreSQL the ``appointment_no_technician_overlap`` exclusion constraint
+(migration 0013) also makes the database reject overlapping appointments
+written without going through ``booking()``.
+"""
+import threading
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+
+from .availability import appointment_interval
+from .exceptions import BookingConflict
+from .models import Appointment, Technician
+
+EXCLUSION_CONSTRAINT = 'appointment_no_technician_overlap'
+# First key of the technicians' advisory locks, so they cannot collide with other advisory locks
+ADVISORY_LOCK_CLASS = 4701
+
+_sqlite_locks = defaultdict(threading.RLock)
+_sqlite_locks_guard = threading.Lock()
+
+
+def blocks_time(appointment):
+    return appointment.technician_id is not None and appointment.status != 'cancelled'
+
+
+def lock_technicians(technician_ids):
+    """
+    Lock every technician in ``technician_ids`` until the outermost
+    transaction commits or rolls back. Must run inside ``transaction.atomic``.
+    Locks are taken in id order so two batches cannot deadlock.
+    """
+    technician_ids = sorted(set(technician_ids))
+    if not technician_ids:
+        return
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for technician_id in technician_ids:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [ADVISORY_LOCK_CLASS, technician_id])
+    elif connection.features.has_select_for_update:
+        list(Technician.objects.select_for_update().filter(id__in=technician_ids).order_by('id').values_list('id'))
+    else:
+        # SQLite: any write takes the database's write lock until commit; updating no column changes nothing
+        Technician.objects.filter(id__in=technician_ids).update(id=F('id'))
+
+
+@contextmanager
+def sqlite_thread_locks(technician_ids):
+    """
+    On SQLite, queue the threads of this process per technician before they
+    take the database lock: with a shared-cache database (the test database)
+    SQLite fails a second writer at once instead of waiting for it. Other
+    processes still wait on the database lock itself.
+    """
+    if connection.vendor != 'sqlite':
+        yield
+        return
+    with ExitStack() as stack:
+        for technician_id in sorted(set(technician_ids)):
+            with _sqlite_locks_guard:
+                lock = _sqlite_locks[technician_id]
+            stack.enter_context(lock)
+        yield
+
+
+def overlap_q(appointment_date, start_time, end_time):
+    """
+    Q matching appointments whose time overlaps ``start_time``-``end_time`` on
+    ``appointment_date``. An end time at or before the start time means the
+    appointment runs past midnight, as in the PostgreSQL constraint.
+    """
+    overnight = Q(end_time__lte=F('start_time'))
+    same_day = Q(appointment_date=appointment_date) & (Q(end_time__gt=start_time) | overnight)
+    if end_time > start_time:
+        same_day &= Q(start_time__lt=end_time)
+    condition = same_day | (
+        Q(appointment_date=appointment_date - timedelta(days=1)) & overnight & Q(end_time__gt=start_time)
+    )
+    if end_time <= start_time:
+        condition |= Q(appointment_date=appointment_date + timedelta(days=1), start_time__lt=end_time)
+    return condition
+
+
+def find_conflict(appointment):
+    """Return an existing appointment that overlaps ``appointment``, or None."""
+    if not blocks_time(appointment):
+        return None
+    conflicts = (
+        Appointment.objects
+        .filter(overlap_q(appointment.appointment_date, appointment.start_time, appointment.end_time),
+                technician_id=appointment.technician_id)
+        .exclude(status='cancelled')
+        .order_by('appointment_date', 'start_time', 'id')
+    )
+    if appointment.pk is not None:
+        conflicts = conflicts.exclude(pk=appointment.pk)
+    return conflicts.first()
+
+
+def find_batch_conflict(appointments):
+    """
+    Return ``(appointment, competing)`` for the first new appointment in
+    ``appointments`` that overlaps another one in the batch or in the
+    database, or None. Uses one query for the whole batch.
+    """
+    batch = [appointment for appointment in appointments if blocks_time(appointment)]
+    if not batch:
+        return None
+
+    dates = [appointment.appointment_date for appointment in batch]
+    existing = (
+        Appointment.objects
+        .filter(
+            technician_id__in={appointment.technician_id for appointment in batch},
+            appointment_date__range=(min(dates) - timedelta(days=1), max(dates) + timedelta(days=1)),
+        )
+        .exclude(status='cancelled')
+        # Rows being rescheduled or reassigned are checked at their new times
+        .exclude(pk__in=[appointment.pk for appointment in batch if appointment.pk is not None])
+    )
+    by_technician = defaultdict(list)
+    for other in existing:
+        by_technician[other.technician_id].append((*_interval(other), other))
+    for appointment in batch:
+        start, end = _interval(appointment)
+        for other_start, other_end, other in by_technician[appointment.technician_id]:
+            if start < other_end and other_start < end:
+                return appointment, other
+        by_technician[appointment.technician_id].append((start, end, appointment))
+    return None
+
+
+def _interval(appointment):
+    return appointment_interval(appointment.appointment_date, appointment.start_time, appointment.end_time)
+
+
+def is_overlap_violation(error):
+    return EXCLUSION_CONSTRAINT in str(error)
+
+
+@contextmanager
+def booking(appointments):
+    """
+    Wrap the saving of ``appointments`` so overlapping bookings raise
+    ``BookingConflict``: opens a transaction, takes the technician locks,
+    checks for conflicts and turns exclusion-constraint violations raised
+    inside the block into ``BookingConflict`` as well. Inside a caller's
+    transaction the locks are held until that transaction ends.
+    """
+    technician_ids = [appointment.technician_id for appointment in appointments if blocks_time(appointment)]
+    with sqlite_thread_locks(technician_ids), transaction.atomic():
+        lock_technicians(technician_ids)
+        if len(appointments) == 1:
+            competing = find_conflict(appointments[0])
+            conflict = (appointments[0], competing) if competing else None
+        else:
+            conflict = find_batch_conflict(appointments)
+        if conflict:
+            raise BookingConflict(*conflict)
+        try:
+            with transaction.atomic():
+                yield
+        except IntegrityError as error:
+            if not is_overlap_violation(error):
+                raise
+            # Lost a race on PostgreSQL: report whoever won
+            for appointment in appointments:
+                competing = find_conflict(appointment)
+                if competing:
+                    raise BookingConflict(appointment, competing) from error
+            raise BookingConflict(appointments[0], None) from error
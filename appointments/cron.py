@@ -0,0 +1,86 @@
+"""
+Cron expressions for periodic tasks.
+
+Supports the five standard fields (minute, hour, day of month, month, day
+of week) with ``*``, numbers, ranges (``1-5``), lists (``1,15``) and steps
+(``*/10``, ``8-18/2``). Day of week runs from 0 (Sunday) to 6; 7 is also
+Sunday. As in cron, when both day fields are restricted a day matching
+either one qualifies.
+"""
+from datetime import timedelta
+
+FIELDS = (('minute', 0, 59), ('hour', 0, 23), ('day', 1, 31), ('month', 1, 12), ('weekday', 0, 7))
+
+
+class CronError(ValueError):
+    pass
+
+
+def _parse_field(text, low, high):
+    values = set()
+    for part in text.split(','):
+        step = 1
+        if '/' in part:
+            part, step_text = part.split('/', 1)
+            if not step_text.isdigit() or int(step_text) == 0:
+                raise CronError(f"Invalid step in {text!r}")
+            step = int(step_text)
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start_text, end_text = part.split('-', 1)
+            if not (start_text.isdigit() and end_text.isdigit()):
+                raise CronError(f"Invalid range in {text!r}")
+            start, end = int(start_text), int(end_text)
+        elif part.isdigit():
+            start = end = int(part)
+            if step != 1:
+                end = high
+        else:
+            raise CronError(f"Invalid value in {text!r}")
+        if not low <= start <= end <= high:
+            raise CronError(f"{text!r} is outside {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class Cron:
+    """A parsed cron expression; ``next_after`` gives the next matching minute."""
+
+    def __init__(self, expression):
+        parts = expression.split()
+        if len(parts) != len(FIELDS):
+            raise CronError(f"{expression!r} must have {len(FIELDS)} fields")
+        self.expression = expression
+        fields = {name: _parse_field(part, low, high) for part, (name, low, high) in zip(parts, FIELDS)}
+        self.minutes = fields['minute']
+        self.hours = fields['hour']
+        self.days = fields['day']
+        self.months = fields['month']
+        self.weekdays = frozenset(day % 7 for day in fields['weekday'])
+        self.any_day = parts[2] == '*'
+        self.any_weekday = parts[4] == '*'
+
+    def _day_matches(self, moment):
+        # Python's Monday is 0; cron's Sunday is 0
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment):
+        """The first matching minute strictly after ``moment``, in ``moment``'s timezone."""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Four years covers every valid combination, including 29 February
+        limit = candidate + timedelta(days=4 * 366)
+        while candidate < limit:
+            if candidate.month not in self.months or not self._day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+            elif candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise CronError(f"{self.expression!r} never matches")
@@ -0,0 +1,89 @@
+"""
+Aggregates for the dashboard.
+
+``summary()`` computes every figure with two aggregate queries, one over
+appointments and one over bills. ``cached_summary()`` serves it from the
+Django cache. The receivers in ``receivers.py`` call ``invalidate()`` after
+any change to an appointment, bill or line item commits, so the cached copy
+is never stale. With several server processes, set ``CACHES`` to a shared
+backend (Redis, Memcached) so that invalidation reaches all of them.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .models import CENTS, Appointment, Bill
+
+CACHE_KEY = 'dashboard:summary:{date}'
+REVENUE_WINDOWS = (7, 30, 365)
+OUTSTANDING_STATUSES = ('sent', 'overdue')
+
+
+def summary(today=None):
+    """Return the dashboard figures as of ``today`` (defaults to the local date)."""
+    if today is None:
+        today = timezone.localdate()
+
+    appointment_figures = {
+        f'status_{value}': Count('id', filter=Q(status=value)) for value, _ in Appointment.STATUS_CHOICES
+    }
+    appointment_figures.update({
+        f'priority_{value}': Count('id', filter=Q(priority=value)) for value, _ in Appointment.PRIORITY_CHOICES
+    })
+    appointments = Appointment.objects.aggregate(
+        total=Count('id'),
+        today=Count('id', filter=Q(appointment_date=today) & ~Q(status='cancelled')),
+        **appointment_figures
+    )
+
+    outstanding = Q(type='bill', status__in=OUTSTANDING_STATUSES)
+    overdue = Q(type='bill') & (Q(status='overdue') | Q(status='sent', due_date__lt=today))
+    revenue = {
+        f'revenue_{days}': Sum('total', filter=Q(
+            type='bill', status='paid', created_at__date__gt=today - timedelta(days=days)
+        ))
+        for days in REVENUE_WINDOWS
+    }
+    bills = Bill.objects.aggregate(
+        outstanding_count=Count('id', filter=outstanding),
+        outstanding_total=Sum('total', filter=outstanding),
+        overdue_count=Count('id', filter=overdue),
+        overdue_total=Sum('total', filter=overdue),
+        **revenue
+    )
+
+    def money(value):
+        return str(Decimal(value or 0).quantize(CENTS))
+
+    return {
+        'date': today,
+        'appointments': {
+            'total': appointments['total'],
+            'today': appointments['today'],
+            'by_status': {value: appointments[f'status_{value}'] for value, _ in Appointment.STATUS_CHOICES},
+            'by_priority': {value: appointments[f'priority_{value}'] for value, _ in Appointment.PRIORITY_CHOICES},
+        },
+        'bills': {
+            'outstanding': {'count': bills['outstanding_count'], 'total': money(bills['outstanding_total'])},
+            'overdue': {'count': bills['overdue_count'], 'total': money(bills['overdue_total'])},
+        },
+        'revenue': {f'last_{days}_days': money(bills[f'revenue_{days}']) for days in REVENUE_WINDOWS},
+    }
+
+
+def cached_summary():
+    today = timezone.localdate()
+    key = CACHE_KEY.format(date=today.isoformat())
+    data = cache.get(key)
+    if data is None:
+        data = summary(today)
+        cache.set(key, data, getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 24 * 60 * 60))
+    return data
+
+
+def invalidate():
+    cache.delete(CACHE_KEY.format(date=timezone.localdate().isoformat()))
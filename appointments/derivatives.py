@@ -0,0 +1,194 @@
+"""
+Resized copies of uploaded photos.
+
+Every ``Photo`` and ``AppointmentPhoto`` gets a ``thumbnail`` and a
+``medium`` derivative, written next to the original and exposed by the
+serializers as ``thumbnail_url``/``medium_url``. Rows that share a
+content-addressed original (``appointments.blobs``) share its derivatives,
+so a duplicate upload is not resized again. The receivers schedule a
+photo once its upload commits; a background thread reads the original and
+hands the resizing to a process pool (``imaging.render``), so neither the
+request nor the server's threads spend CPU on it. ``manage.py
+process_photos`` backfills existing photos through the same pool.
+
+Set ``PHOTO_DERIVATIVES_INLINE = True`` to process in the saving thread
+instead (tests, single-process development servers).
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+
+from django.db.models import Q
+
+from . import blobs, imaging
+from .models import AppointmentPhoto, Photo
+from .query_plans import has_timestamp
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_FIELDS = ('thumbnail', 'medium')
+DERIVED_MODELS = (Photo, AppointmentPhoto)
+
+_lock = threading.Lock()
+_processes = None
+_threads = None
+
+
+def sizes():
+    configured = getattr(settings, 'PHOTO_DERIVATIVE_SIZES', {})
+    return [(name, configured.get(name, default)) for name, default in zip(DERIVATIVE_FIELDS, (320, 1280))]
+
+
+def image_format():
+    return getattr(settings, 'PHOTO_DERIVATIVE_FORMAT', 'WEBP')
+
+
+def render_args(data):
+    return data, sizes(), image_format(), getattr(settings, 'PHOTO_DERIVATIVE_QUALITY', 80)
+
+
+def workers():
+    return getattr(settings, 'PHOTO_WORKERS', None) or os.cpu_count() or 1
+
+
+def process_pool(max_workers=None):
+    """A new process pool for ``imaging.render``. Workers are spawned, not forked, since the server is threaded."""
+    return ProcessPoolExecutor(max_workers=max_workers or workers(), mp_context=multiprocessing.get_context('spawn'))
+
+
+def _pools():
+    global _processes, _threads
+    with _lock:
+        if _processes is None:
+            _processes = process_pool()
+            _threads = ThreadPoolExecutor(max_workers=workers(), thread_name_prefix='photo')
+    return _processes, _threads
+
+
+def schedule(model, pk):
+    """Generate the derivatives of ``model`` row ``pk`` in the background."""
+    if getattr(settings, 'PHOTO_DERIVATIVES_INLINE', False):
+        process(model, pk)
+        return
+    processes, threads = _pools()
+    threads.submit(_process_in_thread, model, pk, processes)
+
+
+def _process_in_thread(model, pk, processes):
+    try:
+        process(model, pk, processes)
+    except Exception:
+        logger.exception("Could not generate derivatives for %s %s", model._meta.label, pk)
+    finally:
+        # Pool threads are reused; do not leave connections open between jobs
+        connection.close()
+
+
+def read_source(instance):
+    with instance.photo.open('rb') as source:
+        return source.read()
+
+
+def process(model, pk, pool=None):
+    """Render and store the derivatives of one photo. Return True if they were stored."""
+    instance = model._default_manager.filter(pk=pk).first()
+    if instance is None or not instance.photo:
+        return False
+    data = read_source(instance)
+    if pool is None:
+        images = imaging.render(*render_args(data))
+    else:
+        images = pool.submit(imaging.render, *render_args(data)).result()
+    return store(instance, images)
+
+
+def store(instance, images, replace=False):
+    """
+    Write ``images`` (from ``imaging.render``) and point ``instance`` at them,
+    unless the photo was deleted or replaced while they were rendered. Every
+    row sharing a content-addressed original gets the same derivatives, and a
+    blob's existing derivatives are reused unless ``replace`` is set.
+    Derivatives no row uses any more are deleted after the change commits.
+    """
+    model = type(instance)
+    source = instance.photo.name
+    stem = os.path.splitext(source)[0]
+    extension = '.jpg' if image_format() == 'JPEG' else '.' + image_format().lower()
+    storage = instance.photo.storage
+    shared = blobs.digest_of(source) is not None
+    written = {}
+    for name, data in images.items():
+        target = f'{stem}_{name}{extension}'
+        if shared and not replace and storage.exists(target):
+            written[name] = target
+        else:
+            written[name] = storage.save(target, ContentFile(data))
+
+    with transaction.atomic():
+        current = model._default_manager.select_for_update().filter(pk=instance.pk).first()
+        if current is None or current.photo.name != source:
+            # A blob's derivatives may already be in use elsewhere; blobs.prune() collects them
+            if not shared:
+                for name in written.values():
+                    storage.delete(name)
+            return False
+        rows = [current]
+        if shared:
+            rows = [
+                row for derived in DERIVED_MODELS
+                for row in derived._default_manager.select_for_update().filter(photo=source)
+            ]
+        replaced = set()
+        for row in rows:
+            replaced.update(getattr(row, field).name for field in written if getattr(row, field))
+            for field, name in written.items():
+                setattr(row, field, name)
+            update_fields = list(written) + (['updated_at'] if has_timestamp(type(row)) else [])
+            row.save(update_fields=update_fields)
+        replaced -= set(written.values())
+        transaction.on_commit(lambda: _delete_unused(storage, replaced))
+    return True
+
+
+def _delete_unused(storage, names):
+    for name in names:
+        in_use = any(
+            derived._default_manager.filter(Q(thumbnail=name) | Q(medium=name)).exists()
+            for derived in DERIVED_MODELS
+        )
+        if not in_use:
+            storage.delete(name)
+
+
+def reuse(instance):
+    """
+    Give ``instance`` the derivatives of another row with the same
+    content-addressed original. Return False if there are none to reuse.
+    """
+    source = instance.photo.name
+    if blobs.digest_of(source) is None:
+        return False
+    for derived in DERIVED_MODELS:
+        existing = (
+            derived._default_manager.filter(photo=source)
+            .exclude(thumbnail='').exclude(medium='')
+            .values_list(*DERIVATIVE_FIELDS).first()
+        )
+        if existing is not None:
+            for field, name in zip(DERIVATIVE_FIELDS, existing):
+                setattr(instance, field, name)
+            instance.save(update_fields=list(DERIVATIVE_FIELDS) + (
+                ['updated_at'] if has_timestamp(type(instance)) else []
+            ))
+            return True
+    return False
+
+
+def needs_derivatives(instance):
+    return bool(instance.photo) and not all(getattr(instance, field) for field in DERIVATIVE_FIELDS)
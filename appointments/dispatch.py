@@ -0,0 +1,337 @@
+"""
+Dispatch optimizer: proposes technicians for a day's unassigned appointments.
+
+Appointments keep their booked times, which act as the customer's time window.
+The optimizer decides who does each job so that every technician's day stays
+feasible (required skills, working hours, existing bookings, and enough drive
+time between consecutive visits) while keeping total travel low. The visit
+order of each technician follows from the booked times.
+
+Travel is estimated offline from ``Customer.latitude``/``longitude`` and each
+technician's home location: great-circle distances for every pair of stops
+are computed in one vectorized numpy pass, scaled by ``DISPATCH_ROAD_FACTOR``
+and converted to minutes at ``DISPATCH_AVERAGE_SPEED_KMH``. Stops without
+coordinates are treated as zero travel and reported in ``missing_locations``.
+
+Jobs are placed in priority order (emergency first; within a priority, jobs
+with the fewest eligible technicians first) at their cheapest feasible spot,
+then a relocation pass moves jobs between technicians while that saves travel.
+"""
+import bisect
+from datetime import timedelta
+from time import monotonic
+
+import numpy as np
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+
+from .availability import MINUTES_PER_DAY, appointment_interval, from_minutes, working_hours_by_technician, working_windows
+from .booking import booking
+from .models import Appointment, Technician
+from .signals import appointments_bulk_updated
+
+EARTH_RADIUS_KM = 6371.0088
+PRIORITY_RANK = {'emergency': 0, 'high': 1, 'medium': 2, 'low': 3}
+
+
+def distance_matrix(latitudes, longitudes):
+    """
+    Return the ``n x n`` haversine distance matrix in kilometres for the
+    given coordinates (degrees). Missing coordinates are NaN in the input and
+    give NaN rows and columns.
+    """
+    lat = np.radians(np.asarray(latitudes, dtype=float))
+    lon = np.radians(np.asarray(longitudes, dtype=float))
+    dlat = lat[:, None] - lat[None, :]
+    dlon = lon[:, None] - lon[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class Stop:
+    __slots__ = ('appointment_id', 'start', 'end', 'point', 'job')
+
+    def __init__(self, appointment_id, start, end, point, job=None):
+        self.appointment_id = appointment_id
+        self.start = start
+        self.end = end
+        self.point = point
+        self.job = job  # index into the job list, None for an existing booking
+
+
+class Route:
+    """One technician's day: sorted stops plus the working windows they must fit in."""
+
+    def __init__(self, technician_id, name, skills, home, windows):
+        self.technician_id = technician_id
+        self.name = name
+        self.skills = skills
+        self.home = home
+        self.windows = windows
+        self.window_starts = [start for start, _ in windows]
+        self.stops = []
+
+    def fits_hours(self, start, end):
+        i = bisect.bisect_right(self.window_starts, start) - 1
+        return i >= 0 and end <= self.windows[i][1]
+
+    def insertion(self, stop, travel):
+        """Return ``(extra_minutes, position)`` for inserting ``stop``, or None if infeasible."""
+        if not self.fits_hours(stop.start, stop.end):
+            return None
+        i = bisect.bisect_left([s.start for s in self.stops], stop.start)
+        previous = self.stops[i - 1] if i else None
+        following = self.stops[i] if i < len(self.stops) else None
+        before = previous.point if previous else self.home
+        if previous and previous.end + travel[previous.point][stop.point] > stop.start:
+            return None
+        if following and stop.end + travel[stop.point][following.point] > following.start:
+            return None
+        extra = travel[before][stop.point]
+        if following:
+            extra += travel[stop.point][following.point] - travel[before][following.point]
+        return extra, i
+
+    def removal_saving(self, position, travel):
+        stop = self.stops[position]
+        before = self.stops[position - 1].point if position else self.home
+        saving = travel[before][stop.point]
+        if position + 1 < len(self.stops):
+            after = self.stops[position + 1].point
+            saving += travel[stop.point][after] - travel[before][after]
+        return saving
+
+
+def plan_dispatch(day, technician_ids=None, time_limit=None):
+    """
+    Propose technicians for the unassigned, non-cancelled appointments on
+    ``day``. Returns a dict with ``assignments`` (appointment/technician
+    pairs with the added travel), per-technician ``routes``, the
+    ``unassigned`` jobs with a reason, and ``missing_locations``.
+    """
+    started = monotonic()
+    if time_limit is None:
+        time_limit = getattr(settings, 'DISPATCH_TIME_LIMIT', 5)
+    speed = getattr(settings, 'DISPATCH_AVERAGE_SPEED_KMH', 50)
+    road_factor = getattr(settings, 'DISPATCH_ROAD_FACTOR', 1.3)
+
+    jobs = list(
+        Appointment.objects
+        .filter(appointment_date=day, technician__isnull=True)
+        .exclude(status='cancelled')
+        .values_list('id', 'start_time', 'end_time', 'priority', 'required_skills',
+                     'customer__latitude', 'customer__longitude')
+    )
+    technicians = Technician.objects.filter(is_available=True)
+    if technician_ids is not None:
+        technicians = technicians.filter(id__in=technician_ids)
+    technicians = list(technicians.values_list(
+        'id', 'user__first_name', 'user__last_name', 'skills', 'home_latitude', 'home_longitude'
+    ))
+    # Yesterday's overnight jobs can still block this morning
+    booked = list(
+        Appointment.objects
+        .filter(appointment_date__range=(day - timedelta(days=1), day),
+                technician_id__in=[technician[0] for technician in technicians])
+        .exclude(status='cancelled')
+        .values_list('id', 'technician_id', 'appointment_date', 'start_time', 'end_time',
+                     'customer__latitude', 'customer__longitude')
+    )
+
+    # Points: one per job, booked appointment and technician home, plus a
+    # final "unknown location" point that is zero minutes from everywhere.
+    latitudes, longitudes = [], []
+
+    def point(latitude, longitude):
+        if latitude is None or longitude is None:
+            return None
+        latitudes.append(latitude)
+        longitudes.append(longitude)
+        return len(latitudes) - 1
+
+    job_stops = []
+    missing_locations = []
+    for appointment_id, start_time, end_time, _, _, latitude, longitude in jobs:
+        job_point = point(latitude, longitude)
+        if job_point is None:
+            missing_locations.append(appointment_id)
+        job_stops.append((job_point, *appointment_interval(day, start_time, end_time)))
+    booked_stops = [
+        (appointment_id, technician_id, point(latitude, longitude),
+         *appointment_interval(date, start_time, end_time))
+        for appointment_id, technician_id, date, start_time, end_time, latitude, longitude in booked
+    ]
+    homes = [point(technician[4], technician[5]) for technician in technicians]
+
+    unknown = len(latitudes)
+    kilometres = np.zeros((unknown + 1, unknown + 1))
+    if unknown:
+        kilometres[:unknown, :unknown] = distance_matrix(latitudes, longitudes) * road_factor
+    minutes = (kilometres / speed * 60).tolist()
+    kilometres = kilometres.tolist()
+
+    def resolve(p):
+        return unknown if p is None else p
+
+    day_start = day.toordinal() * MINUTES_PER_DAY
+    templates = working_hours_by_technician()
+    routes = {}
+    for (technician_id, first_name, last_name, skills, _, _), home in zip(technicians, homes):
+        template = templates.get(technician_id, templates[None])
+        # Tomorrow's windows too, so overnight jobs can fit
+        windows = list(working_windows(template, day_start, day_start + 2 * MINUTES_PER_DAY))
+        routes[technician_id] = Route(
+            technician_id, f"{first_name} {last_name}".strip(), set(skills or ()), resolve(home), windows
+        )
+    for appointment_id, technician_id, booked_point, start, end in booked_stops:
+        if end > day_start:
+            routes[technician_id].stops.append(Stop(appointment_id, start, end, resolve(booked_point)))
+    for route in routes.values():
+        route.stops.sort(key=lambda stop: stop.start)
+
+    stops = [
+        Stop(jobs[job][0], start, end, resolve(job_point), job)
+        for job, (job_point, start, end) in enumerate(job_stops)
+    ]
+    eligible = [
+        [route for route in routes.values() if set(required or ()) <= route.skills]
+        for _, _, _, _, required, _, _ in jobs
+    ]
+    order = sorted(
+        range(len(jobs)),
+        key=lambda job: (PRIORITY_RANK.get(jobs[job][3], len(PRIORITY_RANK)), len(eligible[job]), stops[job].start),
+    )
+
+    placed = {}  # job index -> Route
+    for job in order:
+        best = _best_insertion(stops[job], eligible[job], minutes)
+        if best is not None:
+            _, route, position = best
+            route.stops.insert(position, stops[job])
+            placed[job] = route
+
+    # Relocation: move a job to another technician while that saves travel
+    improved = True
+    while improved and monotonic() - started < time_limit:
+        improved = False
+        for job in list(placed):
+            route = placed[job]
+            position = route.stops.index(stops[job])
+            saving = route.removal_saving(position, minutes)
+            candidates = [other for other in eligible[job] if other is not route]
+            best = _best_insertion(stops[job], candidates, minutes)
+            if best is not None and best[0] < saving - 1e-9:
+                _, target, target_position = best
+                route.stops.pop(position)
+                target.stops.insert(target_position, stops[job])
+                placed[job] = target
+                improved = True
+
+    assignments = []
+    route_summaries = []
+    for route in routes.values():
+        previous = route.home
+        visits = []
+        travel_minutes = travel_km = 0.0
+        for stop in route.stops:
+            leg_minutes, leg_km = minutes[previous][stop.point], kilometres[previous][stop.point]
+            previous = stop.point
+            if stop.start < day_start:
+                # Yesterday's overnight job, only there to block the morning
+                continue
+            travel_minutes += leg_minutes
+            travel_km += leg_km
+            visits.append({
+                'appointment_id': stop.appointment_id,
+                'start': from_minutes(stop.start),
+                'end': from_minutes(stop.end),
+                'travel_minutes': round(leg_minutes, 1),
+                'proposed': stop.job is not None,
+            })
+            if stop.job is not None:
+                assignments.append({
+                    'appointment_id': stop.appointment_id,
+                    'technician_id': route.technician_id,
+                    'order': len(visits),
+                    'travel_minutes': round(leg_minutes, 1),
+                    'travel_km': round(leg_km, 2),
+                })
+        if any(visit['proposed'] for visit in visits):
+            route_summaries.append({
+                'technician_id': route.technician_id,
+                'technician_name': route.name,
+                'travel_minutes': round(travel_minutes, 1),
+                'travel_km': round(travel_km, 2),
+                'visits': visits,
+            })
+    unassigned = [
+        {'appointment_id': jobs[job][0],
+         'reason': 'no_feasible_slot' if eligible[job] else 'no_qualified_technician'}
+        for job in order if job not in placed
+    ]
+    return {
+        'date': day,
+        'assignments': sorted(assignments, key=lambda item: (item['technician_id'], item['order'])),
+        'routes': route_summaries,
+        'unassigned': unassigned,
+        'missing_locations': missing_locations,
+        'total_travel_minutes': round(sum(route['travel_minutes'] for route in route_summaries), 1),
+        'total_travel_km': round(sum(route['travel_km'] for route in route_summaries), 2),
+    }
+
+
+def _best_insertion(stop, routes, travel):
+    best = None
+    for route in routes:
+        found = route.insertion(stop, travel)
+        if found is not None and (best is None or found[0] < best[0]):
+            best = (found[0], route, found[1])
+    return best
+
+
+def apply_assignments(assignments):
+    """
+    Assign technicians to appointments from ``(appointment_id,
+    technician_id)`` pairs with a single UPDATE. Raises ``ValueError`` for
+    unknown or already assigned appointments and ``BookingConflict`` if an
+    assignment would double-book a technician. The UPDATE only matches rows
+    that are still unassigned, so an assignment made since the check, by
+    another apply or by hand, is refused instead of overwritten.
+    """
+    assignments = dict(assignments)
+    with transaction.atomic():
+        appointments = Appointment.objects.select_for_update().in_bulk(assignments.keys())
+        missing = sorted(set(assignments) - set(appointments))
+        if missing:
+            raise ValueError(f"Unknown appointments: {missing}")
+        taken = sorted(pk for pk, appointment in appointments.items() if appointment.technician_id is not None)
+        if taken:
+            raise ValueError(f"Appointments already assigned: {taken}")
+        unknown = set(assignments.values()) - set(
+            Technician.objects.filter(id__in=set(assignments.values())).values_list('id', flat=True)
+        )
+        if unknown:
+            raise ValueError(f"Unknown technicians: {sorted(unknown)}")
+
+        now = timezone.now()
+        appointments = list(appointments.values())
+        for appointment in appointments:
+            appointment.technician_id = assignments[appointment.pk]
+            appointment.updated_at = now
+        with booking(appointments):
+            updated = Appointment.objects.filter(pk__in=assignments, technician__isnull=True).update(
+                technician_id=Case(
+                    *(When(pk=pk, then=Value(technician_id)) for pk, technician_id in assignments.items()),
+                    output_field=models.BigIntegerField(),
+                ),
+                updated_at=now,
+            )
+            if updated != len(assignments):
+                # Rows this UPDATE matched carry ``now``; the rest were assigned since the check
+                taken = sorted(Appointment.objects.filter(pk__in=assignments, technician__isnull=False)
+                               .exclude(updated_at=now).values_list('pk', flat=True))
+                raise ValueError(f"Appointments already assigned: {taken}")
+            appointments_bulk_updated.send(sender=Appointment, appointments=appointments)
+    return appointments
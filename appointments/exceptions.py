@@ -0,0 +1,71 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+from rest_framework.views import exception_handler as drf_exception_handler
+
+
+class BookingConflict(Exception):
+    """Raised when saving an appointment would double-book its technician."""
+
+    def __init__(self, appointment, competing):
+        self.appointment = appointment
+        self.competing = competing
+        super().__init__(f"Technician {appointment.technician_id} is already booked at that time")
+
+    def as_dict(self):
+        competing = None
+        if self.competing is not None:
+            competing = {
+                'id': self.competing.id,
+                'technician_id': self.competing.technician_id,
+                'customer_id': self.competing.customer_id,
+                'appointment_date': self.competing.appointment_date.isoformat(),
+                'start_time': self.competing.start_time.isoformat(),
+                'end_time': self.competing.end_time.isoformat(),
+                'status': self.competing.status,
+                'description': self.competing.description,
+            }
+        return {
+            'detail': 'The technician is already booked for this time.',
+            'code': 'booking_conflict',
+            'technician_id': self.appointment.technician_id,
+            'competing_appointment': competing,
+        }
+
+
+class PreconditionFailed(APIException):
+    """An ``If-Match``/``If-Unmodified-Since`` precondition did not hold: someone else changed the object."""
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The resource has changed since it was fetched.'
+    default_code = 'precondition_failed'
+
+
+class SyncTokenExpired(APIException):
+    """The sync token predates the retained tombstones; the client must sync from scratch."""
+    status_code = status.HTTP_410_GONE
+    default_detail = 'The sync token has expired. Sync again without since.'
+    default_code = 'sync_token_expired'
+
+
+class UploadOffsetMismatch(Exception):
+    """Raised when an upload chunk is sent for an offset other than the one the server has received up to."""
+
+    def __init__(self, offset):
+        self.offset = offset
+        super().__init__(f"Expected the chunk at offset {offset}")
+
+    def as_dict(self):
+        return {
+            'detail': 'The upload offset does not match.',
+            'code': 'upload_offset_mismatch',
+            'offset': self.offset,
+        }
+
+
+def exception_handler(exc, context):
+    """DRF exception handler that also turns BookingConflict and UploadOffsetMismatch into 409 responses."""
+    if isinstance(exc, BookingConflict):
+        return Response(exc.as_dict(), status=status.HTTP_409_CONFLICT)
+    if isinstance(exc, UploadOffsetMismatch):
+        return Response(exc.as_dict(), status=status.HTTP_409_CONFLICT, headers={'Upload-Offset': str(exc.offset)})
+    return drf_exception_handler(exc, context)
@@ -0,0 +1,261 @@
+"""
+Streaming CSV and NDJSON exports of bills, line items and appointments.
+
+``stream(name, output, ...)`` returns the content type and an iterator of
+byte chunks for ``StreamingHttpResponse`` or a file. Rows are read with
+``values()`` and ``iterator(chunk_size=EXPORT_CHUNK_SIZE)`` (a server-side
+cursor on PostgreSQL) and written out in chunks of about 64 KB, so memory
+stays flat however many rows match. Related names and bill columns come
+from joins; a line's ``amount`` is computed in SQL and its ``tax`` from its
+bill's stored totals, so no query runs per row.
+
+Filters: ``start``/``end`` (inclusive dates: the bill's creation date for
+bills and line items, the appointment date for appointments), ``statuses``
+(the bill's status for line items), and ``technician`` (the appointment's
+technician for bills, the line's technician for line items, as in the
+technician reports).
+"""
+import csv
+import io
+from datetime import datetime
+from decimal import Decimal
+
+import orjson
+from django.conf import settings
+from django.utils import timezone
+
+from .models import CENTS, Appointment, Bill, BillLineItem, line_amount
+
+# Cells starting with these are formulas to spreadsheet software
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+FLUSH_SIZE = 64 * 1024
+
+
+def _name(first, last):
+    return f"{first or ''} {last or ''}".strip()
+
+
+def _line_tax(row):
+    """The line's share of its bill's tax, at the rate the bill's stored tax was computed with."""
+    if not row['is_taxable'] or not row['bill__taxable_subtotal']:
+        return Decimal('0.00')
+    return (row['amount'] * row['bill__tax'] / row['bill__taxable_subtotal']).quantize(CENTS)
+
+
+class Export:
+    """
+    One exportable resource: the ``values()`` it reads, the ``columns`` it
+    writes (a header and either a key of the values or a function of the
+    row), its ordering and the lookups its filters use.
+    """
+
+    def __init__(self, model, values, columns, ordering, date_lookup, status_lookup, technician_lookup,
+                 annotations=None):
+        self.model = model
+        self.values = values
+        self.columns = columns
+        self.ordering = ordering
+        self.date_lookup = date_lookup
+        self.status_lookup = status_lookup
+        self.technician_lookup = technician_lookup
+        self.annotations = annotations or {}
+
+    @property
+    def headers(self):
+        return [header for header, _ in self.columns]
+
+    def queryset(self, start=None, end=None, statuses=None, technician=None):
+        queryset = self.model._default_manager.annotate(**self.annotations)
+        if start is not None:
+            queryset = queryset.filter(**{f'{self.date_lookup}__gte': start})
+        if end is not None:
+            queryset = queryset.filter(**{f'{self.date_lookup}__lte': end})
+        if statuses:
+            queryset = queryset.filter(**{f'{self.status_lookup}__in': statuses})
+        if technician is not None:
+            queryset = queryset.filter(**{self.technician_lookup: technician})
+        return queryset.order_by(*self.ordering).values(*self.values)
+
+    def rows(self, **filters):
+        """Yield the values of every matching row, in column order."""
+        columns = [source if callable(source) else _getter(source) for _, source in self.columns]
+        for row in self.queryset(**filters).iterator(chunk_size=chunk_size()):
+            yield [plain(column(row)) for column in columns]
+
+
+def _getter(key):
+    return lambda row: row[key]
+
+
+EXPORTS = {
+    'bills': Export(
+        Bill,
+        values=(
+            'id', 'type', 'status', 'created_at', 'due_date', 'customer_id', 'customer__first_name',
+            'customer__last_name', 'appointment_id', 'appointment__technician_id',
+            'appointment__technician__user__first_name', 'appointment__technician__user__last_name',
+            'employee_name', 'description', 'subtotal', 'taxable_subtotal', 'tax', 'total',
+        ),
+        columns=[
+            ('id', 'id'),
+            ('type', 'type'),
+            ('status', 'status'),
+            ('created_at', 'created_at'),
+            ('due_date', 'due_date'),
+            ('customer_id', 'customer_id'),
+            ('customer_name', lambda row: _name(row['customer__first_name'], row['customer__last_name'])),
+            ('appointment_id', 'appointment_id'),
+            ('technician_id', 'appointment__technician_id'),
+            ('technician_name', lambda row: _name(row['appointment__technician__user__first_name'],
+                                                  row['appointment__technician__user__last_name'])),
+            ('employee_name', 'employee_name'),
+            ('description', 'description'),
+            ('subtotal', 'subtotal'),
+            ('taxable_subtotal', 'taxable_subtotal'),
+            ('tax', 'tax'),
+            ('total', 'total'),
+        ],
+        ordering=('created_at', 'id'),
+        date_lookup='created_at__date',
+        status_lookup='status',
+        technician_lookup='appointment__technician',
+    ),
+    'line_items': Export(
+        BillLineItem,
+        values=(
+            'id', 'bill_id', 'bill__type', 'bill__status', 'bill__created_at', 'bill__customer_id',
+            'technician_id', 'technician__user__first_name', 'technician__user__last_name', 'description',
+            'part_number', 'employee_number', 'quantity', 'unit_price', 'amount', 'is_labor', 'is_taxable',
+            'bill__tax', 'bill__taxable_subtotal',
+        ),
+        columns=[
+            ('id', 'id'),
+            ('bill_id', 'bill_id'),
+            ('bill_type', 'bill__type'),
+            ('bill_status', 'bill__status'),
+            ('bill_created_at', 'bill__created_at'),
+            ('customer_id', 'bill__customer_id'),
+            ('technician_id', 'technician_id'),
+            ('technician_name', lambda row: _name(row['technician__user__first_name'],
+                                                  row['technician__user__last_name'])),
+            ('description', 'description'),
+            ('part_number', 'part_number'),
+            ('employee_number', 'employee_number'),
+            ('quantity', 'quantity'),
+            ('unit_price', 'unit_price'),
+            ('amount', lambda row: row['amount'].quantize(CENTS)),
+            ('is_labor', 'is_labor'),
+            ('is_taxable', 'is_taxable'),
+            ('tax', _line_tax),
+        ],
+        ordering=('bill__created_at', 'bill_id', 'id'),
+        date_lookup='bill__created_at__date',
+        status_lookup='bill__status',
+        technician_lookup='technician',
+        annotations={'amount': line_amount()},
+    ),
+    'appointments': Export(
+        Appointment,
+        values=(
+            'id', 'appointment_date', 'start_time', 'end_time', 'status', 'priority', 'customer_id',
+            'customer__first_name', 'customer__last_name', 'technician_id', 'technician__user__first_name',
+            'technician__user__last_name', 'description', 'required_skills', 'notes',
+        ),
+        columns=[
+            ('id', 'id'),
+            ('appointment_date', 'appointment_date'),
+            ('start_time', 'start_time'),
+            ('end_time', 'end_time'),
+            ('status', 'status'),
+            ('priority', 'priority'),
+            ('customer_id', 'customer_id'),
+            ('customer_name', lambda row: _name(row['customer__first_name'], row['customer__last_name'])),
+            ('technician_id', 'technician_id'),
+            ('technician_name', lambda row: _name(row['technician__user__first_name'],
+                                                  row['technician__user__last_name'])),
+            ('description', 'description'),
+            ('required_skills', 'required_skills'),
+            ('notes', 'notes'),
+        ],
+        ordering=('appointment_date', 'start_time', 'id'),
+        date_lookup='appointment_date',
+        status_lookup='status',
+        technician_lookup='technician',
+    ),
+}
+
+
+def plain(value):
+    """Decimals as exact strings and dates and times in ISO 8601, local time, as the API writes them."""
+    if isinstance(value, Decimal):
+        return '{:f}'.format(value)
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value)
+        value = value.isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def csv_cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, list):
+        value = '; '.join(str(item) for item in value)
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        # Keep spreadsheets from running user-entered text as a formula
+        return "'" + value
+    return value
+
+
+def write_csv(headers, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    for row in rows:
+        writer.writerow([csv_cell(value) for value in row])
+        if buffer.tell() >= FLUSH_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def write_ndjson(headers, rows):
+    chunk = []
+    size = 0
+    for row in rows:
+        line = orjson.dumps(dict(zip(headers, row))) + b'\n'
+        chunk.append(line)
+        size += len(line)
+        if size >= FLUSH_SIZE:
+            yield b''.join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield b''.join(chunk)
+
+
+# output: (content type, file extension, writer)
+OUTPUTS = {
+    'csv': ('text/csv; charset=utf-8', 'csv', write_csv),
+    'ndjson': ('application/x-ndjson', 'ndjson', write_ndjson),
+}
+
+
+def stream(name, output, rows=None, **filters):
+    """
+    Return ``(content_type, chunks)`` for export ``name`` in ``output``
+    (``csv`` or ``ndjson``). ``rows`` replaces the export's rows, e.g. to
+    count them as they are written.
+    """
+    export = EXPORTS[name]
+    content_type, _, writer = OUTPUTS[output]
+    return content_type, writer(export.headers, rows if rows is not None else export.rows(**filters))
+
+
+def chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
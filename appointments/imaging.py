@@ -0,0 +1,34 @@
+"""
+Pillow resizing for photo derivatives.
+
+Kept free of Django imports so it can run in a spawned worker process
+without setting Django up there.
+"""
+import io
+
+from PIL import Image, ImageOps
+
+
+def render(data, sizes, image_format='WEBP', quality=80):
+    """
+    Return ``{name: bytes}`` with one re-encoded copy of the image in ``data``
+    per ``(name, longest_edge)`` in ``sizes``. The EXIF orientation is applied
+    to the pixels and the EXIF block itself is dropped. Images smaller than a
+    size are re-encoded but not enlarged.
+    """
+    largest = max(edge for _, edge in sizes)
+    with Image.open(io.BytesIO(data)) as source:
+        # Let the JPEG decoder downscale by a power of two while reading
+        source.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(source)
+    if image.mode not in ('RGB', 'L') and not (image_format == 'WEBP' and image.mode == 'RGBA'):
+        image = image.convert('RGBA' if image_format == 'WEBP' and image.has_transparency_data else 'RGB')
+
+    images = {}
+    for name, edge in sizes:
+        resized = image.copy()
+        resized.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        resized.save(output, image_format, quality=quality)
+        images[name] = output.getvalue()
+    return images
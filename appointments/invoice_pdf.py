@@ -0,0 +1,197 @@
+"""
+Invoice PDFs, written directly in PDF syntax.
+
+Nothing here touches Django or the database, so ``render`` can run in
+worker processes (see ``appointments.invoices``). Text is set in the
+standard Helvetica fonts, which every PDF reader provides, so no font is
+embedded and a one-page invoice is a few kilobytes. The output depends only
+on the input, which keeps cached copies byte-for-byte stable.
+"""
+import zlib
+
+PAGE_WIDTH, PAGE_HEIGHT = 595.28, 841.89  # A4, in points
+MARGIN = 40
+LINE_HEIGHT = 14
+REGULAR, BOLD = 'F1', 'F2'
+
+# Advance widths of WinAnsi characters 32-126, in 1/1000 em, from the Helvetica AFM files
+_WIDTHS = {
+    REGULAR: [
+        278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+        556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+        1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+        667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+        333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+        556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+    ],
+    BOLD: [
+        278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+        556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+        975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+        667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+        333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+        611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+    ],
+}
+_FONTS = {REGULAR: 'Helvetica', BOLD: 'Helvetica-Bold'}
+
+# Table columns: (heading, x of the left edge, width, right-aligned)
+COLUMNS = [
+    ('Description', MARGIN, 215, False),
+    ('Part/Employee #', MARGIN + 220, 100, False),
+    ('Qty', MARGIN + 325, 45, True),
+    ('Unit Price', MARGIN + 375, 65, True),
+    ('Total', MARGIN + 445, 70, True),
+]
+
+
+def text_width(text, size, font=REGULAR):
+    widths = _WIDTHS[font]
+    return sum(widths[ord(c) - 32] if 32 <= ord(c) < 127 else 556 for c in text) * size / 1000
+
+
+def wrap(text, width, size, font=REGULAR):
+    """Split ``text`` into lines no wider than ``width``, breaking at spaces where possible."""
+    lines = []
+    for paragraph in (text or '').splitlines() or ['']:
+        line = ''
+        for word in paragraph.split(' '):
+            candidate = f'{line} {word}' if line else word
+            if text_width(candidate, size, font) <= width:
+                line = candidate
+                continue
+            if line:
+                lines.append(line)
+            # Words longer than the column are cut
+            while text_width(word, size, font) > width:
+                cut = len(word) - 1
+                while cut > 1 and text_width(word[:cut], size, font) > width:
+                    cut -= 1
+                lines.append(word[:cut])
+                word = word[cut:]
+            line = word
+        lines.append(line)
+    return lines
+
+
+def _escape(text):
+    encoded = text.encode('cp1252', errors='replace')
+    return encoded.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+class _Layout:
+    """Places text top-down on A4 pages, starting a new page when one is full."""
+
+    def __init__(self):
+        self.pages = []
+        self.new_page()
+
+    def new_page(self):
+        self.ops = []
+        self.pages.append(self.ops)
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def ensure(self, height):
+        """Start a new page unless ``height`` more points fit; return True if it did."""
+        if self.y - height < MARGIN:
+            self.new_page()
+            return True
+        return False
+
+    def text(self, x, text, size=10, font=REGULAR, right=None):
+        if right is not None:
+            x = right - text_width(text, size, font)
+        self.ops.append(b'BT /%s %g Tf %.2f %.2f Td (%s) Tj ET' % (
+            font.encode(), size, x, self.y, _escape(text)
+        ))
+
+    def rule(self, x1, x2, offset=4):
+        y = self.y - offset
+        self.ops.append(b'%.2f %.2f m %.2f %.2f l S' % (x1, y, x2, y))
+
+
+def render(invoice):
+    """
+    Return the PDF bytes for ``invoice``, a dict of display strings built by
+    ``appointments.invoices.invoice_data``.
+    """
+    layout = _Layout()
+    layout.y -= 20
+    layout.text(MARGIN, invoice['title'], size=20, font=BOLD)
+    layout.y -= 2 * LINE_HEIGHT
+
+    for label, value in invoice['fields']:
+        for line in wrap(f'{label}: {value}', PAGE_WIDTH - 2 * MARGIN, 11):
+            layout.ensure(LINE_HEIGHT)
+            layout.text(MARGIN, line, size=11)
+            layout.y -= LINE_HEIGHT
+    layout.y -= LINE_HEIGHT
+
+    def heading():
+        for title, x, width, right in COLUMNS:
+            layout.text(x, title, font=BOLD, right=x + width if right else None)
+        layout.rule(MARGIN, PAGE_WIDTH - MARGIN)
+        layout.y -= LINE_HEIGHT + 4
+
+    layout.ensure(2 * LINE_HEIGHT)
+    heading()
+    for row in invoice['items']:
+        cells = [wrap(value, width, 10) for value, (_, _, width, _) in zip(row, COLUMNS)]
+        height = max(len(lines) for lines in cells) * LINE_HEIGHT
+        if layout.ensure(height):
+            heading()
+        top = layout.y
+        for lines, (_, x, width, right) in zip(cells, COLUMNS):
+            layout.y = top
+            for line in lines:
+                layout.text(x, line, right=x + width if right else None)
+                layout.y -= LINE_HEIGHT
+        layout.y = top - height
+
+    layout.ensure(len(invoice['totals']) * LINE_HEIGHT + 8)
+    layout.rule(COLUMNS[3][1], PAGE_WIDTH - MARGIN, offset=-LINE_HEIGHT + 4)
+    layout.y -= 4
+    right = PAGE_WIDTH - MARGIN
+    for number, (label, value) in enumerate(invoice['totals']):
+        font = BOLD if number == len(invoice['totals']) - 1 else REGULAR
+        layout.text(COLUMNS[3][1], label, font=font)
+        layout.text(0, value, font=font, right=right)
+        layout.y -= LINE_HEIGHT
+    return _document(layout.pages)
+
+
+def render_many(invoices):
+    """``render`` for a list, so a process pool gets work in chunks."""
+    return [render(invoice) for invoice in invoices]
+
+
+def _document(pages):
+    fonts = list(_FONTS)
+    first_page = 3 + len(fonts)
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+            b' '.join(b'%d 0 R' % (first_page + 2 * n) for n in range(len(pages))), len(pages)
+        ),
+    ]
+    for font in fonts:
+        objects.append(
+            b'<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>' % _FONTS[font].encode()
+        )
+    resources = b' '.join(b'/%s %d 0 R' % (font.encode(), 3 + n) for n, font in enumerate(fonts))
+    for number, ops in enumerate(pages):
+        content = zlib.compress(b'0.5 w\n' + b'\n'.join(ops))
+        objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] /Resources << /Font << %s >> >> '
+                       b'/Contents %d 0 R >>' % (PAGE_WIDTH, PAGE_HEIGHT, resources, first_page + 2 * number + 1))
+        objects.append(b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(content), content))
+
+    output = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref = len(output)
+    output += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    output += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    output += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(output)
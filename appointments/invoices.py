@@ -0,0 +1,215 @@
+"""
+Server-side invoice PDFs, cached on disk.
+
+Each bill's PDF is stored under a key derived from everything it shows: the
+bill's ``updated_at`` and stored tax rate, its line items, and the updated
+customer and appointment. A bill whose key has a file is never rendered
+again, and editing any of those moves the key, so a stale PDF is never
+served. Rendering (``invoice_pdf.render``) needs no database, so batches
+are rendered in a process pool in chunks while this process only runs
+the queries and writes files.
+
+Settings: ``INVOICE_CACHE_DIR`` (default ``<BASE_DIR>/invoice_cache``),
+``INVOICE_WORKERS`` (default: CPU count) and ``INVOICE_BATCH_LIMIT``, the
+most bills one request may ask for (default 1000).
+"""
+import hashlib
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from . import invoice_pdf
+from .models import Bill
+
+# Bump when the layout changes, so files rendered with the old one are not served
+LAYOUT_VERSION = 1
+CHUNK_SIZE = 50
+
+_lock = threading.Lock()
+_pool = None
+
+
+def cache_dir():
+    return getattr(settings, 'INVOICE_CACHE_DIR', None) or os.path.join(settings.BASE_DIR, 'invoice_cache')
+
+
+def workers():
+    return getattr(settings, 'INVOICE_WORKERS', None) or os.cpu_count() or 1
+
+
+def batch_limit():
+    return getattr(settings, 'INVOICE_BATCH_LIMIT', 1000)
+
+
+def process_pool(max_workers=None):
+    """A new pool for ``invoice_pdf.render_many``; spawned like the photo pool, since the server is threaded."""
+    return ProcessPoolExecutor(max_workers=max_workers or workers(), mp_context=multiprocessing.get_context('spawn'))
+
+
+def shared_pool():
+    """The process pool batch requests share, started on first use."""
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = process_pool()
+    return _pool
+
+
+def content_version(bill_id, updated_at, customer_updated_at, appointment_updated_at,
+                    item_count, items_updated_at, tax_rate):
+    parts = [LAYOUT_VERSION, bill_id, updated_at, customer_updated_at, appointment_updated_at,
+             item_count, items_updated_at, tax_rate]
+    return hashlib.sha256('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def cache_path(bill_id, version):
+    return os.path.join(cache_dir(), str(bill_id), f'{version}.pdf')
+
+
+def versions(queryset):
+    """Return ``{bill id: content version}`` for ``queryset`` in one query, without loading the bills."""
+    rows = queryset.order_by().prefetch_related(None).annotate(
+        item_count=Count('line_items'), items_updated_at=Max('line_items__updated_at'),
+    ).values_list(
+        'pk', 'updated_at', 'customer__updated_at', 'appointment__updated_at', 'item_count', 'items_updated_at',
+        'tax_rate',
+    )
+    return {row[0]: content_version(*row) for row in rows}
+
+
+def version_of(bill):
+    """``content_version`` of a bill loaded by ``_load``."""
+    items = bill.line_items.all()
+    return content_version(
+        bill.pk,
+        bill.updated_at,
+        bill.customer.updated_at if bill.customer else None,
+        bill.appointment.updated_at if bill.appointment else None,
+        len(items),
+        max((item.updated_at for item in items), default=None),
+        bill.tax_rate,
+    )
+
+
+def _money(value):
+    return f'${value:.2f}'
+
+
+def _number(value):
+    return f'{value.normalize():f}'
+
+
+def invoice_data(bill):
+    """The display strings ``invoice_pdf.render`` lays out, mirroring the bill page's PDF."""
+    customer = bill.customer
+    appointment = bill.appointment
+    return {
+        'title': f'{bill.get_type_display()} #{bill.pk}',
+        'fields': [
+            ('Status', bill.get_status_display()),
+            ('Date', timezone.localtime(bill.created_at).date().isoformat()),
+            ('Customer', f'{customer.first_name} {customer.last_name}' if customer else ''),
+            ('Appointment', f'#{appointment.pk} - {appointment.description}' if appointment else ''),
+            ('Description', bill.description),
+            ('Notes', bill.notes),
+            ('Due Date', bill.due_date.isoformat() if bill.due_date else ''),
+            ('Employee Name', bill.employee_name),
+        ],
+        'items': [
+            (
+                item.description,
+                item.employee_number if item.is_labor else item.part_number,
+                _number(item.quantity),
+                _money(item.unit_price),
+                _money(item.amount),
+            )
+            for item in sorted(bill.line_items.all(), key=lambda item: item.pk)
+        ],
+        'totals': [
+            ('Subtotal', _money(bill.subtotal)),
+            # The rate the stored tax was computed at, which may predate the current Settings
+            (f'Tax ({_number(bill.tax_rate * 100)}%)', _money(bill.tax)),
+            ('Total', _money(bill.total)),
+        ],
+    }
+
+
+def _load(bill_ids):
+    return Bill.objects.filter(pk__in=bill_ids).select_related('customer', 'appointment').prefetch_related('line_items')
+
+
+def _write(bill_id, version, data):
+    """Store a rendered PDF atomically and drop the bill's older versions."""
+    path = cache_path(bill_id, version)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=directory, suffix='.tmp', delete=False) as output:
+        output.write(data)
+    os.replace(output.name, path)
+    for name in os.listdir(directory):
+        if name != os.path.basename(path) and name.endswith('.pdf'):
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+    return path
+
+
+def pdf_path(bill):
+    """Return the cached PDF of one bill, rendering it in this process if needed."""
+    bill = _load([bill.pk]).get()
+    version = version_of(bill)
+    path = cache_path(bill.pk, version)
+    if not os.path.exists(path):
+        path = _write(bill.pk, version, invoice_pdf.render(invoice_data(bill)))
+    return path
+
+
+def render_bills(queryset, pool=None, chunk_size=CHUNK_SIZE):
+    """
+    Make sure every bill in ``queryset`` has a cached PDF. Return ``(paths,
+    rendered)``: ``{bill id: path}`` and how many had to be rendered. Bills
+    are rendered ``chunk_size`` at a time in ``pool`` (default: the shared
+    pool); without a pool, a single chunk is rendered in this process.
+    """
+    paths = {}
+    missing = []
+    for bill_id, version in versions(queryset).items():
+        path = cache_path(bill_id, version)
+        if os.path.exists(path):
+            paths[bill_id] = path
+        else:
+            missing.append(bill_id)
+    if not missing:
+        return paths, 0
+
+    if pool is None and len(missing) <= chunk_size:
+        # Not worth a round trip to the pool
+        for bill in _load(missing):
+            version = version_of(bill)
+            paths[bill.pk] = _write(bill.pk, version, invoice_pdf.render(invoice_data(bill)))
+        return paths, len(missing)
+
+    pool = pool or shared_pool()
+    futures = {}
+    for start in range(0, len(missing), chunk_size):
+        # Versions come from the loaded rows, so a bill edited meanwhile is stored under its new one
+        bills = list(_load(missing[start:start + chunk_size]))
+        keys = [(bill.pk, version_of(bill)) for bill in bills]
+        futures[pool.submit(invoice_pdf.render_many, [invoice_data(bill) for bill in bills])] = keys
+    for future in as_completed(futures):
+        for (bill_id, version), data in zip(futures[future], future.result()):
+            paths[bill_id] = _write(bill_id, version, data)
+    return paths, len(missing)
+
+
+def forget(bill_id):
+    """Delete the cached PDFs of a deleted bill."""
+    shutil.rmtree(os.path.join(cache_dir(), str(bill_id)), ignore_errors=True)
@@ -0,0 +1,102 @@
+from collections import defaultdict
+
+from rest_framework import serializers
+
+from .models import Photo
+
+
+class PhotoLoader:
+    """
+    Request-scoped batch loader for the generic ``Photo`` relation.
+
+    Serializers register the (content_type, object_id) pairs they are about
+    to render, and the first lookup for a content type fetches photos for
+    every registered id of that type in a single query.
+    """
+
+    def __init__(self):
+        self._pending = defaultdict(set)
+        self._photos = {}
+
+    def add(self, content_type, object_id):
+        if object_id is not None and (content_type, object_id) not in self._photos:
+            self._pending[content_type].add(object_id)
+
+    def get(self, content_type, object_id):
+        if (content_type, object_id) not in self._photos:
+            self.add(content_type, object_id)
+            self._load(content_type)
+        return self._photos[(content_type, object_id)]
+
+    async def aload(self):
+        """Fetch the photos of every registered owner with the async ORM, so rendering runs no query."""
+        for content_type in list(self._pending):
+            photos = self._start(content_type)
+            if photos is not None:
+                self._store(content_type, [photo async for photo in photos])
+
+    def _load(self, content_type):
+        photos = self._start(content_type)
+        if photos is not None:
+            self._store(content_type, photos)
+
+    def _start(self, content_type):
+        object_ids = self._pending.pop(content_type, set())
+        if not object_ids:
+            return None
+        for object_id in object_ids:
+            self._photos[(content_type, object_id)] = []
+        return (
+            Photo.objects
+            .filter(content_type=content_type, object_id__in=object_ids)
+            .select_related('uploaded_by')
+            .order_by('id')
+        )
+
+    def _store(self, content_type, photos):
+        for photo in photos:
+            self._photos[(content_type, photo.object_id)].append(photo)
+
+    def prime(self, serializer, instance):
+        """Walk ``serializer`` over ``instance`` and register every photo owner."""
+        if instance is None:
+            return
+        if isinstance(serializer, serializers.ListSerializer):
+            for item in instance:
+                self.prime(serializer.child, item)
+            return
+        if not owns_photos(serializer):
+            return
+
+        content_type = getattr(serializer, 'photo_content_type', None)
+        if content_type and 'photos' in serializer.fields:
+            self.add(content_type, instance.pk)
+
+        for field in serializer.fields.values():
+            if field.write_only or not owns_photos(field):
+                continue
+            try:
+                related = field.get_attribute(instance)
+            except (AttributeError, KeyError):
+                continue
+            if related is None:
+                continue
+            if isinstance(field, serializers.ListSerializer):
+                related = related.all() if hasattr(related, 'all') else related
+            self.prime(field, related)
+
+
+def owns_photos(field):
+    """Return True if ``field`` or any serializer nested under it renders photos."""
+    if isinstance(field, serializers.ListSerializer):
+        field = field.child
+    if not isinstance(field, serializers.Serializer):
+        return False
+    if not hasattr(field, '_owns_photos'):
+        if getattr(field, 'photo_content_type', None) and 'photos' in field.fields:
+            field._owns_photos = True
+        else:
+            field._owns_photos = any(
+                owns_photos(child) for child in field.fields.values() if not child.write_only
+            )
+    return field._owns_photos
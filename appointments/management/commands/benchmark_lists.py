@@ -0,0 +1,78 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from appointments import views
+from appointments.renderers import ORJSONRenderer
+from appointments.row_serializers import RowSerializer, UnsupportedField
+
+VIEWSETS = {
+    'appointments': views.AppointmentViewSet,
+    'bills': views.BillViewSet,
+    'customers': views.CustomerViewSet,
+    'technicians': views.TechnicianViewSet,
+}
+
+
+def list_viewset(viewset_class, query):
+    request = RequestFactory().get('/?' + query)
+    viewset = viewset_class(action_map={'get': 'list'})
+    viewset.setup(request)
+    viewset.request = viewset.initialize_request(request)
+    viewset.format_kwarg = None
+    viewset.action = 'list'
+    return viewset
+
+
+def render_instances(viewset, queryset):
+    """The regular list path: model instances through the serializer, then DRF's JSONRenderer."""
+    return JSONRenderer().render(viewset.get_serializer(list(queryset), many=True).data)
+
+
+def render_rows(viewset, queryset):
+    rows = RowSerializer(viewset.get_serializer())
+    return ORJSONRenderer().render(rows.render(rows.fetch(queryset)))
+
+
+def best_time(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = func()
+        timings.append(time.perf_counter() - started)
+    return min(timings), output
+
+
+class Command(BaseCommand):
+    help = ("Time rendering a large list through the serializer and JSONRenderer against the row serializer and "
+            "ORJSONRenderer, and check both write the same bytes. Run against a database with representative data.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', action='append', choices=sorted(VIEWSETS),
+                            help='List to render; repeatable (default: appointments and bills)')
+        parser.add_argument('--rows', type=int, default=10000,
+                            help='Rows to render (default: 10000)')
+        parser.add_argument('--query', default='',
+                            help='Query string of the list request, e.g. "expand=customer.photos"')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Runs per path; the best is reported (default: 3)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'endpoint':<14}{'rows':>8}{'regular ms':>12}{'rows ms':>10}{'speedup':>9}")
+        for name in options['endpoint'] or ['appointments', 'bills']:
+            viewset = list_viewset(VIEWSETS[name], options['query'])
+            queryset = viewset.filter_queryset(viewset.get_queryset())[:options['rows']]
+            try:
+                fast, expected_fast = best_time(lambda: render_rows(viewset, queryset), options['repeat'])
+            except UnsupportedField as error:
+                raise CommandError(f"{name} cannot use the row serializer: {error}")
+            regular, expected = best_time(lambda: render_instances(viewset, queryset), options['repeat'])
+            if expected_fast != expected:
+                raise CommandError(f"{name}: the two paths rendered different JSON")
+            count = queryset.count()
+            self.stdout.write(
+                f"{name:<14}{count:>8}{regular * 1000:>12.1f}{fast * 1000:>10.1f}{regular / fast:>8.1f}x"
+            )
+        self.stdout.write(self.style.SUCCESS("Done. Both paths rendered the same bytes."))
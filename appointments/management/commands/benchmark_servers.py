@@ -0,0 +1,151 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from wsgiref.util import setup_testing_defaults
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+def slow_queries(seconds):
+    """Add ``seconds`` to every query on every connection, standing in for a loaded or distant database."""
+    def wrapper(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def add(sender, connection, **kwargs):
+        # Threads reuse their connection wrapper across reconnects
+        if wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(wrapper)
+
+    connection_created.connect(add, weak=False)
+    for connection in connections.all():
+        add(None, connection)
+
+
+def call_wsgi(application, path, query, headers):
+    environ = {'PATH_INFO': path, 'QUERY_STRING': query, 'HTTP_HOST': 'localhost'}
+    for name, value in headers:
+        environ['HTTP_' + name.upper().replace('-', '_')] = value
+    setup_testing_defaults(environ)
+    statuses = []
+    result = application(environ, lambda status, response_headers, exc_info=None: statuses.append(status))
+    try:
+        for _ in result:
+            pass
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return int(statuses[0].split()[0])
+
+
+async def call_asgi(application, path, query, headers):
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'localhost')] + [(name.lower().encode(), value.encode()) for name, value in headers],
+        'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+    }
+    messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+    disconnected = asyncio.Event()
+    statuses = []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # The client stays connected until the response is sent
+        await disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            statuses.append(message['status'])
+
+    await application(scope, receive, send)
+    disconnected.set()
+    return statuses[0]
+
+
+async def run_clients(clients, total, request):
+    """Run ``total`` requests from ``clients`` clients, each sending its next request once the last one is answered."""
+    latencies = []
+    errors = 0
+    remaining = total
+
+    async def client():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            status = await request()
+            latencies.append(time.perf_counter() - started)
+            if status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return time.perf_counter() - started, latencies, errors
+
+
+class Command(BaseCommand):
+    help = ("Compare how many concurrent clients one WSGI worker with a thread pool and one ASGI worker serve on "
+            "an endpoint, with simulated database latency. Run against a database with representative data.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='/api/appointments/?page_size=50',
+                            help='Path and query to request (default: /api/appointments/?page_size=50)')
+        parser.add_argument('--clients', default='1,8,32,128',
+                            help='Comma-separated numbers of concurrent clients (default: 1,8,32,128)')
+        parser.add_argument('--requests', type=int, default=256,
+                            help='Requests per run (default: 256)')
+        parser.add_argument('--threads', type=int, default=8,
+                            help='Threads of the WSGI worker, as in gunicorn --threads (default: 8)')
+        parser.add_argument('--latency', type=float, default=20,
+                            help='Milliseconds added to every query (default: 20)')
+        parser.add_argument('--header', action='append', default=[],
+                            help='Request header as "Name: value", e.g. "Authorization: Token <key>"; repeatable')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        try:
+            clients = [int(value) for value in options['clients'].split(',')]
+            headers = [tuple(part.strip() for part in header.split(':', 1)) for header in options['header']]
+        except ValueError:
+            raise CommandError("--clients takes numbers and --header takes 'Name: value'")
+        if any(len(header) != 2 for header in headers):
+            raise CommandError("--header takes 'Name: value'")
+        if options['latency']:
+            slow_queries(options['latency'] / 1000)
+
+        wsgi = get_wsgi_application()
+        asgi = get_asgi_application()
+        pool = ThreadPoolExecutor(max_workers=options['threads'])
+
+        def wsgi_request():
+            return asyncio.get_running_loop().run_in_executor(pool, call_wsgi, wsgi, url.path, url.query, headers)
+
+        def asgi_request():
+            return call_asgi(asgi, url.path, url.query, headers)
+
+        self.stdout.write(f"{'server':<8}{'clients':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+        try:
+            for server, request in (('wsgi', wsgi_request), ('asgi', asgi_request)):
+                for count in clients:
+                    elapsed, latencies, errors = asyncio.run(run_clients(count, options['requests'], request))
+                    latencies.sort()
+                    self.stdout.write(
+                        f"{server:<8}{count:>8}{len(latencies) / elapsed:>10.1f}"
+                        f"{statistics.median(latencies) * 1000:>10.1f}"
+                        f"{latencies[int(len(latencies) * 0.95) - 1] * 1000:>10.1f}{errors:>8}"
+                    )
+        finally:
+            pool.shutdown()
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. The WSGI worker serves at most {options['threads']} requests at once, so its latency grows "
+            f"with clients beyond that; compare where each server's p95 starts to climb."
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from appointments import uploads
+
+
+class Command(BaseCommand):
+    help = "Delete resumable upload sessions that have expired, with their temporary files. Run it from cron."
+
+    def handle(self, *args, **options):
+        removed = uploads.clean_expired()
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} abandoned uploads"))
@@ -0,0 +1,66 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from appointments import blobs
+
+
+def hash_file(name):
+    try:
+        with default_storage.open(name, 'rb') as content:
+            return name, blobs.hash_content(content)
+    except OSError:
+        return name, None
+
+
+class Command(BaseCommand):
+    help = ("Move photos stored before content addressing into the blob store, keeping one file per distinct "
+            "content, and delete blobs nothing references any more.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Number of files hashed at once (default: 4)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report how much space deduplication would reclaim without changing anything')
+        parser.add_argument('--grace-hours', type=float, default=1,
+                            help='Only delete blobs unreferenced for at least this long (default: 1)')
+
+    def handle(self, *args, **options):
+        names = set()
+        for model in blobs.PHOTO_MODELS:
+            legacy = model.objects.exclude(photo='').exclude(photo__startswith=blobs.BLOB_PREFIX)
+            names.update(legacy.values_list('photo', flat=True).distinct())
+
+        # hashlib releases the GIL, so threads hash files in parallel
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            hashed = list(pool.map(hash_file, sorted(names)))
+
+        seen = set()
+        moved = missing = reclaimed = 0
+        for name, result in hashed:
+            if result is None:
+                missing += 1
+                self.stderr.write(f"{name}: cannot be read")
+                continue
+            digest, size = result
+            if options['dry_run']:
+                if digest in seen or blobs.PhotoBlob.objects.filter(digest=digest).exists():
+                    reclaimed += size
+                seen.add(digest)
+                continue
+            rows, written = blobs.adopt(name, digest, size, default_storage)
+            moved += rows
+            if rows:
+                reclaimed += size - written
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f"{len(names) - missing} files would be moved, reclaiming {reclaimed} bytes"
+            ))
+            return
+        reclaimed += blobs.prune(default_storage, timedelta(hours=options['grace_hours']))
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {moved} photos into the blob store and reclaimed {reclaimed} bytes ({missing} unreadable)"
+        ))
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from appointments import exports
+
+
+class Command(BaseCommand):
+    help = ("Stream bills, line items or appointments as CSV or NDJSON to a file or stdout, with the filters of "
+            "the /api/exports/ endpoints. Memory stays flat however many rows are exported.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('export', choices=sorted(exports.EXPORTS), help='What to export')
+        parser.add_argument('--format', choices=sorted(exports.OUTPUTS), default='csv',
+                            help='Output format (default: csv)')
+        parser.add_argument('--start', help='First day to export (YYYY-MM-DD)')
+        parser.add_argument('--end', help='Last day to export (YYYY-MM-DD)')
+        parser.add_argument('--status', action='append',
+                            help='Only rows with this status; repeat for several (default: all)')
+        parser.add_argument('--technician', type=int, help='Only rows of this technician id')
+        parser.add_argument('--output', help='Write to this file (default: stdout)')
+
+    def handle(self, *args, **options):
+        days = {}
+        for name in ('start', 'end'):
+            try:
+                days[name] = parse_date(options[name]) if options[name] else None
+            except ValueError:
+                days[name] = None
+            if options[name] and days[name] is None:
+                raise CommandError(f"--{name} must be a date like 2025-01-31")
+        if days['start'] and days['end'] and days['end'] < days['start']:
+            raise CommandError("--end must not be before --start")
+
+        export = exports.EXPORTS[options['export']]
+        count = 0
+
+        def counted(rows):
+            nonlocal count
+            for row in rows:
+                count += 1
+                yield row
+
+        rows = export.rows(**days, statuses=options['status'], technician=options['technician'])
+        _, chunks = exports.stream(options['export'], options['format'], rows=counted(rows))
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+            self.stdout.write(self.style.SUCCESS(f"Exported {count} rows to {options['output']}"))
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode(), ending='')
+            # stdout holds the export itself
+            self.stderr.write(self.style.SUCCESS(f"Exported {count} rows"))
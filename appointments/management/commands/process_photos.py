@@ -0,0 +1,59 @@
+from concurrent.futures import as_completed
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from appointments import blobs, derivatives, imaging
+
+
+class Command(BaseCommand):
+    help = "Generate the thumbnail and medium copies of uploaded photos, resizing in a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Regenerate every photo, not only those missing derivatives')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of worker processes (default: PHOTO_WORKERS or the CPU count)')
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Number of photos read into memory at a time (default: 50)')
+
+    def handle(self, *args, **options):
+        stored = failed = 0
+        # Rows sharing a blob get its derivatives together, so each blob is rendered once
+        rendered = set()
+        with derivatives.process_pool(options['workers']) as pool:
+            for model in derivatives.DERIVED_MODELS:
+                queryset = model.objects.exclude(photo='').order_by('pk')
+                if not options['all']:
+                    queryset = queryset.filter(Q(thumbnail='') | Q(medium=''))
+                last_pk = 0
+                while True:
+                    batch = list(queryset.filter(pk__gt=last_pk)[:options['batch_size']])
+                    if not batch:
+                        break
+                    last_pk = batch[-1].pk
+
+                    # Read in this process, resize in the pool, store back here
+                    futures = {}
+                    for instance in batch:
+                        if instance.photo.name in rendered:
+                            continue
+                        if blobs.digest_of(instance.photo.name):
+                            rendered.add(instance.photo.name)
+                        try:
+                            data = derivatives.read_source(instance)
+                        except OSError as error:
+                            failed += 1
+                            self.stderr.write(f"{model._meta.label} {instance.pk}: {error}")
+                            continue
+                        futures[pool.submit(imaging.render, *derivatives.render_args(data))] = instance
+                    for future in as_completed(futures):
+                        instance = futures[future]
+                        try:
+                            if derivatives.store(instance, future.result(), replace=options['all']):
+                                stored += 1
+                        except Exception as error:
+                            failed += 1
+                            self.stderr.write(f"{model._meta.label} {instance.pk}: {error}")
+
+        self.stdout.write(self.style.SUCCESS(f"Generated derivatives for {stored} photos ({failed} failed)"))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from appointments import dashboard
+from appointments.models import Bill, Settings
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored subtotal/tax/total columns of every bill from its line items."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of bills updated per transaction (default: 1000)')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        tax_rate = Settings.get_settings().sales_tax_rate
+        updated = 0
+        last_id = 0
+
+        while True:
+            with transaction.atomic():
+                bills = list(
+                    Bill.objects
+                    .filter(id__gt=last_id)
+                    .order_by('id')
+                    .with_line_sums()
+                    .only('id', *Bill.TOTAL_FIELDS)[:chunk_size]
+                )
+                if not bills:
+                    break
+                for bill in bills:
+                    totals = Bill.compute_totals(bill.line_subtotal, bill.line_taxable_subtotal, tax_rate)
+                    for field, value in totals.items():
+                        setattr(bill, field, value)
+                Bill.objects.bulk_update(bills, Bill.TOTAL_FIELDS)
+            updated += len(bills)
+            last_id = bills[-1].id
+
+        # bulk_update sends no signals, so drop the cached figures here
+        dashboard.invalidate()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt totals for {updated} bills"))
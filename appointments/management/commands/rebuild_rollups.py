@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from appointments import rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-day technician and customer reporting rollups from bills and line items."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to rebuild (YYYY-MM-DD, default: oldest bill)')
+        parser.add_argument('--end', help='Last day to rebuild (YYYY-MM-DD, default: newest bill)')
+        parser.add_argument('--chunk-days', type=int, default=31,
+                            help='Number of days rebuilt per transaction (default: 31)')
+
+    def handle(self, *args, **options):
+        bounds = rollups.bill_date_range()
+        try:
+            start = parse_date(options['start']) if options['start'] else (bounds and bounds[0])
+            end = parse_date(options['end']) if options['end'] else (bounds and bounds[1])
+        except ValueError as error:
+            raise CommandError(error)
+        if not start or not end:
+            self.stdout.write("No issued bills to roll up")
+            return
+        if options['chunk_days'] < 1:
+            raise CommandError("--chunk-days must be at least 1")
+
+        rows = 0
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(chunk_start + timedelta(days=options['chunk_days'] - 1), end)
+            rows += rollups.rebuild(chunk_start, chunk_end)
+            chunk_start = chunk_end + timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} rollup rows for {start} to {end}"))
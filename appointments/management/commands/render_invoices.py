@@ -0,0 +1,51 @@
+import os
+import shutil
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from appointments import invoices
+from appointments.models import Bill
+
+
+class Command(BaseCommand):
+    help = ("Render invoice PDFs in a pool of worker processes, skipping bills whose cached PDF is current, "
+            "and optionally copy them to a directory for printing or mailing.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', action='append',
+                            help='Only bills with this status; repeat for several (default: all)')
+        parser.add_argument('--type', choices=['bill', 'estimate'], help='Only bills or only estimates')
+        parser.add_argument('--since', help='Only bills created on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--output', help='Copy the PDFs to this directory as Bill_<id>.pdf')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of worker processes (default: INVOICE_WORKERS or the CPU count)')
+        parser.add_argument('--chunk-size', type=int, default=invoices.CHUNK_SIZE,
+                            help=f'Bills sent to a worker at a time (default: {invoices.CHUNK_SIZE})')
+
+    def handle(self, *args, **options):
+        queryset = Bill.objects.all()
+        if options['status']:
+            queryset = queryset.filter(status__in=options['status'])
+        if options['type']:
+            queryset = queryset.filter(type=options['type'])
+        if options['since']:
+            since = parse_date(options['since'])
+            if since is None:
+                raise CommandError("--since must be a date like 2025-01-31")
+            queryset = queryset.filter(created_at__date__gte=since)
+
+        started = time.monotonic()
+        with invoices.process_pool(options['workers']) as pool:
+            paths, rendered = invoices.render_bills(queryset, pool=pool, chunk_size=options['chunk_size'])
+
+        if options['output']:
+            os.makedirs(options['output'], exist_ok=True)
+            for bill_id, path in paths.items():
+                shutil.copyfile(path, os.path.join(options['output'], f'Bill_{bill_id}.pdf'))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(paths)} invoices ready ({rendered} rendered, {len(paths) - rendered} cached) "
+            f"in {time.monotonic() - started:.1f}s"
+        ))
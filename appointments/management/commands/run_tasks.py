@@ -0,0 +1,61 @@
+import multiprocessing
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from appointments import taskqueue
+
+
+def run_worker(stop, poll_interval, once):
+    try:
+        taskqueue.Worker(stop, poll_interval).run(once=once)
+    finally:
+        connection.close()
+
+
+def run_worker_process(stop, poll_interval, once):
+    import django
+    django.setup()
+    # The parent handles Ctrl-C and tells every process through ``stop``
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    run_worker(stop, poll_interval, once)
+
+
+class Command(BaseCommand):
+    help = ("Run queued background tasks and the periodic TASK_SCHEDULE. Start as many copies on as many hosts "
+            "as needed; workers share the queue through the database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Number of tasks run at once (default: 1)')
+        parser.add_argument('--threads', action='store_true',
+                            help='Run workers as threads instead of processes (for I/O-bound tasks)')
+        parser.add_argument('--poll', type=float, default=1.0,
+                            help='Seconds to wait before checking an empty queue again (default: 1)')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no task is due instead of polling')
+
+    def handle(self, *args, **options):
+        concurrency = max(options['concurrency'], 1)
+        args = (options['poll'], options['once'])
+        if options['threads']:
+            stop = threading.Event()
+            workers = [threading.Thread(target=run_worker, args=(stop, *args), daemon=True) for _ in range(concurrency)]
+        else:
+            context = multiprocessing.get_context('spawn')
+            stop = context.Event()
+            workers = [context.Process(target=run_worker_process, args=(stop, *args)) for _ in range(concurrency)]
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                while worker.is_alive():
+                    worker.join(timeout=1)
+        except KeyboardInterrupt:
+            stop.set()
+            for worker in workers:
+                worker.join()
+        self.stdout.write(self.style.SUCCESS(f"Stopped {concurrency} task workers"))
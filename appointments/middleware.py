@@ -0,0 +1,84 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+
+from . import routers
+
+
+class AsyncRoutesMiddleware:
+    """
+    Route requests that arrive over ASGI through ``ASYNC_ROOT_URLCONF``
+    (default ``fieldmaster.asgi_urls``), which serves the read-heavy
+    endpoints with the native async views in ``appointments.async_views``.
+    WSGI requests keep ``ROOT_URLCONF``. Set ``ASYNC_ROOT_URLCONF = None`` to
+    serve ASGI requests with the regular views too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.urlconf = getattr(settings, 'ASYNC_ROOT_URLCONF', 'fieldmaster.asgi_urls')
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self.route(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        self.route(request)
+        return await self.get_response(request)
+
+    def route(self, request):
+        if self.urlconf and isinstance(request, ASGIRequest):
+            request.urlconf = self.urlconf
+
+
+class ReplicaMiddleware:
+    """
+    Tell ``ReplicaRouter`` whether the request may read from the replica,
+    and pin clients that write to the primary for ``REPLICA_PIN_SECONDS``
+    with a cookie (see ``appointments.routers``).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.end_request(token)
+        return self.finish(request, response, state)
+
+    async def __acall__(self, request):
+        state, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.end_request(token)
+        return self.finish(request, response, state)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = routers.current()
+        if state is not None:
+            state.replica_view = routers.is_replica_view(request, view_func)
+
+    def start(self, request):
+        pinned = request.method not in routers.SAFE_METHODS or routers.pin_cookie() in request.COOKIES
+        return routers.start_request(pinned)
+
+    def finish(self, request, response, state):
+        if state.wrote or request.method not in routers.SAFE_METHODS:
+            response.set_cookie(routers.pin_cookie(), '1', max_age=routers.pin_seconds(), httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,65 @@
+# Generated by Django 5.2 on 2026-10-18 06:40
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def backfill_totals(apps, schema_editor):
+    Bill = apps.get_model('appointments', 'Bill')
+    BillLineItem = apps.get_model('appointments', 'BillLineItem')
+    Settings = apps.get_model('appointments', 'Settings')
+    settings = Settings.objects.filter(pk=1).first()
+    tax_rate = Decimal(settings.sales_tax_rate) if settings else Decimal('0.055')
+    cents = Decimal('0.01')
+
+    sums = {}
+    for item in BillLineItem.objects.only('bill_id', 'quantity', 'unit_price', 'is_taxable').iterator():
+        subtotal, taxable = sums.get(item.bill_id, (Decimal('0'), Decimal('0')))
+        amount = item.quantity * item.unit_price
+        sums[item.bill_id] = (subtotal + amount, taxable + amount if item.is_taxable else taxable)
+
+    bills = []
+    for bill in Bill.objects.filter(id__in=sums).only('id'):
+        subtotal, taxable = sums[bill.id]
+        bill.subtotal = subtotal.quantize(cents)
+        bill.taxable_subtotal = taxable.quantize(cents)
+        bill.tax = (bill.taxable_subtotal * tax_rate).quantize(cents)
+        bill.total = bill.subtotal + bill.tax
+        bills.append(bill)
+    Bill.objects.bulk_update(bills, ['subtotal', 'taxable_subtotal', 'tax', 'total'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0010_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bill',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='tax',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='taxable_subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['total', 'id'], name='bill_total_idx'),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+from django.db import migrations
+
+# PostgreSQL only: reject overlapping, non-cancelled appointments of the same
+# technician. An end time at or before the start time runs past midnight.
+# Other backends rely on the locks in appointments/booking.py.
+INTERVAL = """tsrange(
+    {table}.appointment_date + {table}.start_time,
+    {table}.appointment_date + {table}.end_time
+        + CASE WHEN {table}.end_time <= {table}.start_time THEN interval '1 day' ELSE interval '0' END,
+    '[)'
+)"""
+
+CREATE_CONSTRAINT = """
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+ALTER TABLE appointments_appointment
+    ADD CONSTRAINT appointment_no_technician_overlap
+    EXCLUDE USING gist (technician_id WITH =, {interval} WITH &&)
+    WHERE (technician_id IS NOT NULL AND status <> 'cancelled');
+""".format(interval=INTERVAL.format(table='appointments_appointment'))
+
+# Existing double-bookings, which would make adding the constraint fail
+OVERLAPS = """
+SELECT a.technician_id, a.id, b.id
+FROM appointments_appointment a
+JOIN appointments_appointment b ON b.technician_id = a.technician_id AND b.id > a.id
+WHERE a.status <> 'cancelled' AND b.status <> 'cancelled' AND {a} && {b}
+ORDER BY a.technician_id, a.id, b.id
+""".format(a=INTERVAL.format(table='a'), b=INTERVAL.format(table='b'))
+
+DROP_CONSTRAINT = """
+ALTER TABLE appointments_appointment DROP CONSTRAINT IF EXISTS appointment_no_technician_overlap;
+"""
+
+
+def create_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(OVERLAPS)
+        overlaps = cursor.fetchall()
+    if overlaps:
+        # An exclusion constraint cannot be added NOT VALID; leave the choice of who keeps the slot to a person
+        raise RuntimeError(
+            f"{len(overlaps)} pairs of non-cancelled appointments overlap for the same technician. Reschedule, "
+            "reassign or cancel one of each pair, then run the migration again:\n"
+            + "\n".join(f"  technician {technician}: appointments {first} and {second}"
+                         for technician, first, second in overlaps)
+        )
+    schema_editor.execute(CREATE_CONSTRAINT)
+
+
+def drop_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_CONSTRAINT)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0012_workinghours'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_constraint, drop_constraint),
+    ]
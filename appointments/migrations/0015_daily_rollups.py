@@ -0,0 +1,46 @@
+# Generated by Django 5.2 on 2026-10-18 07:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0014_dispatch_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('labor_hours', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('labor_revenue', models.DecimalField(decimal_places=4, default=0, max_digits=16)),
+                ('parts_revenue', models.DecimalField(decimal_places=4, default=0, max_digits=16)),
+                ('taxable_amount', models.DecimalField(decimal_places=4, default=0, max_digits=16)),
+                ('bill_count', models.IntegerField(default=0)),
+                ('customer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='appointments.customer')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'customer'), name='customer_rollup_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TechnicianDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('labor_hours', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('labor_revenue', models.DecimalField(decimal_places=4, default=0, max_digits=16)),
+                ('parts_revenue', models.DecimalField(decimal_places=4, default=0, max_digits=16)),
+                ('taxable_amount', models.DecimalField(decimal_places=4, default=0, max_digits=16)),
+                ('bill_count', models.IntegerField(default=0)),
+                ('technician', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='appointments.technician')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'technician'), name='technician_rollup_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-18 07:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0017_sync_tombstones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointmentphoto',
+            name='medium',
+            field=models.ImageField(blank=True, upload_to='appointment_photos/'),
+        ),
+        migrations.AddField(
+            model_name='appointmentphoto',
+            name='thumbnail',
+            field=models.ImageField(blank=True, upload_to='appointment_photos/'),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='medium',
+            field=models.ImageField(blank=True, upload_to='photos/'),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='thumbnail',
+            field=models.ImageField(blank=True, upload_to='photos/'),
+        ),
+    ]
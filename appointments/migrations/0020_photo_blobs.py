@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-18 07:40
+
+import appointments.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0019_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='appointmentphoto',
+            name='photo',
+            field=appointments.models.ContentAddressedImageField(upload_to='appointment_photos/'),
+        ),
+        migrations.AlterField(
+            model_name='photo',
+            name='photo',
+            field=appointments.models.ContentAddressedImageField(upload_to='photos/'),
+        ),
+        migrations.CreateModel(
+            name='PhotoBlob',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('size', models.PositiveBigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ref_count', 'updated_at'], name='photoblob_unreferenced_idx')],
+            },
+        ),
+    ]
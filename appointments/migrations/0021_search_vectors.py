@@ -0,0 +1,67 @@
+from django.db import migrations
+
+# PostgreSQL only: weighted full-text columns, generated by the database so
+# they follow every write, with GIN indexes, plus trigram indexes for typos
+# in customer names and part numbers. The weights match appointments/search.py.
+# Other backends use the substring fallback in search.py.
+CREATE_SEARCH = r"""
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE appointments_customer ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('simple'::regconfig, first_name || ' ' || last_name), 'A')
+    || setweight(to_tsvector('simple'::regconfig, translate(email, '@.', '  ')), 'B')
+    || setweight(to_tsvector('simple'::regconfig, regexp_replace(phone, '\D', '', 'g')), 'B')
+    || setweight(to_tsvector('simple'::regconfig, address), 'C')
+) STORED;
+CREATE INDEX customer_search_idx ON appointments_customer USING gin (search_vector);
+CREATE INDEX customer_name_trgm_idx ON appointments_customer
+    USING gin ((first_name || ' ' || last_name) gin_trgm_ops);
+
+ALTER TABLE appointments_appointment ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('english'::regconfig, description), 'A')
+    || setweight(to_tsvector('english'::regconfig, notes), 'B')
+) STORED;
+CREATE INDEX appointment_search_idx ON appointments_appointment USING gin (search_vector);
+
+ALTER TABLE appointments_bill ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('english'::regconfig, description), 'A')
+) STORED;
+CREATE INDEX bill_search_idx ON appointments_bill USING gin (search_vector);
+
+ALTER TABLE appointments_billlineitem ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('simple'::regconfig, part_number), 'A')
+    || setweight(to_tsvector('simple'::regconfig, description), 'B')
+) STORED;
+CREATE INDEX lineitem_search_idx ON appointments_billlineitem USING gin (search_vector);
+CREATE INDEX lineitem_part_trgm_idx ON appointments_billlineitem USING gin (part_number gin_trgm_ops);
+"""
+
+DROP_SEARCH = """
+ALTER TABLE appointments_customer DROP COLUMN IF EXISTS search_vector;
+DROP INDEX IF EXISTS customer_name_trgm_idx;
+ALTER TABLE appointments_appointment DROP COLUMN IF EXISTS search_vector;
+ALTER TABLE appointments_bill DROP COLUMN IF EXISTS search_vector;
+ALTER TABLE appointments_billlineitem DROP COLUMN IF EXISTS search_vector;
+DROP INDEX IF EXISTS lineitem_part_trgm_idx;
+"""
+
+
+def create_search(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SEARCH)
+
+
+def drop_search(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SEARCH)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0020_photo_blobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search, drop_search),
+    ]
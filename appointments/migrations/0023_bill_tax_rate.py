@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-18 09:44
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def backfill_tax_rate(apps, schema_editor):
+    # Existing totals were computed at the rate in Settings (see 0011_bill_totals)
+    Bill = apps.get_model('appointments', 'Bill')
+    Settings = apps.get_model('appointments', 'Settings')
+    settings = Settings.objects.filter(pk=1).first()
+    tax_rate = Decimal(str(settings.sales_tax_rate)) if settings else Decimal('0.055')
+    Bill.objects.update(tax_rate=tax_rate)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0022_task_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bill',
+            name='tax_rate',
+            field=models.DecimalField(decimal_places=4, default=0, editable=False, max_digits=5),
+        ),
+        migrations.RunPython(backfill_tax_rate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+# PostgreSQL only. 0021 indexed a customer's phone as one string of digits,
+# and queries match lexemes by prefix, so "555-0199" did not find
+# "(207) 555-0199". The last 7 and 4 digits are now lexemes of their own, as
+# in the typeahead index. A generated column's expression cannot be altered,
+# so the column is recreated, with its index.
+DIGITS = r"regexp_replace(phone, '\D', '', 'g')"
+PHONE_LEXEMES = f"{DIGITS} || ' ' || right({DIGITS}, 7) || ' ' || right({DIGITS}, 4)"
+
+CUSTOMER_SEARCH = """
+ALTER TABLE appointments_customer DROP COLUMN search_vector;
+ALTER TABLE appointments_customer ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('simple'::regconfig, first_name || ' ' || last_name), 'A')
+    || setweight(to_tsvector('simple'::regconfig, translate(email, '@.', '  ')), 'B')
+    || setweight(to_tsvector('simple'::regconfig, {phone}), 'B')
+    || setweight(to_tsvector('simple'::regconfig, address), 'C')
+) STORED;
+CREATE INDEX customer_search_idx ON appointments_customer USING gin (search_vector);
+"""
+
+
+def index_phone_suffixes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CUSTOMER_SEARCH.format(phone=PHONE_LEXEMES))
+
+
+def index_phone_digits(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CUSTOMER_SEARCH.format(phone=DIGITS))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0023_bill_tax_rate'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_phone_suffixes, index_phone_digits),
+    ]
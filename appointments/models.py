@@ -1,5 +1,13 @@
-from django.db import models
+import uuid
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .signals import appointments_bulk_created
 from django.core.validators import RegexValidator, MinValueValidator, MaxValueValidator
 
 class Settings(models.Model):
@@ -34,9 +42,18 @@ class Customer(models.Model):
     email = models.EmailField()
     phone = models.CharField(max_length=17)
     address = models.TextField()
+    # Used by the dispatch optimizer to estimate travel between visits
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='customer_created_keyset_idx'),
+            models.Index(fields=['updated_at'], name='customer_updated_idx'),
+        ]
+
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
@@ -50,12 +67,47 @@ class Technician(models.Model):
         default=85.00,
         validators=[MinValueValidator(0)]
     )
+    # Skill tags such as "hvac" or "electrical", matched against Appointment.required_skills
+    skills = models.JSONField(default=list, blank=True)
+    # Where the technician's day starts, for dispatch travel estimates
+    home_latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    home_longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.user.first_name} {self.user.last_name}"
 
+class WorkingHours(models.Model):
+    """
+    A weekly working-time window. Rows without a technician form the default
+    template; a technician with rows of their own uses only those.
+    """
+    WEEKDAY_CHOICES = [
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    ]
+
+    technician = models.ForeignKey(
+        Technician, on_delete=models.CASCADE, null=True, blank=True, related_name='working_hours'
+    )
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+
+    class Meta:
+        verbose_name_plural = "Working hours"
+        ordering = ['technician', 'weekday', 'start_time']
+
+    def __str__(self):
+        owner = self.technician or "Default"
+        return f"{owner}: {self.get_weekday_display()} {self.start_time}-{self.end_time}"
+
 class Appointment(models.Model):
     STATUS_CHOICES = [
         ('scheduled', 'Scheduled'),
@@ -79,45 +131,145 @@ class Appointment(models.Model):
     description = models.TextField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='scheduled')
     priority = models.CharField(max_length=20, choices=PRIORITY_CHOICES, default='medium')
+    required_skills = models.JSONField(default=list, blank=True)
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['appointment_date', 'start_time', 'id'], name='appointment_keyset_idx'),
+            models.Index(fields=['updated_at'], name='appointment_updated_idx'),
+        ]
+
     def __str__(self):
         return f"Appointment #{self.id} [{self.description}]"
 
+    def build_bill(self):
+        """Return the unsaved draft bill that accompanies a new appointment."""
+        return Bill(
+            customer=self.customer,
+            appointment=self,
+            type='bill',
+            status='draft',
+            description=self.description,
+            notes=self.notes
+        )
+
+    @classmethod
+    def bulk_create_with_bills(cls, appointments):
+        """
+        Insert ``appointments`` together with their draft bills and default
+        labor line items using three bulk INSERTs, the batched equivalent of
+        calling ``save()`` on each new appointment. Overlapping bookings in the
+        batch or against existing appointments raise ``BookingConflict``.
+        """
+        from .booking import booking
+
+        with booking(appointments):
+            appointments = cls.objects.bulk_create(appointments)
+            bills = Bill.objects.bulk_create([appointment.build_bill() for appointment in appointments])
+            BillLineItem.objects.bulk_create([bill.build_labor_item() for bill in bills])
+            appointments_bulk_created.send(sender=cls, appointments=appointments)
+        return appointments
+
     def save(self, *args, **kwargs):
+        from .booking import booking
+
         is_new = self.pk is None
-        super().save(*args, **kwargs)
-        if is_new:
-            # Create a bill template when a new appointment is created
-            Bill.objects.create(
-                customer=self.customer,
-                appointment=self,
-                type='bill',
-                status='draft',
-                description=self.description,
-                notes=self.notes
+        # Raises BookingConflict instead of double-booking the technician
+        with booking([self]):
+            super().save(*args, **kwargs)
+            if is_new:
+                # Create a bill template when a new appointment is created
+                self.build_bill().save()
+            else:
+                # Update existing bill if it exists
+                try:
+                    bill = Bill.objects.get(appointment=self)
+                    bill.description = self.description
+                    bill.notes = self.notes
+                    bill.save()
+                except Bill.DoesNotExist:
+                    pass
+
+
+class ContentAddressedImageField(models.ImageField):
+    """
+    ImageField that stores each distinct file once, under a name derived from
+    its SHA-256 (see ``appointments.blobs``). Saving a file whose content is
+    already stored only adds a reference to the existing blob, and replacing
+    a file drops the reference to the old one.
+    """
+
+    def pre_save(self, model_instance, add):
+        file = getattr(model_instance, self.attname)
+        if not file or file._committed:
+            return super().pre_save(model_instance, add)
+        from . import blobs
+
+        previous = None
+        if not add:
+            previous = (
+                type(model_instance)._default_manager
+                .filter(pk=model_instance.pk)
+                .values_list(self.attname, flat=True)
+                .first()
             )
-        else:
-            # Update existing bill if it exists
-            try:
-                bill = Bill.objects.get(appointment=self)
-                bill.description = self.description
-                bill.notes = self.notes
-                bill.save()
-            except Bill.DoesNotExist:
-                pass
+        file.name = blobs.acquire(file.file, file.name, file.storage)
+        file._committed = True
+        if previous and previous != file.name:
+            blobs.release(previous)
+        return file
 
 class AppointmentPhoto(models.Model):
     appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE, related_name='photos')
-    photo = models.ImageField(upload_to='appointment_photos/')
+    photo = ContentAddressedImageField(upload_to='appointment_photos/')
+    # Resized copies, generated in the background by appointments.derivatives
+    thumbnail = models.ImageField(upload_to='appointment_photos/', blank=True)
+    medium = models.ImageField(upload_to='appointment_photos/', blank=True)
     description = models.CharField(max_length=255, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
+    def save(self, *args, **kwargs):
+        # The photo field takes its blob reference before the INSERT; it must roll back with the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Photo for {self.appointment}"
 
+CENTS = Decimal('0.01')
+
+def line_amount():
+    """SQL expression for ``BillLineItem.amount`` (quantity * unit_price)."""
+    return ExpressionWrapper(
+        F('quantity') * F('unit_price'),
+        output_field=DecimalField(max_digits=20, decimal_places=4),
+    )
+
+def _line_sum(**filters):
+    return Coalesce(
+        Subquery(
+            BillLineItem.objects
+            .filter(bill=OuterRef('pk'), **filters)
+            .values('bill')
+            .annotate(total=Sum(line_amount()))
+            .values('total'),
+            output_field=DecimalField(max_digits=20, decimal_places=4),
+        ),
+        Decimal('0'),
+        output_field=DecimalField(max_digits=20, decimal_places=4),
+    )
+
+class BillQuerySet(models.QuerySet):
+    def with_line_sums(self):
+        """Annotate ``line_subtotal`` and ``line_taxable_subtotal`` computed from the line items."""
+        return self.annotate(
+            line_subtotal=_line_sum(),
+            line_taxable_subtotal=_line_sum(is_taxable=True),
+        )
+
 class Bill(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True, blank=True)
     appointment = models.ForeignKey(Appointment, on_delete=models.SET_NULL, null=True, blank=True)
@@ -137,29 +289,101 @@ class Bill(models.Model):
     notes = models.TextField(blank=True)
     due_date = models.DateField(null=True, blank=True)
     employee_name = models.CharField(max_length=100, blank=True)
+    # Denormalized totals, kept current by BillLineItem save/delete
+    # (see Bill.update_totals) and rebuilt by `manage.py rebuild_bill_totals`.
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    taxable_subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    tax = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    # The sales tax rate `tax` was computed at; a later change to Settings applies
+    # when a line item next changes or the totals are rebuilt.
+    tax_rate = models.DecimalField(max_digits=5, decimal_places=4, default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    TOTAL_FIELDS = ('subtotal', 'taxable_subtotal', 'tax', 'total', 'tax_rate')
+
+    objects = BillQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='bill_created_keyset_idx'),
+            models.Index(fields=['total', 'id'], name='bill_total_idx'),
+            models.Index(fields=['updated_at'], name='bill_updated_idx'),
+        ]
+
     def __str__(self):
         return f"{self.type.title()} #{self.id}"
 
     @property
     def total_amount(self):
-        return sum(item.amount for item in self.line_items.all())
+        # Pre-tax sum of the line items
+        return self.subtotal
+
+    @staticmethod
+    def compute_totals(subtotal, taxable_subtotal, tax_rate):
+        """Return the stored total columns for the given line sums and tax rate."""
+        subtotal = Decimal(subtotal).quantize(CENTS)
+        taxable_subtotal = Decimal(taxable_subtotal).quantize(CENTS)
+        # str() so a float default such as 0.055 is taken as written
+        tax_rate = Decimal(str(tax_rate))
+        tax = (taxable_subtotal * tax_rate).quantize(CENTS)
+        return {
+            'subtotal': subtotal,
+            'taxable_subtotal': taxable_subtotal,
+            'tax': tax,
+            'total': subtotal + tax,
+            'tax_rate': tax_rate,
+        }
+
+    @classmethod
+    def update_totals(cls, bill_id):
+        """Recompute and store the totals of one bill from its line items."""
+        sums = BillLineItem.objects.filter(bill_id=bill_id).aggregate(
+            subtotal=Sum(line_amount()),
+            taxable_subtotal=Sum(line_amount(), filter=Q(is_taxable=True)),
+        )
+        totals = cls.compute_totals(
+            sums['subtotal'] or 0,
+            sums['taxable_subtotal'] or 0,
+            Settings.get_settings().sales_tax_rate,
+        )
+        cls.objects.filter(pk=bill_id).update(updated_at=timezone.now(), **totals)
+        return totals
 
     def save(self, *args, **kwargs):
+        from .rollups import tracking
+
         is_new = self.pk is None
-        super().save(*args, **kwargs)
+        if not is_new and kwargs.get('update_fields') is None:
+            # Totals are only written by update_totals, never from a possibly stale instance
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.TOTAL_FIELDS
+            ]
+        # A status, type or customer change moves the bill in or out of the rollups
+        with tracking([self.pk]):
+            super().save(*args, **kwargs)
         if is_new:
             # Add default labor line item
-            BillLineItem.objects.create(
-                bill=self,
-                description="Labor",
-                quantity=0,
-                unit_price=0,
-                is_labor=True,
-                is_taxable=False
-            )
+            self.build_labor_item().save()
+
+    def build_labor_item(self):
+        """Return the unsaved default labor line item for a new bill."""
+        return BillLineItem(
+            bill=self,
+            description="Labor",
+            quantity=0,
+            unit_price=0,
+            is_labor=True,
+            is_taxable=False
+        )
+
+    def delete(self, *args, **kwargs):
+        from .rollups import tracking
+
+        with tracking([self.pk]):
+            return super().delete(*args, **kwargs)
 
 class BillLineItem(models.Model):
     bill = models.ForeignKey(Bill, on_delete=models.CASCADE, related_name='line_items')
@@ -172,14 +396,75 @@ class BillLineItem(models.Model):
     is_labor = models.BooleanField(default=False)
     is_taxable = models.BooleanField(default=True)
     technician = models.ForeignKey('Technician', on_delete=models.SET_NULL, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'], name='lineitem_updated_idx'),
+        ]
 
     @property
     def amount(self):
         return self.quantity * self.unit_price
 
+    def save(self, *args, **kwargs):
+        from .rollups import tracking
+
+        # Keep the bill's stored totals and the rollups in the same transaction as the row change
+        with transaction.atomic(), tracking([self.bill_id]):
+            super().save(*args, **kwargs)
+            Bill.update_totals(self.bill_id)
+
+    def delete(self, *args, **kwargs):
+        from .rollups import tracking
+
+        with transaction.atomic(), tracking([self.bill_id]):
+            result = super().delete(*args, **kwargs)
+            Bill.update_totals(self.bill_id)
+        return result
+
     def __str__(self):
         return f"{self.description} - ${self.amount}"
 
+class DailyRollup(models.Model):
+    """
+    Issued-bill totals for one day, maintained incrementally by
+    ``appointments.rollups`` and rebuilt by ``manage.py rebuild_rollups``.
+    """
+    day = models.DateField()
+    labor_hours = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    labor_revenue = models.DecimalField(max_digits=16, decimal_places=4, default=0)
+    parts_revenue = models.DecimalField(max_digits=16, decimal_places=4, default=0)
+    taxable_amount = models.DecimalField(max_digits=16, decimal_places=4, default=0)
+    bill_count = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+class TechnicianDailyRollup(DailyRollup):
+    # Null holds line items without a technician
+    technician = models.ForeignKey(Technician, on_delete=models.CASCADE, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'technician'], name='technician_rollup_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.technician or 'Unassigned'}"
+
+class CustomerDailyRollup(DailyRollup):
+    # Null holds bills without a customer
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'customer'], name='customer_rollup_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.customer or 'No customer'}"
+
 FONT_CHOICES = [
     ('Roboto', 'Roboto'),
     ('Arial', 'Arial'),
@@ -210,14 +495,23 @@ class Photo(models.Model):
         ('bill', 'Bill'),
     ]
 
-    photo = models.ImageField(upload_to='photos/')
+    photo = ContentAddressedImageField(upload_to='photos/')
+    # Resized copies, generated in the background by appointments.derivatives
+    thumbnail = models.ImageField(upload_to='photos/', blank=True)
+    medium = models.ImageField(upload_to='photos/', blank=True)
     description = models.CharField(max_length=255, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     
     # Generic foreign key fields
     content_type = models.CharField(max_length=20, choices=PHOTO_TYPES)
     object_id = models.PositiveIntegerField()
+
+    def save(self, *args, **kwargs):
+        # The photo field takes its blob reference before the INSERT; it must roll back with the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.content_type.title()} Photo #{self.id}"
@@ -225,4 +519,122 @@ class Photo(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['content_type', 'object_id']),
+            models.Index(fields=['updated_at'], name='photo_updated_idx'),
         ]
+
+class PhotoBlob(models.Model):
+    """
+    One stored photo file, shared by every ``Photo``/``AppointmentPhoto``
+    with the same content. ``ref_count`` is the number of rows pointing at
+    it; unreferenced blobs are deleted by ``manage.py dedupe_photos``.
+    """
+    digest = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ref_count', 'updated_at'], name='photoblob_unreferenced_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} references)"
+
+class UploadSession(models.Model):
+    """
+    A resumable photo upload in progress. The bytes received so far live in a
+    temporary file (see ``appointments.uploads``); finalizing turns it into a
+    ``Photo``. Abandoned sessions are removed by ``manage.py clean_uploads``.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    received = models.PositiveBigIntegerField(default=0)
+    content_type = models.CharField(max_length=20, choices=Photo.PHOTO_TYPES)
+    object_id = models.PositiveIntegerField()
+    description = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Upload of {self.filename} ({self.received}/{self.size} bytes)"
+
+class Tombstone(models.Model):
+    """
+    Record of a deleted object, kept so that offline clients can drop their
+    copy on the next delta sync. Written by the ``post_delete`` receivers and
+    pruned by ``manage.py prune_tombstones``.
+    """
+    RESOURCE_CHOICES = [
+        ('customer', 'Customer'),
+        ('appointment', 'Appointment'),
+        ('bill', 'Bill'),
+        ('line_item', 'Bill line item'),
+        ('photo', 'Photo'),
+    ]
+
+    resource = models.CharField(max_length=20, choices=RESOURCE_CHOICES)
+    object_id = models.PositiveIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at', 'id'], name='tombstone_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"Deleted {self.resource} #{self.object_id}"
+
+class Task(models.Model):
+    """
+    A unit of background work for ``manage.py run_tasks`` (see
+    ``appointments.taskqueue``). Enqueued in the caller's transaction, so a
+    task only becomes visible to workers if the work that created it commits.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=200)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    priority = models.SmallIntegerField(default=0)  # lower runs first
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    worker = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers only ever scan queued tasks that are due
+            models.Index(fields=['priority', 'run_at', 'id'], name='task_due_idx', condition=Q(status='queued')),
+            models.Index(fields=['status', 'finished_at'], name='task_finished_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
+
+
+class ScheduledTask(models.Model):
+    """When a periodic task from ``TASK_SCHEDULE`` is next due; shared by all workers."""
+    key = models.CharField(max_length=100, primary_key=True)
+    next_run_at = models.DateTimeField()
+    last_run_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.key} (next {self.next_run_at})"
@@ -0,0 +1,143 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over a composite ordering.
+
+    The cursor is an opaque encoding of the ordering values of the last row on
+    the previous page, and the next page is fetched with a ``WHERE (a, b, id) >
+    (x, y, z)`` style filter, so deep pages cost the same as the first one.
+    Views declare their ordering with ``keyset_ordering``; it must end in a
+    unique column so cursors are stable.
+
+    Pagination is opt-in: it only applies when the client sends ``page_size``
+    or ``cursor``. Without either, list endpoints return a plain list as before.
+    """
+    default_ordering = ('id',)
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.finish_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """``paginate_queryset`` for async views, fetching the page with the async ORM."""
+        queryset = self.get_page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.finish_page([row async for row in queryset])
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """The unevaluated queryset of the requested page plus one row, or None when not paginating."""
+        if (self.page_size_query_param not in request.query_params
+                and self.cursor_query_param not in request.query_params):
+            return None
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(view)
+        queryset = queryset.order_by(*self.ordering)
+
+        cursor = self.decode_cursor(request, queryset.model)
+        if cursor is not None:
+            queryset = queryset.filter(self.seek_filter(cursor))
+        return queryset[:self.page_size + 1]
+
+    def finish_page(self, rows):
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_cursor = self.encode_cursor(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, view):
+        ordering = tuple(getattr(view, 'keyset_ordering', self.default_ordering))
+        if ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering += ('id',)
+        return ordering
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.cursor_query_param, self.next_cursor)
+        return replace_query_param(url, self.page_size_query_param, self.page_size)
+
+    def seek_filter(self, values):
+        """
+        Build the row-value comparison ``(a, b, c) > (x, y, z)`` as
+        ``a >= x AND (a > x OR (a = x AND (b > y OR ...)))``. The leading
+        ``>=`` lets the database range-scan the composite index.
+        """
+        fields = [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+        condition = None
+        for (name, descending), value in reversed(list(zip(fields, values))):
+            after = Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+            condition = after if condition is None else after | (Q(**{name: value}) & condition)
+        name, descending = fields[0]
+        return Q(**{f"{name}__{'lte' if descending else 'gte'}": values[0]}) & condition
+
+    def encode_cursor(self, instance):
+        values = [getattr(instance, name.lstrip('-')) for name in self.ordering]
+        payload = json.dumps(values, separators=(',', ':'), default=_cursor_value).encode()
+        return urlsafe_b64encode(payload).decode().rstrip('=')
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padding = '=' * (-len(encoded) % 4)
+            values = json.loads(urlsafe_b64decode(encoded + padding))
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                model._meta.get_field('id' if name.lstrip('-') == 'pk' else name.lstrip('-')).to_python(value)
+                for name, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+def _cursor_value(value):
+    # Dates, times and datetimes round-trip through isoformat; Decimals as strings.
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
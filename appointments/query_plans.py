@@ -0,0 +1,114 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+class QueryPlan:
+    """The ``select_related``/``prefetch_related`` lookups a serializer needs."""
+
+    def __init__(self):
+        self.select_related = []
+        self.prefetch_related = []
+
+    def apply(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        return queryset
+
+    def __repr__(self):
+        return f"QueryPlan(select_related={self.select_related!r}, prefetch_related={self.prefetch_related!r})"
+
+
+def build_query_plan(serializer, model=None):
+    """
+    Walk the nested serializers of ``serializer`` and return the QueryPlan
+    that loads every relation they render.
+
+    Single nested serializers over a forward foreign key or one-to-one become
+    ``select_related`` joins; ``many=True`` serializers over reverse or
+    many-to-many relations become ``Prefetch`` objects whose querysets carry
+    the child serializer's own plan. Relations rendered as primary keys only
+    are not joined, except reverse ones, which get a plain prefetch.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    if model is None:
+        model = serializer.Meta.model
+    plan = QueryPlan()
+    _walk(serializer, model, '', plan)
+    return plan
+
+
+def _walk(serializer, model, prefix, plan):
+    for field in serializer.fields.values():
+        nested = (serializers.Serializer, serializers.ListSerializer, serializers.ManyRelatedField)
+        if field.write_only or not isinstance(field, nested):
+            continue
+        if field.source == '*' or '.' in field.source:
+            continue
+        try:
+            relation = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+        if not relation.is_relation:
+            continue
+
+        lookup = prefix + field.source
+        if isinstance(field, serializers.ManyRelatedField):
+            # Related primary keys only; a plain prefetch avoids a query per row
+            if relation.one_to_many or relation.many_to_many:
+                plan.prefetch_related.append(lookup)
+        elif isinstance(field, serializers.ListSerializer):
+            if not (relation.one_to_many or relation.many_to_many):
+                continue
+            related_model = relation.related_model
+            queryset = build_query_plan(field.child, related_model).apply(related_model._default_manager.all())
+            plan.prefetch_related.append(Prefetch(lookup, queryset=queryset))
+        elif relation.many_to_one or relation.one_to_one:
+            plan.select_related.append(lookup)
+            _walk(field, relation.related_model, lookup + '__', plan)
+
+
+def timestamp_paths(serializer, model=None):
+    """
+    Return the relation paths (``'customer'``, ``'appointment__technician'``,
+    ``'line_items'``) to every nested object ``serializer`` renders whose model
+    has an ``updated_at`` column, for building cache validators.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    if model is None:
+        model = serializer.Meta.model
+    paths = []
+    _walk_timestamps(serializer, model, '', paths)
+    return paths
+
+
+def _walk_timestamps(serializer, model, prefix, paths):
+    for field in serializer.fields.values():
+        if field.write_only or not isinstance(field, (serializers.Serializer, serializers.ListSerializer)):
+            continue
+        if field.source == '*' or '.' in field.source:
+            continue
+        try:
+            relation = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+        if not relation.is_relation:
+            continue
+        child = field.child if isinstance(field, serializers.ListSerializer) else field
+        related_model = relation.related_model
+        lookup = prefix + field.source
+        if has_timestamp(related_model):
+            paths.append(lookup)
+        _walk_timestamps(child, related_model, lookup + '__', paths)
+
+
+def has_timestamp(model):
+    try:
+        model._meta.get_field('updated_at')
+    except FieldDoesNotExist:
+        return False
+    return True
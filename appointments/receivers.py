@@ -0,0 +1,132 @@
+from django.contrib.auth.models import User
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import availability, blobs, dashboard, derivatives, invoices, rollups, sync, typeahead
+from .models import Appointment, AppointmentPhoto, Bill, BillLineItem, Customer, Photo, Technician, Tombstone
+from .signals import appointments_bulk_created, appointments_bulk_updated
+
+
+@receiver(post_save, sender=Appointment)
+def index_saved_appointment(sender, instance, **kwargs):
+    transaction.on_commit(lambda: availability.index.update(instance))
+
+
+@receiver(post_delete, sender=Appointment)
+def unindex_deleted_appointment(sender, instance, **kwargs):
+    appointment_id = instance.id
+    transaction.on_commit(lambda: availability.index.remove(appointment_id))
+
+
+@receiver([appointments_bulk_created, appointments_bulk_updated])
+def index_bulk_saved_appointments(sender, appointments, **kwargs):
+    def update_index():
+        for appointment in appointments:
+            availability.index.update(appointment)
+    transaction.on_commit(update_index)
+
+
+@receiver(post_delete, sender=Bill)
+def forget_invoice_pdfs(sender, instance, **kwargs):
+    bill_id = instance.id
+    transaction.on_commit(lambda: invoices.forget(bill_id))
+
+
+@receiver(pre_delete, sender=Customer)
+@receiver(pre_delete, sender=Technician)
+def detach_from_rollups(sender, instance, **kwargs):
+    # Their bills and line items are about to move to the empty key, but their rollup rows cascade away
+    rollups.detach('customer_id' if sender is Customer else 'technician_id', instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Appointment)
+@receiver([post_save, post_delete], sender=Bill)
+@receiver([post_save, post_delete], sender=BillLineItem)
+@receiver([appointments_bulk_created, appointments_bulk_updated])
+def invalidate_dashboard(sender, **kwargs):
+    # After commit, so a concurrent request cannot re-cache the old figures
+    transaction.on_commit(dashboard.invalidate)
+
+
+PHOTO_OWNERS = {'customer': Customer, 'appointment': Appointment, 'bill': Bill}
+
+
+@receiver([post_save, post_delete], sender=Photo)
+def touch_photo_owner(sender, instance, **kwargs):
+    # Owners render their photos, so their ETags and sync versions must move too
+    owner = PHOTO_OWNERS.get(instance.content_type)
+    if owner is not None:
+        owner.objects.filter(pk=instance.object_id).update(updated_at=timezone.now())
+
+
+# The user fields a technician renders (UserSerializer)
+TECHNICIAN_USER_FIELDS = {'username', 'email', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=User)
+def touch_user_technician(sender, instance, created, update_fields=None, **kwargs):
+    # Users have no updated_at, so the technician's ETags and sync version must move instead;
+    # logins only save last_login
+    if created or (update_fields is not None and not TECHNICIAN_USER_FIELDS & set(update_fields)):
+        return
+    Technician.objects.filter(user=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Photo)
+@receiver(post_save, sender=AppointmentPhoto)
+def generate_photo_derivatives(sender, instance, **kwargs):
+    # New or replaced uploads have no derivatives yet; storing them does not re-trigger this.
+    # A duplicate of an already processed upload takes the existing ones.
+    if derivatives.needs_derivatives(instance) and not derivatives.reuse(instance):
+        pk = instance.pk
+        transaction.on_commit(lambda: derivatives.schedule(sender, pk))
+
+
+@receiver(post_delete, sender=Photo)
+@receiver(post_delete, sender=AppointmentPhoto)
+def release_photo_blob(sender, instance, **kwargs):
+    # The file itself is left for blobs.prune(), which waits out concurrent uploads
+    blobs.release(instance.photo.name)
+
+
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Appointment)
+@receiver(post_delete, sender=Bill)
+@receiver(post_delete, sender=BillLineItem)
+@receiver(post_delete, sender=Photo)
+def record_tombstone(sender, instance, **kwargs):
+    # In the deleting transaction, so a rolled back delete leaves no tombstone
+    Tombstone.objects.create(resource=sync.TOMBSTONE_RESOURCES[sender], object_id=instance.pk)
+
+
+@receiver(request_started)
+def warm_typeahead_index(sender, **kwargs):
+    # Loads in a background thread on the first request, so no keystroke waits for it
+    typeahead.index.warm()
+
+
+@receiver(post_save, sender=Customer)
+def index_saved_customer(sender, instance, **kwargs):
+    transaction.on_commit(lambda: typeahead.index.update_customer(instance))
+
+
+@receiver(post_save, sender=Technician)
+def index_saved_technician(sender, instance, **kwargs):
+    transaction.on_commit(lambda: typeahead.index.update_technician(instance))
+
+
+@receiver(post_save, sender=User)
+def index_technician_user(sender, instance, **kwargs):
+    # Technicians are listed under their user's name
+    transaction.on_commit(lambda: typeahead.index.update_user(instance))
+
+
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Technician)
+def unindex_deleted_person(sender, instance, **kwargs):
+    kind = 'customer' if sender is Customer else 'technician'
+    pk = instance.pk
+    transaction.on_commit(lambda: typeahead.index.remove(kind, pk))
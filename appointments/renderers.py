@@ -0,0 +1,38 @@
+import re
+
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# A number orjson wrote with an exponent: it writes 1e16 and 1e-7 where json
+# writes 1e+16 and 1e-07. Starts with the literal so the scan stays fast; a
+# match inside a string only costs a fallback.
+EXPONENT = re.compile(rb'e(?<=\de)[-+]?\d+(?=[,\]}])')
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    ``JSONRenderer`` that encodes with orjson, which writes dates, times and
+    datetimes natively; Decimals, lazy strings and the other types DRF's
+    encoder knows go through that encoder's ``default``. The bytes are the
+    same as ``JSONRenderer`` writes. Responses it would write differently
+    (indented output, keys that are not strings, integers beyond 64 bits,
+    floats in exponent notation) are rendered by ``JSONRenderer`` instead.
+    NaN and infinity render as null rather than raising.
+    """
+    default = JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.default, option=orjson.OPT_UTC_Z)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if EXPONENT.search(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+        # As JSONRenderer, escape the separators that are not valid in JavaScript strings
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
@@ -0,0 +1,244 @@
+"""
+Reporting rollups: per-day totals by technician and by customer.
+
+A bill contributes to the rollups once it is issued (``type='bill'`` with
+status sent, paid or overdue), on the local date it was created. Each line
+item adds to the row of its technician; the whole bill adds to the row of its
+customer. Rows with an empty technician or customer hold the unattributed
+share, so summing either table over a day gives that day's totals.
+
+The rollups are maintained as deltas: code that changes a bill or its line
+items runs inside ``tracking([bill_id])``, which locks the bill, reads its
+contribution before and after the block and adds the difference to the
+affected rows. Model ``save()``/``delete()`` and the bill serializer already
+do this. Deleting a technician or customer moves their share to the empty
+key (``detach``), as ``SET_NULL`` moves their line items and bills.
+Other queryset ``update()``/``delete()`` calls are not tracked; run
+``manage.py rebuild_rollups`` after those.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import CENTS, Bill, BillLineItem, CustomerDailyRollup, TechnicianDailyRollup, line_amount
+
+COUNTED_STATUSES = ('sent', 'paid', 'overdue')
+FIELDS = ('labor_hours', 'labor_revenue', 'parts_revenue', 'taxable_amount', 'bill_count')
+ROLLUPS = ((TechnicianDailyRollup, 'technician_id'), (CustomerDailyRollup, 'customer_id'))
+
+_tracked = threading.local()
+
+
+def counted_q(prefix=''):
+    return Q(**{f'{prefix}type': 'bill', f'{prefix}status__in': COUNTED_STATUSES})
+
+
+def contributions(bill_ids, detached=None):
+    """
+    Return ``{(model, key_field): {(day, key): totals}}`` for the bills in
+    ``bill_ids`` as currently stored, with one query. ``detached`` is a
+    ``(key_field, key)`` pair counted under the empty key instead, as it
+    will be once that technician or customer is deleted.
+    """
+    rows = (
+        BillLineItem.objects
+        .filter(counted_q('bill__'), bill_id__in=bill_ids)
+        .values_list('bill_id', 'bill__created_at', 'bill__customer_id', 'technician_id',
+                     'is_labor', 'is_taxable', 'quantity', 'unit_price')
+    )
+    result = {rollup: defaultdict(_empty) for rollup in ROLLUPS}
+    bills = {rollup: defaultdict(set) for rollup in ROLLUPS}
+    for bill_id, created_at, customer_id, technician_id, is_labor, is_taxable, quantity, unit_price in rows:
+        day = timezone.localtime(created_at).date() if timezone.is_aware(created_at) else created_at.date()
+        amount = quantity * unit_price
+        for rollup, key in zip(ROLLUPS, (technician_id, customer_id)):
+            if detached == (rollup[1], key):
+                key = None
+            totals = result[rollup][(day, key)]
+            if is_labor:
+                totals['labor_hours'] += quantity
+                totals['labor_revenue'] += amount
+            else:
+                totals['parts_revenue'] += amount
+            if is_taxable:
+                totals['taxable_amount'] += amount
+            bills[rollup][(day, key)].add(bill_id)
+    for rollup, counted in bills.items():
+        for row, bill_set in counted.items():
+            result[rollup][row]['bill_count'] = len(bill_set)
+    return result
+
+
+def _empty():
+    return {'labor_hours': Decimal('0'), 'labor_revenue': Decimal('0'), 'parts_revenue': Decimal('0'),
+            'taxable_amount': Decimal('0'), 'bill_count': 0}
+
+
+def apply_delta(before, after):
+    """Add ``after - before`` (both from ``contributions``) to the rollup rows."""
+    for rollup in ROLLUPS:
+        _apply(rollup, before[rollup], after[rollup])
+
+
+def _apply(rollup, old, new):
+    model, key_field = rollup
+    for row in old.keys() | new.keys():
+        delta = {
+            field: new.get(row, _empty())[field] - old.get(row, _empty())[field] for field in FIELDS
+        }
+        if any(delta.values()):
+            _add(model, key_field, *row, delta)
+
+
+def _add(model, key_field, day, key, delta):
+    lookup = {'day': day, key_field: key}
+    pk = model.objects.filter(**lookup).order_by('pk').values_list('pk', flat=True).first()
+    if pk is None:
+        try:
+            with transaction.atomic():
+                model.objects.create(**lookup, **delta)
+            return
+        except IntegrityError:
+            # Another transaction created the row first
+            pk = model.objects.filter(**lookup).values_list('pk', flat=True).get()
+    model.objects.filter(pk=pk).update(**{field: F(field) + value for field, value in delta.items()})
+
+
+def lock_bills(bill_ids):
+    """
+    Lock the bills until the transaction ends, so two changes to one bill
+    read their "before" in turn instead of both applying a delta from the
+    same one.
+    """
+    if connection.features.has_select_for_update:
+        list(Bill.objects.select_for_update().filter(pk__in=bill_ids).order_by('pk').values_list('pk'))
+    else:
+        # SQLite: any write takes the database's write lock until commit; updating no column changes nothing
+        Bill.objects.filter(pk__in=bill_ids).update(id=F('id'))
+
+
+@contextmanager
+def tracking(bill_ids):
+    """
+    Keep the rollups in step with changes made to ``bill_ids`` inside the
+    block. Nested blocks for the same bill are folded into the outermost one.
+    """
+    active = getattr(_tracked, 'bills', None)
+    if active is None:
+        active = _tracked.bills = set()
+    bill_ids = {bill_id for bill_id in bill_ids if bill_id is not None and bill_id not in active}
+    if not bill_ids:
+        yield
+        return
+    active.update(bill_ids)
+    try:
+        with transaction.atomic():
+            lock_bills(bill_ids)
+            before = contributions(bill_ids)
+            yield
+            apply_delta(before, contributions(bill_ids))
+    finally:
+        active.difference_update(bill_ids)
+
+
+def detach(key_field, key):
+    """
+    Move the share of the technician or customer ``key`` (``key_field`` is
+    ``technician_id`` or ``customer_id``), which is about to be deleted, to
+    the empty key. Their own rows are left for the delete to cascade to.
+    """
+    lookup = {'technician_id': key} if key_field == 'technician_id' else {'bill__customer_id': key}
+    bill_ids = set(BillLineItem.objects.filter(counted_q('bill__'), **lookup).values_list('bill_id', flat=True))
+    if not bill_ids:
+        return
+    rollup = next(rollup for rollup in ROLLUPS if rollup[1] == key_field)
+    with transaction.atomic():
+        lock_bills(bill_ids)
+        before = contributions(bill_ids)[rollup]
+        after = contributions(bill_ids, detached=(key_field, key))[rollup]
+        _apply(
+            rollup,
+            {row: totals for row, totals in before.items() if row[1] != key},
+            {row: totals for row, totals in after.items() if row[1] != key},
+        )
+
+
+def aggregate(first_day, last_day, key_field):
+    """
+    Compute rollup rows for bills created from ``first_day`` to ``last_day``
+    in SQL, grouped by day and ``key_field`` (``technician`` or
+    ``bill__customer``). Used by ``rebuild_rollups``.
+    """
+    amount = line_amount()
+    return (
+        BillLineItem.objects
+        .filter(counted_q('bill__'), bill__created_at__date__range=(first_day, last_day))
+        .annotate(day=TruncDate('bill__created_at'), key=F(key_field))
+        .values('day', 'key')
+        .annotate(
+            labor_hours=Sum('quantity', filter=Q(is_labor=True), default=0),
+            labor_revenue=Sum(amount, filter=Q(is_labor=True), default=0),
+            parts_revenue=Sum(amount, filter=Q(is_labor=False), default=0),
+            taxable_amount=Sum(amount, filter=Q(is_taxable=True), default=0),
+            bill_count=Count('bill', distinct=True),
+        )
+        .order_by()
+    )
+
+
+def rebuild(first_day, last_day):
+    """Replace the rollup rows for ``first_day``..``last_day`` with freshly aggregated ones."""
+    created = 0
+    with transaction.atomic():
+        for (model, key_field), source in zip(ROLLUPS, ('technician', 'bill__customer')):
+            model.objects.filter(day__range=(first_day, last_day)).delete()
+            rows = [
+                model(day=row['day'], **{key_field: row['key']}, **{field: row[field] for field in FIELDS})
+                for row in aggregate(first_day, last_day, source)
+            ]
+            model.objects.bulk_create(rows, batch_size=1000)
+            created += len(rows)
+    return created
+
+
+def bill_date_range():
+    """Return the local dates of the oldest and newest counted bills, or None if there are none."""
+    bounds = Bill.objects.filter(counted_q()).aggregate(
+        first=Min(TruncDate('created_at')),
+        last=Max(TruncDate('created_at')),
+    )
+    if bounds['first'] is None:
+        return None
+    return bounds['first'], bounds['last']
+
+
+def report(model, group_by, first_day, last_day):
+    """
+    Sum the ``model`` rollup rows from ``first_day`` to ``last_day`` grouped by
+    the ``group_by`` fields. Only the rows in the range are read, through the
+    index that starts with ``day``.
+    """
+    rows = (
+        model.objects
+        .filter(day__range=(first_day, last_day))
+        .values(*group_by)
+        .annotate(**{field: Sum(field) for field in FIELDS})
+        .order_by(*group_by)
+    )
+    for row in rows:
+        labor, parts = row['labor_revenue'] or 0, row['parts_revenue'] or 0
+        yield {
+            **{field: row[field] for field in group_by},
+            'labor_hours': str(Decimal(row['labor_hours'] or 0).quantize(CENTS)),
+            'labor_revenue': str(Decimal(labor).quantize(CENTS)),
+            'parts_revenue': str(Decimal(parts).quantize(CENTS)),
+            'revenue': str(Decimal(labor + parts).quantize(CENTS)),
+            'taxable_amount': str(Decimal(row['taxable_amount'] or 0).quantize(CENTS)),
+            'bill_count': row['bill_count'] or 0,
+        }
@@ -0,0 +1,103 @@
+"""
+Read-replica routing.
+
+When ``DATABASES`` has a ``REPLICA_DATABASE`` alias (default
+``'replica'``), ``ReplicaRouter`` sends the reads of safe requests to the
+list, detail and report endpoints there; everything else, and every write,
+uses ``default``. ``ReplicaMiddleware`` decides per request:
+
+- only ``GET``/``HEAD`` requests to a viewset action named in its
+  ``replica_actions`` may read from the replica. Viewsets opt in; none
+  do by default, so reads that fill a cache or an in-process index (the
+  dashboard summary, typeahead) do not keep data from a lagging replica;
+- a request that writes reads from the primary for the rest of the request;
+- a client that wrote recently is pinned to the primary for
+  ``REPLICA_PIN_SECONDS`` (default 15) through a cookie, so it reads its own
+  writes despite replication lag.
+
+Code outside a request (management commands, task workers) always uses the
+primary.
+"""
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+_state = ContextVar('replica_state', default=None)
+
+
+class ReadState:
+    """Whether the current request may read from the replica."""
+
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.replica_view = False
+        self.wrote = False
+
+    @property
+    def use_replica(self):
+        return self.replica_view and not self.pinned
+
+
+def replica_alias():
+    alias = getattr(settings, 'REPLICA_DATABASE', 'replica')
+    return alias if alias in settings.DATABASES else None
+
+
+def pin_cookie():
+    return getattr(settings, 'REPLICA_PIN_COOKIE', 'fieldmaster_primary')
+
+
+def pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 15)
+
+
+def start_request(pinned):
+    state = ReadState(pinned)
+    return state, _state.set(state)
+
+
+def end_request(token):
+    _state.reset(token)
+
+
+def current():
+    return _state.get()
+
+
+def is_replica_view(request, view_func):
+    """True for safe requests to a viewset action listed in the viewset's ``replica_actions``."""
+    if request.method not in SAFE_METHODS:
+        return False
+    viewset = getattr(view_func, 'cls', None)
+    action = (getattr(view_func, 'actions', None) or {}).get(request.method.lower())
+    if viewset is None or action is None:
+        return False
+    return action in getattr(viewset, 'replica_actions', ())
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.use_replica:
+            return DEFAULT_DB_ALIAS
+        return replica_alias() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            # Later reads in this request must see the write
+            state.wrote = state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, replica_alias()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema through replication
+        return db != replica_alias()
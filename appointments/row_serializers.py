@@ -0,0 +1,309 @@
+"""
+Row serializers: a model serializer compiled into a plan that renders
+``values_list()`` rows, for large list responses.
+
+``RowSerializer(serializer)`` walks the serializer's readable fields (as
+narrowed by ``?fields=``/``?expand=``) once and turns each into a column and
+a converter:
+
+- model columns read the value from the row and convert it the way the DRF
+  field would (``isoformat`` for dates and times, ``'{:f}'`` for decimals
+  already at the field's precision, the field's own ``to_representation``
+  for anything else);
+- nested serializers over a forward foreign key or one-to-one add the
+  related columns to the same query, through its joins;
+- reverse relations (``line_items``) and the generic ``photos`` run one
+  more query for every row at once, grouped by owner; relations over the
+  same rows (the photos of customers nested in two places) share it;
+- primary-key related fields read the foreign key column.
+
+No model instance is built. The output is what ``serializer.data`` would
+be for the same queryset; a field the compiler does not know (a method field
+without a column equivalent, a custom ``to_representation``) raises
+``UnsupportedField`` so callers can use the serializer instead.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.settings import ISO_8601, api_settings
+
+from .models import Photo
+
+VALUE, OBJECT, MANY = 'value', 'object', 'many'
+
+STRING_COLUMNS = {'CharField', 'TextField', 'SlugField', 'URLField'}
+INTEGER_COLUMNS = {
+    'AutoField', 'BigAutoField', 'SmallAutoField', 'IntegerField', 'BigIntegerField', 'SmallIntegerField',
+    'PositiveIntegerField', 'PositiveBigIntegerField', 'PositiveSmallIntegerField',
+}
+
+
+class UnsupportedField(Exception):
+    """The serializer has a field that cannot be rendered from a row."""
+
+
+class RowSerializer:
+    """
+    A serializer compiled for rows; see the module docstring.
+
+    ``fetch(queryset)`` reads the rows, ``render(rows)`` runs the queries of
+    the reverse relations and returns the list of representations.
+    """
+
+    def __init__(self, serializer, model=None):
+        if isinstance(serializer, serializers.ListSerializer):
+            serializer = serializer.child
+        if model is None:
+            model = serializer.Meta.model
+        self.model = model
+        self.request = serializer.context.get('request')
+        self.columns = []
+        self.index = {}
+        self.relations = []
+        self.entries = self.compile(serializer, model, '')
+
+    def column(self, path):
+        if path not in self.index:
+            self.index[path] = len(self.columns)
+            self.columns.append(path)
+        return self.index[path]
+
+    def fetch(self, queryset, extra=()):
+        """
+        Read the columns of ``queryset`` as named rows. ``extra`` names more
+        columns to read, e.g. the ordering a paginator builds its cursor from.
+        """
+        names = self.columns + [name for name in extra if name not in self.index]
+        return list(queryset.prefetch_related(None).values_list(*names, named=True))
+
+    def render(self, rows):
+        load_relations(self.relations, rows)
+        entries = self.entries
+        return [build(entries, row) for row in rows]
+
+    # Compilation
+
+    def compile(self, serializer, model, prefix):
+        if type(serializer).to_representation is not serializers.Serializer.to_representation:
+            raise UnsupportedField(f"{type(serializer).__name__} overrides to_representation")
+        return [
+            self.compile_field(serializer, field, model, prefix)
+            for field in serializer.fields.values() if not field.write_only
+        ]
+
+    def compile_field(self, serializer, field, model, prefix):
+        name = field.field_name
+        if isinstance(field, serializers.SerializerMethodField):
+            return self.compile_method(serializer, field, model, prefix)
+
+        source = getattr(serializer, 'property_columns', {}).get(name, field.source)
+        if source == '*' or '.' in source:
+            raise UnsupportedField(f"{name} has source {source!r}")
+        try:
+            model_field = model._meta.get_field(source)
+        except FieldDoesNotExist:
+            raise UnsupportedField(f"{name} has no column on {model.__name__}")
+
+        if isinstance(field, serializers.ManyRelatedField):
+            if not isinstance(field.child_relation, serializers.PrimaryKeyRelatedField) or not model_field.one_to_many:
+                raise UnsupportedField(f"{name} is not a list of primary keys of a reverse relation")
+            related = model_field.related_model
+            relation = Relation(None, related._default_manager.all(), model_field.field.name)
+            return self.add_relation(name, relation, model, prefix)
+        if isinstance(field, serializers.ListSerializer):
+            if not model_field.one_to_many:
+                raise UnsupportedField(f"{name} is not a reverse relation")
+            if type(field).to_representation is not serializers.ListSerializer.to_representation:
+                raise UnsupportedField(f"{type(field).__name__} overrides to_representation")
+            related = model_field.related_model
+            rows = RowSerializer(field.child, related)
+            relation = Relation(rows, related._default_manager.all(), model_field.field.name)
+            return self.add_relation(name, relation, model, prefix)
+        if isinstance(field, serializers.Serializer):
+            if not (model_field.many_to_one or model_field.one_to_one) or model_field.auto_created:
+                raise UnsupportedField(f"{name} is not a forward foreign key")
+            entries = self.compile(field, model_field.related_model, prefix + source + '__')
+            return (name, OBJECT, self.column(prefix + source), entries)
+        if isinstance(field, serializers.RelatedField):
+            if type(field) is not serializers.PrimaryKeyRelatedField or field.pk_field is not None:
+                raise UnsupportedField(f"{name} is a {type(field).__name__}")
+            if not (model_field.many_to_one or model_field.one_to_one) or model_field.auto_created:
+                raise UnsupportedField(f"{name} is not a forward foreign key")
+            # The foreign key column holds the primary key
+            return (name, VALUE, self.column(prefix + source), None)
+        if model_field.is_relation:
+            raise UnsupportedField(f"{name} renders a relation as a {type(field).__name__}")
+        if isinstance(field, serializers.FileField):
+            return (name, VALUE, self.column(prefix + source), file_converter(field, model_field, self.request))
+        return (name, VALUE, self.column(prefix + source), converter(field, model_field))
+
+    def compile_method(self, serializer, field, model, prefix):
+        name = field.field_name
+        file_column = getattr(serializer, 'file_url_methods', {}).get(name)
+        if file_column is not None:
+            model_field = model._meta.get_field(file_column)
+            return (name, VALUE, self.column(prefix + file_column), file_converter(None, model_field, self.request))
+
+        content_type = getattr(serializer, 'photo_content_type', None)
+        if name == 'photos' and content_type:
+            photos = Photo.objects.filter(content_type=content_type).order_by('id')
+            if field.method_name == 'get_photos':
+                rows = RowSerializer(serializer.get_photo_serializer(), Photo)
+                return self.add_relation(name, Relation(rows, photos, 'object_id'), model, prefix)
+            if field.method_name == 'get_photo_ids':
+                return self.add_relation(name, Relation(None, photos, 'object_id'), model, prefix)
+        raise UnsupportedField(f"{name} is a method field")
+
+    def add_relation(self, name, relation, model, prefix):
+        self.relations.append(relation)
+        relation.owner = self.column(prefix + model._meta.pk.name)
+        return (name, MANY, relation.owner, relation)
+
+
+class Relation:
+    """
+    A to-many relation of the rows: the related rows whose ``key`` is the
+    owner's primary key, grouped by owner. With ``rows`` None only their
+    primary keys are rendered.
+    """
+
+    def __init__(self, rows, queryset, key):
+        self.rows = rows
+        self.queryset = queryset
+        self.key = key
+        self.owner = None
+        self.groups = {}
+        # Relations over the same rows share a query
+        self.source = (key, str(queryset.query))
+
+    def fill(self, rows, names):
+        """Group ``rows``, read with the columns ``names`` (primary key and key first), by owner."""
+        self.groups = groups = defaultdict(list)
+        if self.rows is None:
+            for row in rows:
+                groups[row[1]].append(row[0])
+            return
+        positions = [names.index(name) for name in self.rows.columns]
+        own = [tuple(row[position] for position in positions) for row in rows]
+        for row, data in zip(rows, self.rows.render(own)):
+            groups[row[1]].append(data)
+
+
+def load_relations(relations, owners):
+    """
+    Load ``relations`` for the ``owners`` rows with one query per distinct
+    source, so e.g. the photos of customers rendered in two places of a bill
+    are fetched together.
+    """
+    sources = defaultdict(list)
+    for relation in relations:
+        sources[relation.source].append(relation)
+    for group in sources.values():
+        keys = {owner[relation.owner] for relation in group for owner in owners} - {None}
+        first = group[0]
+        names = ['pk', first.key]
+        for relation in group:
+            if relation.rows is not None:
+                names += [name for name in relation.rows.columns if name not in names]
+        rows = list(first.queryset.filter(**{first.key + '__in': keys}).values_list(*names)) if keys else []
+        for relation in group:
+            relation.fill(rows, names)
+
+
+def build(entries, row):
+    data = {}
+    for name, kind, index, extra in entries:
+        value = row[index]
+        if kind is VALUE:
+            data[name] = value if value is None or extra is None else extra(value)
+        elif kind is OBJECT:
+            data[name] = None if value is None else build(extra, row)
+        else:
+            data[name] = list(extra.groups.get(value, ()))
+    return data
+
+
+# Converters: None when the column value is already the representation
+
+def converter(field, model_field):
+    internal_type = model_field.get_internal_type()
+    field_type = type(field)
+    if field_type in (serializers.CharField, serializers.EmailField, serializers.SlugField, serializers.URLField):
+        return None if internal_type in STRING_COLUMNS else field.to_representation
+    if field_type is serializers.IntegerField:
+        return None if internal_type in INTEGER_COLUMNS else field.to_representation
+    if field_type is serializers.BooleanField:
+        return None if internal_type == 'BooleanField' else field.to_representation
+    if field_type is serializers.ChoiceField:
+        if internal_type in STRING_COLUMNS and all(isinstance(key, str) for key in field.choices):
+            return None
+        return field.to_representation
+    if field_type is serializers.ReadOnlyField:
+        return None
+    if field_type is serializers.DecimalField:
+        return decimal_converter(field)
+    if field_type in (serializers.DateField, serializers.TimeField):
+        default = api_settings.DATE_FORMAT if field_type is serializers.DateField else api_settings.TIME_FORMAT
+        output_format = getattr(field, 'format', default)
+        if output_format is not None and output_format.lower() == ISO_8601:
+            return iso_format
+        return field.to_representation
+    if field_type is serializers.DateTimeField:
+        return datetime_converter(field)
+    return field.to_representation
+
+
+def iso_format(value):
+    return value.isoformat()
+
+
+def decimal_converter(field):
+    to_representation = field.to_representation
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if (not coerce_to_string or field.localize or field.normalize_output
+            or field.decimal_places is None or field.max_digits is None):
+        return to_representation
+    exponent, max_digits = -field.decimal_places, field.max_digits
+
+    def convert(value):
+        if isinstance(value, Decimal):
+            # Columns come back at their scale, so quantizing would not change them
+            parts = value.as_tuple()
+            if parts.exponent == exponent and len(parts.digits) <= max_digits:
+                return '{:f}'.format(value)
+        return to_representation(value)
+    return convert
+
+
+def datetime_converter(field):
+    to_representation = field.to_representation
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if output_format is None or output_format.lower() != ISO_8601:
+        return to_representation
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if field_timezone is None:
+        return to_representation
+
+    def convert(value):
+        if getattr(value, 'tzinfo', None) is None:
+            return to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return convert
+
+
+def file_converter(field, model_field, request):
+    """The URL of a file column, as ``FileField`` or ``serializers.file_url`` renders it."""
+    use_url = getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL) if field is not None else True
+    storage = model_field.storage
+
+    def convert(name):
+        if not name:
+            return None
+        if not use_url:
+            return name
+        url = storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+    return convert
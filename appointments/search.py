@@ -0,0 +1,135 @@
+"""
+Full-text search across customers, appointments, bills and part numbers.
+
+On PostgreSQL each searched table has a weighted ``search_vector`` tsvector
+column, generated by the database from the row's text (migration 0021), so
+it is current after every write without any application code, and a GIN
+index over it. Every word of the query is matched as a prefix
+(``compres`` finds "compressor"). Customer names and part numbers also
+have trigram indexes (``pg_trgm``), so a misspelt name still matches.
+Phones are indexed as their digits and, as lexemes of their own, their
+last 7 and 4 digits (migration 0024), so a number typed without its area
+code matches too. Results are ranked by ``ts_rank`` plus trigram
+similarity.
+
+Other backends fall back to case-insensitive substring matching with a
+rank from the same field weights. It needs no schema support and scans
+the tables, so it is meant for development and tests.
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, Case, F, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Replace
+
+from .models import Appointment, Bill, BillLineItem, Customer
+
+TERM = re.compile(r'\w+')
+PHONE = re.compile(r'[\d\s()+.-]+')
+MAX_TERMS = 8
+# ts_rank's default weights for the A, B and C labels
+WEIGHTS = {'A': 1.0, 'B': 0.4, 'C': 0.2}
+
+
+def _digits(expression):
+    for character in ' -().+':
+        expression = Replace(expression, Value(character), Value(''))
+    return expression
+
+
+class SearchType:
+    """One group of results: the model, the fields returned, and how rows are matched."""
+
+    def __init__(self, key, model, fields, config, weighted, trigram=None):
+        self.key = key
+        self.model = model
+        self.fields = fields
+        # Text search configuration of the generated column and its queries
+        self.config = config
+        # (expression for the fallback, weight label) pairs; the migration indexes the same fields
+        self.weighted = weighted
+        # SQL expression with a trigram index, or None
+        self.trigram = trigram
+
+
+TYPES = (
+    SearchType(
+        'customers', Customer, ('id', 'first_name', 'last_name', 'email', 'phone', 'address'), 'simple',
+        [(F('first_name'), 'A'), (F('last_name'), 'A'), (F('email'), 'B'), (_digits(F('phone')), 'B'),
+         (F('address'), 'C')],
+        trigram="(first_name || ' ' || last_name)",
+    ),
+    SearchType(
+        'appointments', Appointment, ('id', 'customer_id', 'appointment_date', 'status', 'description'), 'english',
+        [(F('description'), 'A'), (F('notes'), 'B')],
+    ),
+    SearchType(
+        'bills', Bill, ('id', 'customer_id', 'type', 'status', 'description', 'total'), 'english',
+        [(F('description'), 'A')],
+    ),
+    SearchType(
+        'parts', BillLineItem, ('id', 'bill_id', 'part_number', 'description'), 'simple',
+        [(F('part_number'), 'A'), (F('description'), 'B')],
+        trigram='part_number',
+    ),
+)
+TYPE_KEYS = tuple(search_type.key for search_type in TYPES)
+
+
+def uses_text_search():
+    return connection.vendor == 'postgresql'
+
+
+def parse(query):
+    """
+    Return the terms of ``query``. A query that looks like a phone number is
+    a single term of its digits, since phones are indexed as digits only
+    (the whole number and its last 7 and 4 digits).
+    """
+    if PHONE.fullmatch(query) and sum(character.isdigit() for character in query) >= 3:
+        return [re.sub(r'\D', '', query)]
+    return [term.lower() for term in TERM.findall(query)][:MAX_TERMS]
+
+
+def search(search_type, query, offset, limit):
+    """Return up to ``limit`` matching rows of one type, best first, as dicts with a ``rank``."""
+    terms = parse(query)
+    if not terms:
+        return []
+    if uses_text_search():
+        queryset = _text_search(search_type, query, terms)
+    else:
+        queryset = _fallback(search_type, terms)
+    rows = queryset.order_by('-rank', 'pk').values(*search_type.fields, 'rank')[offset:offset + limit]
+    return [dict(row, rank=round(row['rank'], 4)) for row in rows]
+
+
+def _text_search(search_type, query, terms):
+    tsquery = ' & '.join(f'{term}:*' for term in terms)
+    match = 'search_vector @@ to_tsquery(%s::regconfig, %s)'
+    rank = 'ts_rank(search_vector, to_tsquery(%s::regconfig, %s))'
+    match_params = rank_params = [search_type.config, tsquery]
+    if search_type.trigram:
+        # %% is the pg_trgm similarity operator, escaped for the driver
+        match = f'({match} OR {search_type.trigram} %% %s)'
+        rank = f'{rank} + similarity({search_type.trigram}, %s)'
+        match_params = rank_params = [search_type.config, tsquery, query]
+    return search_type.model.objects.filter(
+        RawSQL(match, match_params, output_field=BooleanField())
+    ).annotate(rank=RawSQL(rank, rank_params, output_field=FloatField()))
+
+
+def _fallback(search_type, terms):
+    # Each field under an alias, so computed ones (phone digits) take lookups too
+    fields = {f'search_field_{number}': expression for number, (expression, _) in enumerate(search_type.weighted)}
+    matches = Q()
+    rank = Value(0.0)
+    for term in terms:
+        term_matches = Q()
+        for name, (_, label) in zip(fields, search_type.weighted):
+            condition = Q(**{f'{name}__icontains': term})
+            term_matches |= condition
+            rank = rank + Case(When(condition, then=Value(WEIGHTS[label])), default=Value(0.0))
+        matches &= term_matches
+    return search_type.model.objects.alias(**fields).filter(matches).annotate(rank=rank)
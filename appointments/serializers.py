@@ -1,26 +1,141 @@
+import logging
+
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Customer, Technician, Appointment, AppointmentPhoto, Bill, BillLineItem, Settings, UserSettings, Photo
+from django.db import transaction
+from django.utils import timezone
+from .models import Customer, Technician, Appointment, AppointmentPhoto, Bill, BillLineItem, Settings, UserSettings, Photo, UploadSession
 from datetime import datetime
+from . import rollups
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+def parse_field_paths(value):
+    """Parse ``"id,customer,appointment.technician"`` into a nested dict of names."""
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in path.strip().split('.'):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """
+    ModelSerializer that honours ``?fields=`` and ``?expand=`` on read requests.
+
+    ``fields`` limits the output to the listed names (dotted paths select
+    fields of nested objects). ``expand`` lists the relations to render as
+    nested objects; in sparse mode every other relation is rendered as its
+    primary key and ``photos`` as a list of photo ids. When neither parameter
+    is sent the full nested representation is returned as before.
+    """
+    # Method fields that are relations, mapped to the method that renders them unexpanded
+    unexpanded_methods = {}
+
+    def get_field_path(self):
+        path = []
+        node = self
+        while node.parent is not None:
+            if node.field_name:
+                path.append(node.field_name)
+            node = node.parent
+        return list(self.context.get('field_path', [])) + path[::-1]
+
+    def get_field_options(self):
+        """Return ``(only, expand)`` for this level, or None when not in sparse mode."""
+        if self.context.get('flat'):
+            # Every field, with relations as primary keys (the sync feed)
+            return None, {}
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+        fields = request.query_params.get('fields')
+        expand = request.query_params.get('expand')
+        if fields is None and expand is None:
+            return None
 
-class UserSerializer(serializers.ModelSerializer):
+        only = parse_field_paths(fields or '')
+        expanded = parse_field_paths(expand or '')
+        for name in self.get_field_path():
+            only = only.get(name, {})
+            expanded = expanded.get(name, {})
+        return only or None, expanded
+
+    def get_fields(self):
+        fields = super().get_fields()
+        options = self.get_field_options()
+        if options is None:
+            return fields
+
+        only, expanded = options
+        for name, field in list(fields.items()):
+            if field.write_only:
+                continue
+            if only is not None and name not in only:
+                del fields[name]
+            elif name not in expanded and not (only and only.get(name)):
+                unexpanded = self.build_unexpanded_field(name, field)
+                if unexpanded is not None:
+                    fields[name] = unexpanded
+        return fields
+
+    def build_unexpanded_field(self, name, field):
+        """Return the primary-key stand-in for relation ``field``, or None if it is not a relation."""
+        if name in self.unexpanded_methods:
+            return serializers.SerializerMethodField(method_name=self.unexpanded_methods[name])
+        kwargs = {'read_only': True}
+        if field.source != name:
+            kwargs['source'] = field.source
+        if isinstance(field, serializers.ListSerializer) and isinstance(field.child, serializers.ModelSerializer):
+            return serializers.PrimaryKeyRelatedField(many=True, **kwargs)
+        if isinstance(field, serializers.ModelSerializer):
+            return serializers.PrimaryKeyRelatedField(**kwargs)
+        return None
+
+class UserSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
         read_only_fields = ['id']
 
-class CustomerSerializer(serializers.ModelSerializer):
+class PhotoOwnerSerializer(DynamicFieldsModelSerializer):
+    """
+    Base for serializers that embed the generic ``Photo`` relation.
+
+    When the view supplies a ``photo_loader`` in the context the photos come
+    from the request's batch, otherwise they are fetched per object.
+    """
+    photo_content_type = None
     photos = serializers.SerializerMethodField()
+    unexpanded_methods = {'photos': 'get_photo_ids'}
+
+    def get_owned_photos(self, obj):
+        loader = self.context.get('photo_loader')
+        if loader is not None:
+            return loader.get(self.photo_content_type, obj.id)
+        return Photo.objects.filter(content_type=self.photo_content_type, object_id=obj.id)
+
+    def get_photo_serializer(self, photos=None):
+        context = {'request': self.context.get('request'), 'field_path': self.get_field_path() + ['photos']}
+        return PhotoSerializer(photos, many=True, context=context)
+
+    def get_photos(self, obj):
+        return self.get_photo_serializer(self.get_owned_photos(obj)).data
+
+    def get_photo_ids(self, obj):
+        return [photo.id for photo in self.get_owned_photos(obj)]
+
+class CustomerSerializer(PhotoOwnerSerializer):
+    photo_content_type = 'customer'
     
     class Meta:
         model = Customer
         fields = '__all__'
-    
-    def get_photos(self, obj):
-        photos = Photo.objects.filter(content_type='customer', object_id=obj.id)
-        return PhotoSerializer(photos, many=True, context={'request': self.context.get('request')}).data
 
-class TechnicianSerializer(serializers.ModelSerializer):
+class TechnicianSerializer(DynamicFieldsModelSerializer):
     user = UserSerializer(read_only=True)
     username = serializers.CharField(write_only=True)
     password = serializers.CharField(write_only=True)
@@ -30,7 +145,7 @@ class TechnicianSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Technician
-        fields = ['id', 'user', 'username', 'password', 'first_name', 'last_name', 'email', 'phone', 'is_available', 'labor_rate', 'created_at', 'updated_at']
+        fields = ['id', 'user', 'username', 'password', 'first_name', 'last_name', 'email', 'phone', 'is_available', 'labor_rate', 'skills', 'home_latitude', 'home_longitude', 'created_at', 'updated_at']
         read_only_fields = ['created_at', 'updated_at']
     
     def create(self, validated_data):
@@ -55,21 +170,54 @@ class TechnicianSerializer(serializers.ModelSerializer):
         instance.phone = validated_data.get('phone', instance.phone)
         instance.is_available = validated_data.get('is_available', instance.is_available)
         instance.labor_rate = validated_data.get('labor_rate', instance.labor_rate)
+        instance.skills = validated_data.get('skills', instance.skills)
+        instance.home_latitude = validated_data.get('home_latitude', instance.home_latitude)
+        instance.home_longitude = validated_data.get('home_longitude', instance.home_longitude)
         instance.save()
         return instance
 
-class AppointmentPhotoSerializer(serializers.ModelSerializer):
+def file_url(serializer, file):
+    """Absolute URL of ``file`` for the serializer's request, or None if it is empty."""
+    if not file:
+        return None
+    request = serializer.context.get('request')
+    return request.build_absolute_uri(file.url) if request is not None else file.url
+
+class PhotoFileSerializer(DynamicFieldsModelSerializer):
+    """
+    Base for photo serializers. Adds the URLs of the resized copies, which are
+    None until ``appointments.derivatives`` has made them.
+    """
+    thumbnail_url = serializers.SerializerMethodField()
+    medium_url = serializers.SerializerMethodField()
+    # Method fields that render a file column's URL, for the row serializer
+    file_url_methods = {'thumbnail_url': 'thumbnail', 'medium_url': 'medium'}
+
+    def get_thumbnail_url(self, obj):
+        return file_url(self, obj.thumbnail)
+
+    def get_medium_url(self, obj):
+        return file_url(self, obj.medium)
+
+class AppointmentPhotoSerializer(PhotoFileSerializer):
     class Meta:
         model = AppointmentPhoto
-        fields = '__all__'
+        exclude = ['thumbnail', 'medium']
+
+    def update(self, instance, validated_data):
+        if 'photo' in validated_data:
+            # Makes the receiver generate derivatives for the new image
+            instance.thumbnail = instance.medium = ''
+        return super().update(instance, validated_data)
 
-class PhotoSerializer(serializers.ModelSerializer):
+class PhotoSerializer(PhotoFileSerializer):
     uploaded_by = UserSerializer(read_only=True)
     photo = serializers.SerializerMethodField()
+    file_url_methods = {**PhotoFileSerializer.file_url_methods, 'photo': 'photo'}
     
     class Meta:
         model = Photo
-        fields = ['id', 'photo', 'description', 'uploaded_at', 'uploaded_by', 'content_type', 'object_id']
+        fields = ['id', 'photo', 'thumbnail_url', 'medium_url', 'description', 'uploaded_at', 'uploaded_by', 'content_type', 'object_id']
         read_only_fields = ['uploaded_at', 'uploaded_by']
         extra_kwargs = {
             'photo': {'required': True},
@@ -78,18 +226,12 @@ class PhotoSerializer(serializers.ModelSerializer):
         }
     
     def get_photo(self, obj):
-        request = self.context.get('request')
-        if obj.photo and hasattr(obj.photo, 'url'):
-            url = request.build_absolute_uri(obj.photo.url) if request is not None else obj.photo.url
-            print(f"DEBUG: Returning photo URL: {url}")
-            return url
-        print("DEBUG: No photo or photo.url for object", obj)
-        return None
+        return file_url(self, obj.photo)
 
-class AppointmentSerializer(serializers.ModelSerializer):
+class AppointmentSerializer(PhotoOwnerSerializer):
+    photo_content_type = 'appointment'
     customer = CustomerSerializer(read_only=True)
     technician = TechnicianSerializer(read_only=True)
-    photos = serializers.SerializerMethodField()
     customer_id = serializers.PrimaryKeyRelatedField(
         queryset=Customer.objects.all(),
         source='customer',
@@ -107,13 +249,9 @@ class AppointmentSerializer(serializers.ModelSerializer):
         model = Appointment
         fields = '__all__'
         read_only_fields = ('created_at', 'updated_at')
-    
-    def get_photos(self, obj):
-        photos = Photo.objects.filter(content_type='appointment', object_id=obj.id)
-        return PhotoSerializer(photos, many=True, context={'request': self.context.get('request')}).data
 
     def create(self, validated_data):
-        print("Validated data:", validated_data)  # Debug print
+        logger.debug("Validated data: %s", validated_data)
         try:
             # Handle the customer and technician relationships
             customer = validated_data.pop('customer')
@@ -127,11 +265,11 @@ class AppointmentSerializer(serializers.ModelSerializer):
             )
             return appointment
         except Exception as e:
-            print("Error creating appointment:", str(e))  # Debug print
+            logger.debug("Error creating appointment: %s", e)
             raise
 
     def validate(self, data):
-        print("Validation data:", data)  # Debug print
+        logger.debug("Validation data: %s", data)
         return data
 
     def to_internal_value(self, data):
@@ -159,13 +297,53 @@ class AppointmentSerializer(serializers.ModelSerializer):
 
         return super().to_internal_value(data)
 
-class BillLineItemSerializer(serializers.ModelSerializer):
+class AppointmentBulkSerializer(serializers.ModelSerializer):
+    """
+    One entry of a bulk appointment request. Customer and technician are
+    plain ids here; the view checks them for the whole batch at once instead
+    of one lookup per field per row.
+    """
+    customer_id = serializers.IntegerField()
+    technician_id = serializers.IntegerField(required=False, allow_null=True)
+
+    class Meta:
+        model = Appointment
+        fields = [
+            'customer_id', 'technician_id', 'appointment_date', 'start_time', 'end_time',
+            'description', 'status', 'priority', 'required_skills', 'notes'
+        ]
+
+class DispatchAssignmentSerializer(serializers.Serializer):
+    """One proposed assignment from a dispatch preview, sent back to apply it."""
+    appointment_id = serializers.IntegerField()
+    technician_id = serializers.IntegerField()
+
+class BillLineItemSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = BillLineItem
         fields = '__all__'
         read_only_fields = ('amount', 'created_at', 'updated_at')
 
-class BillSerializer(serializers.ModelSerializer):
+class BillLineItemWriteSerializer(serializers.ModelSerializer):
+    """Validates the ``line_items`` sent with a bill create/update."""
+    id = serializers.IntegerField(required=False)
+    technician_id = serializers.IntegerField(required=False, allow_null=True)
+
+    class Meta:
+        model = BillLineItem
+        fields = [
+            'id', 'description', 'part_number', 'employee_number', 'quantity',
+            'unit_price', 'notes', 'is_labor', 'is_taxable', 'technician_id'
+        ]
+
+    def to_internal_value(self, data):
+        # Items echoed back from a GET carry the technician pk as `technician`
+        if 'technician_id' not in data and 'technician' in data:
+            data = {**data, 'technician_id': data['technician']}
+        return super().to_internal_value(data)
+
+class BillSerializer(PhotoOwnerSerializer):
+    photo_content_type = 'bill'
     customer = CustomerSerializer(read_only=True)
     customer_id = serializers.PrimaryKeyRelatedField(
         queryset=Customer.objects.all(),
@@ -182,20 +360,18 @@ class BillSerializer(serializers.ModelSerializer):
     )
     line_items = BillLineItemSerializer(many=True, read_only=True)
     total_amount = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
-    photos = serializers.SerializerMethodField()
+    # Fields whose source is a model property, mapped to the column it returns, for the row serializer
+    property_columns = {'total_amount': 'subtotal'}
 
     class Meta:
         model = Bill
         fields = [
             'id', 'customer', 'customer_id', 'appointment', 'appointment_id',
             'type', 'status', 'description', 'notes', 'due_date',
-            'employee_name', 'line_items', 'total_amount', 'photos',
+            'employee_name', 'line_items', 'total_amount',
+            'subtotal', 'taxable_subtotal', 'tax', 'tax_rate', 'total', 'photos',
             'created_at', 'updated_at'
         ]
-    
-    def get_photos(self, obj):
-        photos = Photo.objects.filter(content_type='bill', object_id=obj.id)
-        return PhotoSerializer(photos, many=True, context={'request': self.context.get('request')}).data
 
     def to_internal_value(self, data):
         if 'due_date' in data:
@@ -206,40 +382,107 @@ class BillSerializer(serializers.ModelSerializer):
                 pass
         return super().to_internal_value(data)
 
+    def parse_line_items(self, line_items_data):
+        serializer = BillLineItemWriteSerializer(data=line_items_data, many=True)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data
+
+        # Check all referenced technicians with a single query
+        technician_ids = {item['technician_id'] for item in items if item.get('technician_id')}
+        if technician_ids:
+            found = set(Technician.objects.filter(id__in=technician_ids).values_list('id', flat=True))
+            missing = technician_ids - found
+            if missing:
+                raise serializers.ValidationError(
+                    {'line_items': [f'Invalid technician pk "{pk}" - object does not exist.' for pk in sorted(missing)]}
+                )
+        return items
+
     def create(self, validated_data):
-        line_items_data = self.context.get('line_items', [])
-        bill = Bill.objects.create(**validated_data)
+        line_items_data = self.parse_line_items(self.context.get('line_items', []))
         
-        for item_data in line_items_data:
-            BillLineItem.objects.create(bill=bill, **item_data)
+        with transaction.atomic():
+            bill = Bill.objects.create(**validated_data)
+            if line_items_data:
+                for item_data in line_items_data:
+                    item_data.pop('id', None)
+                with rollups.tracking([bill.id]):
+                    BillLineItem.objects.bulk_create(
+                        [BillLineItem(bill=bill, **item_data) for item_data in line_items_data]
+                    )
+                    Bill.update_totals(bill.id)
         
+        bill.refresh_from_db(fields=Bill.TOTAL_FIELDS)
         return bill
 
     def update(self, instance, validated_data):
-        line_items_data = self.context.get('line_items', [])
-        
-        # Update bill fields
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
+        line_items_data = self.parse_line_items(self.context.get('line_items', []))
         
-        # Update line items
-        if line_items_data:
-            # Remove existing line items
-            instance.line_items.all().delete()
-            # Create new line items
-            for item_data in line_items_data:
-                BillLineItem.objects.create(bill=instance, **item_data)
+        with transaction.atomic(), rollups.tracking([instance.pk]):
+            # Update bill fields
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.save()
+            
+            # Update line items
+            if line_items_data:
+                self.sync_line_items(instance, line_items_data)
+                instance.refresh_from_db(fields=Bill.TOTAL_FIELDS)
         
         return instance
 
-class SettingsSerializer(serializers.ModelSerializer):
+    def sync_line_items(self, bill, line_items_data):
+        """
+        Apply the submitted line items to ``bill`` as a diff: items are matched
+        by id, changed rows go through one ``bulk_update``, new rows through one
+        ``bulk_create`` and missing rows are removed with a single DELETE.
+        """
+        existing = {item.id: item for item in bill.line_items.all()}
+        to_create, to_update, changed_fields, kept = [], [], set(), set()
+
+        for item_data in line_items_data:
+            item = existing.get(item_data.pop('id', None))
+            if item is None:
+                to_create.append(BillLineItem(bill=bill, **item_data))
+                continue
+            kept.add(item.id)
+            changed = [field for field, value in item_data.items() if getattr(item, field) != value]
+            if changed:
+                for field in changed:
+                    setattr(item, field, item_data[field])
+                changed_fields.update(changed)
+                to_update.append(item)
+
+        removed = existing.keys() - kept
+        if removed:
+            BillLineItem.objects.filter(bill=bill, id__in=removed).delete()
+        if to_update:
+            # bulk_update skips auto_now, so stamp the rows for ETags and sync
+            now = timezone.now()
+            for item in to_update:
+                item.updated_at = now
+            BillLineItem.objects.bulk_update(to_update, sorted(changed_fields | {'updated_at'}))
+        if to_create:
+            BillLineItem.objects.bulk_create(to_create)
+        Bill.update_totals(bill.id)
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', help_text='Hex SHA-256 of the whole file')
+    offset = serializers.IntegerField(source='received', read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'size', 'sha256', 'content_type', 'object_id', 'description', 'offset', 'expires_at']
+        read_only_fields = ['id', 'expires_at']
+        extra_kwargs = {'size': {'min_value': 1}}
+
+class SettingsSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Settings
         fields = ['id', 'sales_tax_rate', 'theme', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
 
-class UserSettingsSerializer(serializers.ModelSerializer):
+class UserSettingsSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = UserSettings
         fields = ['theme', 'font'] 
\ No newline at end of file
@@ -0,0 +1,9 @@
+from django.dispatch import Signal
+
+# Sent by Appointment.bulk_create_with_bills, which bypasses post_save.
+# Receivers get `appointments`, the list of created Appointment instances.
+appointments_bulk_created = Signal()
+
+# Sent by dispatch.apply_assignments after assigning technicians with a bulk
+# UPDATE. Receivers get `appointments`, the list of updated instances.
+appointments_bulk_updated = Signal()
@@ -0,0 +1,154 @@
+"""
+Delta sync feed for offline clients.
+
+``GET /api/sync/`` returns every customer, appointment, bill, line item and
+photo; ``GET /api/sync/?since=<token>`` returns only the ones saved since the
+token was issued, plus tombstones for the ones deleted. Each response carries
+a new token to send next time.
+
+Changes are found through the indexed ``updated_at`` columns and the
+``Tombstone`` table, so a sync with nothing to report costs one small index
+query per resource. Records are rendered flat (relations as primary keys) by
+the resources' own serializers and streamed in primary-key chunks.
+
+The token is a signed timestamp. Saves stamp ``updated_at`` before their
+transaction commits, so each sync re-reads the ``SYNC_COMMIT_WINDOW`` seconds
+before the token to pick up transactions that were still open when it was
+issued. Clients may therefore see a record twice and should apply records as
+upserts and tombstones as idempotent deletes.
+"""
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.utils.encoders import JSONEncoder
+
+from .loaders import PhotoLoader
+from .models import Appointment, Bill, BillLineItem, Customer, Photo, Tombstone
+from .query_plans import build_query_plan
+from .serializers import (
+    AppointmentSerializer,
+    BillLineItemSerializer,
+    BillSerializer,
+    CustomerSerializer,
+    PhotoSerializer,
+)
+
+TOKEN_SALT = 'appointments.sync'
+
+# (response key, tombstone resource, model, serializer)
+RESOURCES = (
+    ('customers', 'customer', Customer, CustomerSerializer),
+    ('appointments', 'appointment', Appointment, AppointmentSerializer),
+    ('bills', 'bill', Bill, BillSerializer),
+    ('line_items', 'line_item', BillLineItem, BillLineItemSerializer),
+    ('photos', 'photo', Photo, PhotoSerializer),
+)
+TOMBSTONE_RESOURCES = {model: resource for _, resource, model, _ in RESOURCES}
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+class ExpiredToken(ValueError):
+    pass
+
+
+def commit_window():
+    return timedelta(seconds=getattr(settings, 'SYNC_COMMIT_WINDOW', 10))
+
+
+def tombstone_retention():
+    return timedelta(days=getattr(settings, 'SYNC_TOMBSTONE_DAYS', 30))
+
+
+def make_token(moment):
+    return signing.dumps({'t': moment.isoformat()}, salt=TOKEN_SALT)
+
+
+def read_token(token):
+    """
+    Return the moment ``token`` was issued. Raise InvalidToken if it was not
+    issued by this server, and ExpiredToken if it is older than the tombstone
+    retention, since deletes before that may have been pruned.
+    """
+    try:
+        moment = parse_datetime(signing.loads(token, salt=TOKEN_SALT)['t'])
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        moment = None
+    if moment is None:
+        raise InvalidToken("Unrecognised sync token")
+    if moment < timezone.now() - tombstone_retention():
+        raise ExpiredToken("Sync token is older than the tombstone retention")
+    return moment
+
+
+def feed(since=None, request=None):
+    """
+    Return ``(token, chunks)``: the token for the next sync and an iterator of
+    JSON text making up the response body. ``since`` is the moment from
+    ``read_token``, or None for a full sync.
+    """
+    token = make_token(timezone.now())
+    start = since - commit_window() if since is not None else None
+    return token, _chunks(token, start, request)
+
+
+def _chunks(token, start, request):
+    yield '{"token": %s, "full": %s' % (json.dumps(token), json.dumps(start is None))
+    for key, _, model, serializer_class in RESOURCES:
+        queryset = model._default_manager.all()
+        if start is not None:
+            queryset = queryset.filter(updated_at__gte=start)
+        yield ', %s: [' % json.dumps(key)
+        yield from _join(_records(queryset, serializer_class, request))
+        yield ']'
+
+    yield ', "deleted": ['
+    if start is not None:
+        tombstones = (
+            Tombstone.objects.filter(deleted_at__gte=start)
+            .order_by('deleted_at', 'id')
+            .values('resource', 'object_id', 'deleted_at')
+            .iterator(chunk_size=_chunk_size())
+        )
+        yield from _join(
+            {'type': row['resource'], 'id': row['object_id'], 'deleted_at': row['deleted_at']}
+            for row in tombstones
+        )
+    yield ']}'
+
+
+def _records(queryset, serializer_class, request):
+    """Render ``queryset`` flat, one primary-key chunk at a time."""
+    size = _chunk_size()
+    context = {'request': request, 'flat': True}
+    plan = build_query_plan(serializer_class(context=context))
+    queryset = plan.apply(queryset).order_by('pk')
+    last = None
+    while True:
+        chunk = list(queryset.filter(pk__gt=last)[:size] if last is not None else queryset[:size])
+        if not chunk:
+            return
+        loader = PhotoLoader()
+        serializer = serializer_class(chunk, many=True, context={**context, 'photo_loader': loader})
+        loader.prime(serializer, chunk)
+        yield from serializer.data
+        if len(chunk) < size:
+            return
+        last = chunk[-1].pk
+
+
+def _join(records):
+    separator = ''
+    for record in records:
+        yield separator + json.dumps(record, cls=JSONEncoder)
+        separator = ', '
+
+
+def _chunk_size():
+    return getattr(settings, 'SYNC_CHUNK_SIZE', 500)
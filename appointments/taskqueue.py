@@ -0,0 +1,289 @@
+"""
+Background tasks kept in the database.
+
+Functions decorated with ``@task`` are enqueued as ``Task`` rows in the
+caller's transaction and run by ``manage.py run_tasks``, so there is no
+broker to operate: a task exists exactly when the work that created it
+committed. Workers claim the first due task in priority order with
+``SELECT ... FOR UPDATE SKIP LOCKED``, so any number of them poll the same
+table without waiting on each other; a conditional update then marks the
+task running, which keeps backends without row locks (SQLite) from running
+it twice.
+
+A task that raises is queued again with exponential backoff
+(``TASK_RETRY_DELAY`` seconds, default 10, doubling per attempt up to
+``TASK_RETRY_MAX_DELAY``, default one hour, with jitter) until it has used
+its ``max_attempts``; then it is marked failed with its traceback. A task
+still running ``TASK_LEASE`` seconds (default 600) after it started is
+assumed to have lost its worker and is queued again.
+
+``TASK_SCHEDULE`` maps a key to ``{'task': name, 'cron': expression}``
+(and optional ``kwargs``); whichever worker first sees an entry due
+enqueues it once and moves it to its next cron time.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from datetime import timedelta
+from time import monotonic
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Min, Q
+from django.utils import timezone
+
+from .cron import Cron
+from .models import ScheduledTask, Task
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCHEDULE = {
+    'clean-uploads': {'task': 'appointments.clean_uploads', 'cron': '*/15 * * * *'},
+    'prune-tombstones': {'task': 'appointments.prune_tombstones', 'cron': '30 3 * * *'},
+    'prune-tasks': {'task': 'appointments.prune_tasks', 'cron': '45 3 * * *'},
+}
+# Seconds between stale-task and schedule checks in a worker
+HOUSEKEEPING_INTERVAL = 30
+
+_registry = {}
+
+
+class TaskDefinition:
+    def __init__(self, func, name, max_attempts, priority):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.priority = priority
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, run_at=None, priority=None, **kwargs):
+        return enqueue(self.name, run_at=run_at, priority=priority, **kwargs)
+
+
+def task(name=None, max_attempts=5, priority=0):
+    """Register a function as a task. Its keyword arguments must be JSON-serializable."""
+    def decorator(func):
+        definition = TaskDefinition(func, name or f'{func.__module__}.{func.__name__}', max_attempts, priority)
+        _registry[definition.name] = definition
+        return definition
+    return decorator
+
+
+def registered():
+    return dict(_registry)
+
+
+def retry_delay(attempts):
+    """Seconds before attempt ``attempts + 1``, with jitter so failed tasks do not retry in step."""
+    base = getattr(settings, 'TASK_RETRY_DELAY', 10)
+    delay = min(base * 2 ** max(attempts - 1, 0), getattr(settings, 'TASK_RETRY_MAX_DELAY', 60 * 60))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def lease():
+    return timedelta(seconds=getattr(settings, 'TASK_LEASE', 600))
+
+
+def schedule():
+    return getattr(settings, 'TASK_SCHEDULE', DEFAULT_SCHEDULE)
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+def enqueue(name, run_at=None, priority=None, **kwargs):
+    """Queue task ``name`` with ``kwargs``; it becomes visible when the current transaction commits."""
+    definition = _registry.get(name)
+    if definition is None:
+        raise LookupError(f"No task named {name!r} is registered")
+    return Task.objects.create(
+        name=name,
+        kwargs=kwargs,
+        run_at=run_at or timezone.now(),
+        priority=definition.priority if priority is None else priority,
+        max_attempts=definition.max_attempts,
+    )
+
+
+def claim(worker=None, now=None):
+    """Mark the next due task as running and return it, or None if nothing is due."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        task = (
+            Task.objects.select_for_update(skip_locked=True)
+            .filter(status=Task.QUEUED, run_at__lte=now)
+            .order_by('priority', 'run_at', 'id')
+            .first()
+        )
+        if task is None:
+            return None
+        claimed = Task.objects.filter(pk=task.pk, status=Task.QUEUED).update(
+            status=Task.RUNNING, worker=worker or worker_name(), started_at=now, attempts=F('attempts') + 1
+        )
+    if not claimed:
+        return None
+    task.refresh_from_db()
+    return task
+
+
+def execute(task):
+    """Run a claimed task and record the outcome. Return True if it succeeded."""
+    definition = _registry.get(task.name)
+    try:
+        if definition is None:
+            raise LookupError(f"No task named {task.name!r} is registered")
+        definition.func(**task.kwargs)
+    except Exception:
+        logger.exception("Task %s #%s failed (attempt %s of %s)", task.name, task.pk, task.attempts, task.max_attempts)
+        _failed(task, traceback.format_exc(), retry=definition is not None)
+        return False
+    Task.objects.filter(pk=task.pk).update(status=Task.SUCCEEDED, finished_at=timezone.now(), last_error='')
+    return True
+
+
+def _failed(task, error, retry=True):
+    now = timezone.now()
+    if retry and task.attempts < task.max_attempts:
+        Task.objects.filter(pk=task.pk).update(
+            status=Task.QUEUED, run_at=now + timedelta(seconds=retry_delay(task.attempts)), last_error=error,
+        )
+    else:
+        Task.objects.filter(pk=task.pk).update(status=Task.FAILED, finished_at=now, last_error=error)
+
+
+def requeue_stale(now=None):
+    """Queue again tasks whose worker stopped mid-run. Return how many."""
+    now = now or timezone.now()
+    stale = Task.objects.filter(status=Task.RUNNING, started_at__lt=now - lease())
+    error = "The worker stopped while running this task"
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(status=Task.FAILED, finished_at=now, last_error=error)
+    queued = stale.update(status=Task.QUEUED, run_at=now, last_error=error)
+    return failed + queued
+
+
+def enqueue_due(now=None):
+    """Enqueue the ``TASK_SCHEDULE`` entries that are due. Return how many were enqueued."""
+    now = now or timezone.now()
+    entries = schedule()
+    known = set(ScheduledTask.objects.filter(key__in=entries).values_list('key', flat=True))
+    for key in entries.keys() - known:
+        next_run_at = Cron(entries[key]['cron']).next_after(timezone.localtime(now))
+        ScheduledTask.objects.get_or_create(key=key, defaults={'next_run_at': next_run_at})
+    count = 0
+    for row in ScheduledTask.objects.filter(key__in=entries, next_run_at__lte=now):
+        entry = entries[row.key]
+        with transaction.atomic():
+            # Moving next_run_at from the value read claims this run; another worker's update finds nothing
+            claimed = ScheduledTask.objects.filter(key=row.key, next_run_at=row.next_run_at).update(
+                next_run_at=Cron(entry['cron']).next_after(timezone.localtime(now)), last_run_at=now,
+            )
+            if claimed:
+                enqueue(entry['task'], **entry.get('kwargs', {}))
+                count += 1
+    return count
+
+
+def run_pending(worker=None, limit=None):
+    """Run due tasks in this thread until none are left (or ``limit`` ran). Return how many ran."""
+    count = 0
+    while limit is None or count < limit:
+        task = claim(worker)
+        if task is None:
+            break
+        execute(task)
+        count += 1
+    return count
+
+
+class Worker:
+    """Polls for due tasks until ``stop`` is set; ``manage.py run_tasks`` runs one per thread or process."""
+
+    def __init__(self, stop, poll_interval=1.0, name=None):
+        self.stop = stop
+        self.poll_interval = poll_interval
+        self.name = name
+        self._housekeeping_at = None
+
+    def housekeeping(self):
+        if self._housekeeping_at is not None and monotonic() - self._housekeeping_at < HOUSEKEEPING_INTERVAL:
+            return
+        self._housekeeping_at = monotonic()
+        try:
+            requeue_stale()
+            enqueue_due()
+        except Exception:
+            logger.exception("Task housekeeping failed")
+
+    def run(self, once=False):
+        name = self.name or worker_name()
+        while not self.stop.is_set():
+            self.housekeeping()
+            try:
+                task = claim(name)
+            except Exception:
+                logger.exception("Could not claim a task")
+                self.database_error()
+                continue
+            if task is not None:
+                try:
+                    execute(task)
+                except Exception:
+                    # The task ran or failed but its outcome was not saved; the lease will queue it again
+                    logger.exception("Could not record the outcome of task %s #%s", task.name, task.pk)
+                    self.database_error()
+            elif once:
+                break
+            else:
+                self.stop.wait(self.poll_interval)
+
+    def database_error(self):
+        """Drop the connection, which may be broken, and back off before polling again."""
+        connection.close()
+        self.stop.wait(self.poll_interval)
+
+
+def stats(now=None):
+    """Queue depth, failures and latency for monitoring."""
+    now = now or timezone.now()
+    hour_ago = now - timedelta(hours=1)
+    due = Q(status=Task.QUEUED, run_at__lte=now)
+    totals = Task.objects.aggregate(
+        queued=Count('id', filter=Q(status=Task.QUEUED)),
+        due=Count('id', filter=due),
+        retrying=Count('id', filter=Q(status=Task.QUEUED, attempts__gt=0)),
+        running=Count('id', filter=Q(status=Task.RUNNING)),
+        failed=Count('id', filter=Q(status=Task.FAILED)),
+        succeeded_last_hour=Count('id', filter=Q(status=Task.SUCCEEDED, finished_at__gte=hour_ago)),
+        failed_last_hour=Count('id', filter=Q(status=Task.FAILED, finished_at__gte=hour_ago)),
+        oldest_due=Min('run_at', filter=due),
+    )
+    # How long tasks started in the last hour waited past their run_at
+    latency = Task.objects.filter(started_at__gte=hour_ago).aggregate(
+        wait=Avg(ExpressionWrapper(F('started_at') - F('run_at'), output_field=DurationField())),
+    )['wait']
+    by_name = (
+        Task.objects.filter(Q(status__in=(Task.QUEUED, Task.RUNNING)) | Q(status=Task.FAILED, finished_at__gte=hour_ago))
+        .values('name')
+        .annotate(
+            queued=Count('id', filter=Q(status=Task.QUEUED)),
+            running=Count('id', filter=Q(status=Task.RUNNING)),
+            failed_last_hour=Count('id', filter=Q(status=Task.FAILED)),
+        )
+        .order_by('name')
+    )
+    oldest_due = totals.pop('oldest_due')
+    return {
+        **totals,
+        'oldest_due_seconds': round((now - oldest_due).total_seconds(), 3) if oldest_due else 0,
+        'latency_seconds': round(latency.total_seconds(), 3) if latency else None,
+        'tasks': list(by_name),
+        'schedule': list(ScheduledTask.objects.filter(key__in=schedule()).order_by('key').values(
+            'key', 'next_run_at', 'last_run_at',
+        )),
+    }
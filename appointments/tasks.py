@@ -0,0 +1,39 @@
+"""
+Tasks run by ``manage.py run_tasks`` (see ``appointments.taskqueue``).
+
+The first three are in the default ``TASK_SCHEDULE``; ``render_invoices``
+is enqueued on demand to warm the invoice PDF cache off the request path.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import invoices, sync, uploads
+from .models import Bill, Task, Tombstone
+from .taskqueue import task
+
+
+@task('appointments.clean_uploads')
+def clean_uploads():
+    return uploads.clean_expired()
+
+
+@task('appointments.prune_tombstones')
+def prune_tombstones():
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=timezone.now() - sync.tombstone_retention()).delete()
+    return deleted
+
+
+@task('appointments.prune_tasks')
+def prune_tasks():
+    """Delete finished tasks older than ``TASK_RETENTION_DAYS`` (default 7)."""
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'TASK_RETENTION_DAYS', 7))
+    deleted, _ = Task.objects.filter(status__in=(Task.SUCCEEDED, Task.FAILED), finished_at__lt=cutoff).delete()
+    return deleted
+
+
+@task('appointments.render_invoices', max_attempts=3, priority=5)
+def render_invoices(bill_ids):
+    _, rendered = invoices.render_bills(Bill.objects.filter(pk__in=bill_ids))
+    return rendered
@@ -0,0 +1,27 @@
+import io
+
+import pytest
+from PIL import Image
+
+
+def jpeg(width=2000, height=1000, color='red', orientation=None):
+    image = Image.new('RGB', (width, height), color)
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    output = io.BytesIO()
+    image.save(output, 'JPEG', exif=exif)
+    return output.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def typeahead_in_the_calling_thread(settings):
+    # A background load would read outside the test's transaction
+    settings.TYPEAHEAD_BACKGROUND_LOAD = False
+
+
+@pytest.fixture
+def media(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.PHOTO_DERIVATIVES_INLINE = True
+    return tmp_path
@@ -1,6 +1,6 @@
 import factory
 from django.contrib.auth import get_user_model
-from appointments.models import Customer, Technician, Appointment, Bill, BillLineItem, Settings
+from appointments.models import Customer, Technician, Appointment, Bill, BillLineItem, Settings, Photo
 
 User = get_user_model()
 
@@ -75,4 +75,14 @@ class SettingsFactory(factory.django.DjangoModelFactory):
         model = Settings
 
     sales_tax_rate = 0.055
-    theme = 'light' 
\ No newline at end of file
+    theme = 'light' 
+
+class PhotoFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = Photo
+
+    photo = factory.Sequence(lambda n: f'photos/photo{n}.jpg')
+    description = factory.Faker('sentence')
+    uploaded_by = factory.SubFactory(UserFactory)
+    content_type = 'customer'
+    object_id = factory.LazyAttribute(lambda obj: CustomerFactory().id)
@@ -0,0 +1,18 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def assert_query_ceiling(client, url, ceiling, params=None):
+    """
+    GET ``url`` with ``client`` and fail if the request runs more than
+    ``ceiling`` SQL queries. Returns the response.
+    """
+    with CaptureQueriesContext(connection) as ctx:
+        response = client.get(url, params or {})
+    assert response.status_code == 200, response.content
+    queries = ctx.captured_queries
+    assert len(queries) <= ceiling, (
+        f"GET {url} ran {len(queries)} queries, ceiling is {ceiling}:\n"
+        + "\n".join(query['sql'] for query in queries)
+    )
+    return response
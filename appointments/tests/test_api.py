@@ -1,8 +1,19 @@
 import pytest
+from datetime import date, time, timedelta
+from decimal import Decimal
 from rest_framework import status
 from rest_framework.test import APIClient
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from .factories import CustomerFactory, UserFactory
+from appointments.models import Appointment, Bill, BillLineItem, Photo
+from appointments.query_plans import build_query_plan
+from appointments.serializers import BillSerializer
+from .factories import (
+    AppointmentFactory, BillFactory, BillLineItemFactory, CustomerFactory, PhotoFactory,
+    TechnicianFactory, UserFactory,
+)
+from .query_counts import assert_query_ceiling
 
 @pytest.mark.django_db
 class TestCustomerAPI:
@@ -83,4 +94,323 @@ class TestCustomerAPI:
         
         # Test detail endpoint
         response = self.client.get(self.customer_detail_url(customer.id))
-        assert response.status_code == status.HTTP_401_UNAUTHORIZED 
\ No newline at end of file
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED 
+
+
+@pytest.mark.django_db
+class TestPhotoBatchLoading:
+    def setup_method(self):
+        """Set up test client and create test user."""
+        self.client = APIClient()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+
+    def photo_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        return response, [q for q in ctx.captured_queries if '"appointments_photo"' in q['sql']]
+
+    def test_bill_list_fetches_photos_once_per_content_type(self):
+        """Test that nested photos on the bill list are batched."""
+        bills = BillFactory.create_batch(5)
+        for bill in bills:
+            PhotoFactory(content_type='bill', object_id=bill.id)
+            PhotoFactory(content_type='appointment', object_id=bill.appointment_id)
+            PhotoFactory(content_type='customer', object_id=bill.customer_id)
+
+        response, queries = self.photo_queries(reverse('bill-list'))
+
+        assert len(queries) == 3
+        bill_ids = {bill.id for bill in bills}
+        for bill in [b for b in response.data if b['id'] in bill_ids]:
+            assert len(bill['photos']) == 1
+            assert len(bill['appointment']['photos']) == 1
+            assert len(bill['appointment']['customer']['photos']) == 1
+
+    def test_photo_queries_do_not_grow_with_rows(self):
+        """Test that the number of photo queries is independent of page size."""
+        CustomerFactory.create_batch(2)
+        _, few = self.photo_queries(reverse('customer-list'))
+        CustomerFactory.create_batch(10)
+        _, many = self.photo_queries(reverse('customer-list'))
+        assert len(few) == len(many) == 1
+
+
+# Query ceilings for the list endpoints. A new nested field that is not
+# covered by the viewset's query plan will push these over the limit. Each
+# includes the one ETag probe query.
+LIST_QUERY_CEILINGS = {
+    'customer-list': 3,
+    'technician-list': 2,
+    'appointment-list': 4,
+    'bill-list': 6,
+}
+
+
+@pytest.mark.django_db
+class TestListQueryCeilings:
+    def setup_method(self):
+        """Set up test client and create test user."""
+        self.client = APIClient()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+
+    @pytest.mark.parametrize('url_name,ceiling', LIST_QUERY_CEILINGS.items())
+    def test_list_endpoint_query_ceiling(self, url_name, ceiling):
+        """Test that list endpoints stay under their query ceiling with many rows."""
+        for bill in BillFactory.create_batch(10):
+            BillLineItemFactory.create_batch(2, bill=bill)
+        assert_query_ceiling(self.client, reverse(url_name), ceiling)
+
+    def test_query_plan_follows_nested_serializers(self):
+        """Test that the plan joins nested relations and prefetches nested lists."""
+        plan = build_query_plan(BillSerializer())
+        assert set(plan.select_related) == {
+            'customer', 'appointment', 'appointment__customer',
+            'appointment__technician', 'appointment__technician__user',
+        }
+        assert [prefetch.prefetch_through for prefetch in plan.prefetch_related] == ['line_items']
+
+
+@pytest.mark.django_db
+class TestKeysetPagination:
+    def setup_method(self):
+        """Set up test client and create test user."""
+        self.client = APIClient()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+
+    def test_lists_are_unpaginated_by_default(self):
+        """Test that list endpoints return a plain list unless paging is requested."""
+        CustomerFactory.create_batch(3)
+        response = self.client.get(reverse('customer-list'))
+        assert isinstance(response.data, list)
+
+    def test_appointment_pages_follow_composite_ordering(self):
+        """Test that walking the cursor visits every appointment once, in order."""
+        customer = CustomerFactory()
+        for day in (3, 1, 2):
+            for hour in (9, 9, 8):
+                AppointmentFactory(
+                    customer=customer,
+                    appointment_date=date(2025, 6, day),
+                    start_time=time(hour, 0),
+                    end_time=time(hour + 1, 0),
+                )
+        expected = list(
+            Appointment.objects.order_by('appointment_date', 'start_time', 'id').values_list('id', flat=True)
+        )
+
+        seen = []
+        url = reverse('appointment-list') + '?page_size=4'
+        while url:
+            response = self.client.get(url)
+            assert response.status_code == status.HTTP_200_OK
+            assert len(response.data['results']) <= 4
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+
+        assert seen == expected
+
+    def test_invalid_cursor_is_not_found(self):
+        """Test that a malformed cursor returns 404."""
+        response = self.client.get(reverse('bill-list'), {'cursor': 'not-a-cursor'})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestBillTotalsAPI:
+    def setup_method(self):
+        """Set up test client and create test user."""
+        self.client = APIClient()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        self.bills = []
+        for price in ('10.00', '250.00', '75.00'):
+            bill = BillFactory()
+            BillLineItemFactory(bill=bill, quantity=1, unit_price=Decimal(price), is_taxable=False)
+            self.bills.append(bill)
+
+    def test_filter_and_order_by_total(self):
+        """Test that bills can be filtered and sorted by their stored total."""
+        response = self.client.get(reverse('bill-list'), {'min_total': '50', 'ordering': '-total'})
+        assert response.status_code == status.HTTP_200_OK
+        assert [bill['total'] for bill in response.data] == ['250.00', '75.00']
+
+    def test_paginate_by_total(self):
+        """Test that keyset pages follow the requested total ordering."""
+        response = self.client.get(reverse('bill-list'), {'ordering': '-total', 'page_size': 1})
+        totals = [response.data['results'][0]['total']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            totals.extend(bill['total'] for bill in response.data['results'])
+        assert totals[:3] == ['250.00', '75.00', '10.00']
+
+    def test_invalid_min_total(self):
+        """Test that a non-numeric amount filter is rejected."""
+        response = self.client.get(reverse('bill-list'), {'min_total': 'lots'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestBillLineItemSync:
+    def setup_method(self):
+        """Set up test client and create test user."""
+        self.client = APIClient()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        self.bill = BillFactory()
+        self.bill.line_items.all().delete()
+        self.kept, self.changed, self.removed = BillLineItemFactory.create_batch(
+            3, bill=self.bill, quantity=1, unit_price=Decimal('10.00'), is_taxable=False
+        )
+
+    def item_payload(self, item, **overrides):
+        data = {
+            'id': item.id, 'description': item.description, 'quantity': str(item.quantity),
+            'unit_price': str(item.unit_price), 'is_labor': item.is_labor, 'is_taxable': item.is_taxable,
+        }
+        data.update(overrides)
+        return data
+
+    def test_update_diffs_line_items(self):
+        """Test that updating a bill keeps ids of unchanged items and batches the writes."""
+        payload = {
+            'type': 'bill',
+            'status': 'draft',
+            'line_items': [
+                self.item_payload(self.kept),
+                self.item_payload(self.changed, quantity='3'),
+                {'description': 'New part', 'quantity': '2', 'unit_price': '5.00', 'is_taxable': False},
+            ],
+        }
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.put(reverse('bill-detail', kwargs={'pk': self.bill.id}), payload, format='json')
+        assert response.status_code == status.HTTP_200_OK
+
+        writes = [q['sql'] for q in ctx.captured_queries
+                  if '"appointments_billlineitem"' in q['sql'] and not q['sql'].startswith('SELECT')]
+        assert len(writes) == 3
+
+        items = {item['id']: item for item in response.data['line_items']}
+        assert self.kept.id in items and self.changed.id in items
+        assert self.removed.id not in items
+        assert items[self.changed.id]['quantity'] == '3.00'
+        assert len(items) == 3
+        assert response.data['total'] == '50.00'
+
+    def test_create_rejects_unknown_technician(self):
+        """Test that line items referencing a missing technician are rejected."""
+        payload = {
+            'type': 'bill',
+            'line_items': [{'description': 'Labor', 'quantity': '1', 'unit_price': '80.00', 'technician_id': 999999}],
+        }
+        response = self.client.post(reverse('bill-list'), payload, format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestAppointmentBulkCreate:
+    def setup_method(self):
+        """Set up test client and create test user."""
+        self.client = APIClient()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('appointment-bulk-create')
+        self.customer = CustomerFactory()
+        self.technician = TechnicianFactory()
+
+    def payload(self, count, first_day=date(2025, 6, 2)):
+        # Eight one-hour jobs per day so no two rows double-book the technician
+        return [{
+            'customer_id': self.customer.id,
+            'technician_id': self.technician.id,
+            'appointment_date': (first_day + timedelta(days=n // 8)).isoformat(),
+            'start_time': f'{8 + n % 8:02d}:00:00',
+            'end_time': f'{9 + n % 8:02d}:00:00',
+            'description': f'Recurring job {n}',
+        } for n in range(count)]
+
+    def post_counting_queries(self, count, first_day=date(2025, 6, 2)):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(self.url, self.payload(count, first_day), format='json')
+        assert response.status_code == status.HTTP_201_CREATED, response.data
+        return response, len(ctx.captured_queries)
+
+    def test_bulk_create_makes_bills_and_labor_items(self):
+        """Test that each appointment gets its draft bill and labor line item."""
+        response, _ = self.post_counting_queries(5)
+        ids = [item['id'] for item in response.data]
+        assert len(ids) == 5
+        bills = Bill.objects.filter(appointment_id__in=ids)
+        assert bills.count() == 5
+        assert all(bill.status == 'draft' and bill.customer_id == self.customer.id for bill in bills)
+        assert BillLineItem.objects.filter(bill__in=bills, is_labor=True).count() == 5
+
+    def test_bulk_create_uses_fixed_number_of_queries(self):
+        """Test that the statement count does not grow with the batch size."""
+        _, few = self.post_counting_queries(3)
+        _, many = self.post_counting_queries(30, first_day=date(2025, 7, 1))
+        assert few == many
+
+    def test_creating_writes_nothing_to_stdout(self, capsys):
+        """Test that neither the single nor the bulk create prints the rows it validates."""
+        response = self.client.post(reverse('appointment-list'), self.payload(1)[0], format='json')
+        assert response.status_code == status.HTTP_201_CREATED, response.data
+        self.post_counting_queries(3, first_day=date(2025, 7, 1))
+
+        assert capsys.readouterr().out == ''
+
+    def test_bulk_create_reports_unknown_customer(self):
+        """Test that rows with missing references are rejected with per-row errors."""
+        rows = self.payload(2)
+        rows[1]['customer_id'] = 999999
+        response = self.client.post(self.url, rows, format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data[0] == {}
+        assert 'customer_id' in response.data[1]
+        assert not Appointment.objects.exists()
+
+
+@pytest.mark.django_db
+class TestSparseFieldsets:
+    def setup_method(self):
+        """Set up test client and create test user."""
+        self.client = APIClient()
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        self.bill = BillFactory()
+        PhotoFactory(content_type='bill', object_id=self.bill.id)
+
+    def get_bill(self, **params):
+        response = self.client.get(reverse('bill-detail', kwargs={'pk': self.bill.id}), params)
+        assert response.status_code == status.HTTP_200_OK
+        return response.data
+
+    def test_fields_limits_output(self):
+        """Test that ?fields= returns only the requested fields."""
+        data = self.get_bill(fields='id,status,total')
+        assert set(data) == {'id', 'status', 'total'}
+
+    def test_unexpanded_relations_are_primary_keys(self):
+        """Test that relations outside ?expand= render as ids."""
+        data = self.get_bill(expand='appointment.technician')
+        assert data['customer'] == self.bill.customer_id
+        assert data['photos'] == [photo.id for photo in Photo.objects.filter(content_type='bill')]
+        assert data['line_items'] == list(self.bill.line_items.values_list('id', flat=True))
+        assert data['appointment']['id'] == self.bill.appointment_id
+        assert data['appointment']['customer'] == self.bill.appointment.customer_id
+        assert data['appointment']['technician']['user'] == self.bill.appointment.technician.user_id
+
+    def test_dotted_fields_expand_nested_objects(self):
+        """Test that a dotted path in ?fields= selects fields of the nested object."""
+        data = self.get_bill(fields='id,appointment.status')
+        assert data == {'id': self.bill.id, 'appointment': {'status': 'scheduled'}}
+
+    def test_sparse_list_only_queries_what_was_asked(self):
+        """Test that unexpanded relations are neither joined nor prefetched."""
+        BillFactory.create_batch(5)
+        # One query for the rows plus the ETag probe
+        assert_query_ceiling(self.client, reverse('bill-list'), 2, {'fields': 'id,customer,appointment'})
+        assert_query_ceiling(self.client, reverse('bill-list'), 3, {'expand': 'customer', 'fields': 'id,customer'})
@@ -0,0 +1,124 @@
+from asyncio import iscoroutinefunction
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import AsyncClient
+from django.urls import resolve, reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from appointments import async_views
+from appointments.models import Photo
+from .conftest import jpeg
+from .factories import (
+    AppointmentFactory, BillFactory, BillLineItemFactory, CustomerFactory, PhotoFactory, UserFactory,
+)
+
+
+pytestmark = pytest.mark.usefixtures('media')
+
+
+@pytest.fixture
+def no_thread_fallback(monkeypatch):
+    """Fail if an async view had to finish rendering in a thread because a relation was not loaded."""
+    def fail(func, *args, **kwargs):
+        raise AssertionError(f"{func} ran in a thread")
+    monkeypatch.setattr(async_views, 'sync_to_async', fail)
+
+
+def test_asgi_routes_use_async_views_for_reads_only():
+    assert iscoroutinefunction(resolve('/api/appointments/', urlconf='fieldmaster.asgi_urls').func)
+    assert iscoroutinefunction(resolve('/api/bills/7/', urlconf='fieldmaster.asgi_urls').func)
+    assert iscoroutinefunction(resolve('/api/photos/upload/', urlconf='fieldmaster.asgi_urls').func)
+    assert not iscoroutinefunction(resolve('/api/appointments/bulk/', urlconf='fieldmaster.asgi_urls').func)
+    assert not iscoroutinefunction(resolve('/api/bills/pdf/', urlconf='fieldmaster.asgi_urls').func)
+    assert not iscoroutinefunction(resolve('/api/appointments/').func)
+
+
+@pytest.mark.django_db
+class TestAsyncViews:
+    def setup_method(self):
+        self.user = UserFactory()
+        self.headers = {'Authorization': f'Token {Token.objects.create(user=self.user).key}'}
+        self.sync = APIClient()
+        self.sync.credentials(HTTP_AUTHORIZATION=self.headers['Authorization'])
+        self.async_client = AsyncClient()
+
+    def aget(self, path, data=None, headers=None):
+        # AsyncClient only sends the headers given per request
+        return async_to_sync(self.async_client.get)(path, data, headers={**self.headers, **(headers or {})})
+
+    def assert_same(self, path, data=None):
+        expected = self.sync.get(path, data)
+        actual = self.aget(path, data)
+        assert actual.status_code == expected.status_code == status.HTTP_200_OK
+        assert actual.json() == expected.json()
+        assert actual.get('ETag') == expected.get('ETag')
+        return actual
+
+    def test_lists_and_details_match_the_sync_views(self, no_thread_fallback):
+        """Test that the async views return what the regular views return, page by page."""
+        customer = CustomerFactory()
+        PhotoFactory(content_type='customer', object_id=customer.id)
+        appointments = AppointmentFactory.create_batch(3, customer=customer)
+        bill = BillFactory(appointment=appointments[0])
+        BillLineItemFactory.create_batch(2, bill=bill)
+
+        self.assert_same(reverse('appointment-list'))
+        self.assert_same(reverse('appointment-list'), {'customer': customer.id, 'expand': 'customer.photos'})
+        first = self.assert_same(reverse('appointment-list'), {'page_size': 2}).json()
+        self.assert_same(first['next'])
+        self.assert_same(reverse('appointment-detail', kwargs={'pk': appointments[0].pk}))
+        self.assert_same(reverse('bill-list'), {'ordering': '-total', 'fields': 'id,total,line_items'})
+        self.assert_same(reverse('bill-detail', kwargs={'pk': bill.pk}))
+        self.assert_same(reverse('photo-list'), {'content_type': 'customer', 'object_id': customer.id})
+        self.assert_same(reverse('photo-detail', kwargs={'pk': Photo.objects.get().pk}))
+
+    def test_validators_errors_and_authentication(self):
+        appointment = AppointmentFactory()
+        url = reverse('appointment-detail', kwargs={'pk': appointment.pk})
+
+        etag = self.aget(url)['ETag']
+        assert self.aget(url, headers={'If-None-Match': etag}).status_code == status.HTTP_304_NOT_MODIFIED
+        missing = self.aget(reverse('appointment-detail', kwargs={'pk': appointment.pk + 100}))
+        assert missing.status_code == status.HTTP_404_NOT_FOUND
+        assert missing.json() == self.sync.get(reverse('appointment-detail', kwargs={'pk': appointment.pk + 100})).json()
+
+        anonymous = async_to_sync(AsyncClient().get)(reverse('photo-list'))
+        assert anonymous.status_code == status.HTTP_401_UNAUTHORIZED
+        bad_token = async_to_sync(AsyncClient().get)(reverse('photo-list'), headers={'Authorization': 'Token nope'})
+        assert bad_token.status_code == status.HTTP_401_UNAUTHORIZED
+        assert bad_token.json() == {'detail': 'Invalid token.'}
+
+    def test_writes_fall_back_to_the_regular_views(self):
+        appointment = AppointmentFactory(description='Old')
+
+        response = async_to_sync(self.async_client.patch)(
+            reverse('appointment-detail', kwargs={'pk': appointment.pk}),
+            {'description': 'New'}, content_type='application/json', headers=self.headers,
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        appointment.refresh_from_db()
+        assert appointment.description == 'New'
+
+    def test_photo_upload(self):
+        """Test that an upload through the async view is stored content-addressed like any other."""
+        customer = CustomerFactory()
+
+        response = async_to_sync(self.async_client.post)(reverse('photo-upload'), {
+            'content_type': 'customer',
+            'object_id': customer.id,
+            'photo': SimpleUploadedFile('site.jpg', jpeg(), content_type='image/jpeg'),
+        }, headers=self.headers)
+
+        assert response.status_code == status.HTTP_201_CREATED
+        photo = Photo.objects.get(pk=response.json()['id'])
+        assert photo.uploaded_by == self.user
+        assert photo.photo.name.startswith('blobs/')
+        missing = async_to_sync(self.async_client.post)(
+            reverse('photo-upload'), {'content_type': 'customer'}, headers=self.headers,
+        )
+        assert missing.status_code == status.HTTP_400_BAD_REQUEST
@@ -0,0 +1,124 @@
+import time as clock
+from datetime import date, datetime, time
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from appointments import availability
+from appointments.models import Appointment, Technician, WorkingHours
+from .factories import AppointmentFactory, CustomerFactory, TechnicianFactory, UserFactory
+
+TUESDAY = date(2025, 6, 3)
+
+
+@pytest.fixture(autouse=True)
+def empty_index():
+    availability.index.clear()
+    yield
+    availability.index.clear()
+
+
+def book(technician, start_hour, end_hour, day=TUESDAY, **kwargs):
+    return AppointmentFactory(
+        technician=technician,
+        appointment_date=day,
+        start_time=time(start_hour),
+        end_time=time(end_hour),
+        **kwargs
+    )
+
+
+def slot_hours(slots, technician):
+    return [(slot['start'].hour, slot['end'].hour) for slot in slots if slot['technician_id'] == technician.id]
+
+
+@pytest.mark.django_db
+class TestFreeSlots:
+    def test_gaps_around_appointments_within_default_hours(self):
+        """Test that free slots are the working-hour gaps between appointments."""
+        technician = TechnicianFactory()
+        book(technician, 10, 11)
+        book(technician, 13, 14)
+        book(technician, 15, 16, status='cancelled')
+
+        slots = availability.free_slots(datetime.combine(TUESDAY, time(0)), datetime.combine(TUESDAY, time(23)), 60)
+        assert slot_hours(slots, technician) == [(8, 10), (11, 13), (14, 17)]
+
+    def test_short_gaps_and_unavailable_technicians_are_skipped(self):
+        """Test that gaps shorter than the duration and unavailable technicians are left out."""
+        technician = TechnicianFactory()
+        away = TechnicianFactory(is_available=False)
+        book(technician, 9, 16)
+
+        slots = availability.free_slots(datetime.combine(TUESDAY, time(8)), datetime.combine(TUESDAY, time(17)), 90)
+        assert slot_hours(slots, technician) == []
+        assert slot_hours(slots, away) == []
+
+    def test_technician_working_hours_template(self):
+        """Test that a technician's own template replaces the default hours."""
+        technician = TechnicianFactory()
+        WorkingHours.objects.create(technician=technician, weekday=TUESDAY.weekday(), start_time=time(12), end_time=time(20))
+
+        slots = availability.free_slots(datetime.combine(TUESDAY, time(0)), datetime.combine(TUESDAY, time(23)), 60)
+        assert slot_hours(slots, technician) == [(12, 20)]
+
+    def test_index_updates_on_save_and_delete(self, django_capture_on_commit_callbacks):
+        """Test that saved and deleted appointments update the loaded index."""
+        technician = TechnicianFactory()
+        window = (datetime.combine(TUESDAY, time(8)), datetime.combine(TUESDAY, time(17)), 60)
+        assert slot_hours(availability.free_slots(*window), technician) == [(8, 17)]
+
+        with django_capture_on_commit_callbacks(execute=True):
+            appointment = book(technician, 9, 12)
+        assert slot_hours(availability.free_slots(*window), technician) == [(8, 9), (12, 17)]
+
+        with django_capture_on_commit_callbacks(execute=True):
+            appointment.delete()
+        assert slot_hours(availability.free_slots(*window), technician) == [(8, 17)]
+
+    def test_month_window_for_hundreds_of_technicians(self):
+        """Test that a month-long query over a few hundred technicians stays fast."""
+        User = get_user_model()
+        users = User.objects.bulk_create([User(username=f'tech{n}') for n in range(300)])
+        technicians = Technician.objects.bulk_create([Technician(user=user, phone='555') for user in users])
+        customer = CustomerFactory()
+        Appointment.objects.bulk_create([
+            Appointment(
+                customer=customer, technician=technician, appointment_date=date(2025, 6, day),
+                start_time=time(9 + n % 6), end_time=time(11 + n % 6), description='Job'
+            )
+            for n, technician in enumerate(technicians) for day in range(1, 31)
+        ])
+        start, end = datetime(2025, 6, 1), datetime(2025, 7, 1)
+        availability.free_slots(start, end, 60)
+
+        began = clock.perf_counter()
+        slots = availability.free_slots(start, end, 60, limit=100)
+        assert clock.perf_counter() - began < 0.5
+        assert len(slots) == 100
+
+
+@pytest.mark.django_db
+class TestAvailabilityAPI:
+    def setup_method(self):
+        """Set up test client and create test user."""
+        self.client = APIClient()
+        self.client.force_authenticate(user=UserFactory())
+        self.url = reverse('technician-availability')
+
+    def test_availability_endpoint(self):
+        """Test that the endpoint returns ranked slots for the window."""
+        busy, idle = TechnicianFactory(), TechnicianFactory()
+        book(busy, 13, 15)
+        response = self.client.get(self.url, {'start': '2025-06-03T13:00', 'end': '2025-06-03T15:00', 'duration': 120})
+        assert response.status_code == status.HTTP_200_OK
+        assert [slot['technician_id'] for slot in response.data['slots']] == [idle.id]
+
+    def test_availability_validates_window(self):
+        """Test that missing or reversed bounds are rejected."""
+        assert self.client.get(self.url, {'start': '2025-06-03'}).status_code == status.HTTP_400_BAD_REQUEST
+        response = self.client.get(self.url, {'start': '2025-06-04', 'end': '2025-06-03'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
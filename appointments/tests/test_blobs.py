@@ -0,0 +1,124 @@
+from datetime import timedelta
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.utils import timezone
+
+from appointments import blobs, derivatives
+from appointments.models import AppointmentPhoto, Photo, PhotoBlob
+from .conftest import jpeg
+from .factories import AppointmentFactory
+
+
+pytestmark = pytest.mark.usefixtures('media')
+
+
+def stored_files(media):
+    return sorted(str(path.relative_to(media)) for path in media.rglob('*') if path.is_file())
+
+
+@pytest.mark.django_db
+class TestContentAddressedPhotos:
+    def test_duplicates_share_one_file(self, media):
+        """Test that the same image uploaded twice, to either model, is stored once."""
+        first = Photo.objects.create(content_type='customer', object_id=1, photo=ContentFile(jpeg(), name='a.JPG'))
+        second = AppointmentPhoto.objects.create(
+            appointment=AppointmentFactory(), photo=ContentFile(jpeg(), name='b.jpg')
+        )
+
+        assert first.photo.name == second.photo.name
+        assert first.photo.name.startswith('blobs/') and first.photo.name.endswith('.jpg')
+        assert PhotoBlob.objects.get().ref_count == 2
+        assert [name for name in stored_files(media) if name.endswith('.jpg')] == [first.photo.name]
+
+    def test_duplicate_reuses_derivatives(self, django_capture_on_commit_callbacks, monkeypatch):
+        """Test that a duplicate upload takes the existing derivatives instead of being resized again."""
+        with django_capture_on_commit_callbacks(execute=True):
+            first = Photo.objects.create(content_type='customer', object_id=1, photo=ContentFile(jpeg(), name='a.jpg'))
+        rendered = []
+        monkeypatch.setattr(derivatives, 'process', lambda *args: rendered.append(args))
+
+        with django_capture_on_commit_callbacks(execute=True):
+            second = Photo.objects.create(content_type='customer', object_id=2, photo=ContentFile(jpeg(), name='b.jpg'))
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        assert not rendered
+        assert (second.thumbnail.name, second.medium.name) == (first.thumbnail.name, first.medium.name)
+
+    def test_replacing_and_deleting_release_references(self):
+        """Test that reference counts follow replaced and deleted photos."""
+        photo = Photo.objects.create(content_type='customer', object_id=1, photo=ContentFile(jpeg(), name='a.jpg'))
+        original = photo.photo.name
+
+        photo.photo = ContentFile(jpeg(color='blue'), name='b.jpg')
+        photo.save()
+        assert PhotoBlob.objects.get(digest=blobs.digest_of(original)).ref_count == 0
+
+        photo.delete()
+        assert set(PhotoBlob.objects.values_list('ref_count', flat=True)) == {0}
+
+    def test_failed_insert_keeps_the_reference_count(self):
+        """Test that the reference taken for a photo whose row is never saved is given back."""
+        Photo.objects.create(content_type='customer', object_id=1, photo=ContentFile(jpeg(), name='a.jpg'))
+
+        with pytest.raises(IntegrityError):
+            # object_id is unsigned, so the INSERT fails after the blob has been acquired
+            Photo.objects.create(content_type='customer', object_id=-1, photo=ContentFile(jpeg(), name='b.jpg'))
+
+        assert PhotoBlob.objects.get().ref_count == 1
+
+    def test_prune_waits_out_the_grace_period(self, media, django_capture_on_commit_callbacks):
+        """Test that an unreferenced blob and its derivatives are deleted only after the grace period."""
+        with django_capture_on_commit_callbacks(execute=True):
+            photo = Photo.objects.create(content_type='customer', object_id=1, photo=ContentFile(jpeg(), name='a.jpg'))
+        photo.delete()
+
+        assert blobs.prune(default_storage) == 0
+        assert stored_files(media)
+
+        PhotoBlob.objects.update(updated_at=timezone.now() - timedelta(hours=2))
+        assert blobs.prune(default_storage) > 0
+        assert not stored_files(media)
+        assert not PhotoBlob.objects.exists()
+
+    def test_prune_keeps_blobs_still_in_use(self, media):
+        """Test that a blob whose count drifted to zero is kept while rows still point at it."""
+        photo = Photo.objects.create(content_type='customer', object_id=1, photo=ContentFile(jpeg(), name='a.jpg'))
+        PhotoBlob.objects.update(ref_count=0, updated_at=timezone.now() - timedelta(hours=2))
+
+        assert blobs.prune(default_storage) == 0
+        assert PhotoBlob.objects.get().ref_count == 1
+        assert default_storage.exists(photo.photo.name)
+
+
+@pytest.mark.django_db
+def test_dedupe_photos_moves_legacy_files(media, capsys, django_capture_on_commit_callbacks):
+    """Test that dedupe_photos folds identical pre-blob files into one blob and reports the space reclaimed."""
+    (media / 'photos').mkdir()
+    data = jpeg()
+    for name in ('one.jpg', 'two.jpg'):
+        (media / 'photos' / name).write_bytes(data)
+    (media / 'photos' / 'other.jpg').write_bytes(jpeg(color='blue'))
+    Photo.objects.bulk_create([
+        Photo(content_type='customer', object_id=1, photo='photos/one.jpg'),
+        Photo(content_type='customer', object_id=2, photo='photos/two.jpg'),
+        Photo(content_type='customer', object_id=3, photo='photos/two.jpg'),
+        Photo(content_type='customer', object_id=4, photo='photos/other.jpg'),
+    ])
+
+    call_command('dedupe_photos', '--dry-run')
+    assert f"reclaiming {len(data)} bytes" in capsys.readouterr().out
+    assert not PhotoBlob.objects.exists()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        call_command('dedupe_photos', '--workers', '2')
+
+    assert f"reclaimed {len(data)} bytes" in capsys.readouterr().out
+    assert Photo.objects.values('photo').distinct().count() == 2
+    assert not Photo.objects.exclude(photo__startswith='blobs/').exists()
+    assert sorted(PhotoBlob.objects.values_list('ref_count', flat=True)) == [1, 3]
+    assert not list((media / 'photos').iterdir())
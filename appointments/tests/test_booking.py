@@ -0,0 +1,139 @@
+import threading
+from datetime import date, time
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from appointments.exceptions import BookingConflict
+from appointments.models import Appointment
+from .factories import AppointmentFactory, CustomerFactory, TechnicianFactory, UserFactory
+
+DAY = date(2025, 6, 3)
+
+
+def appointment(technician, start_hour, end_hour, day=DAY, **kwargs):
+    return Appointment(
+        customer=kwargs.pop('customer', None) or CustomerFactory(),
+        technician=technician,
+        appointment_date=day,
+        start_time=time(start_hour),
+        end_time=time(end_hour),
+        description='Service call',
+        **kwargs
+    )
+
+
+@pytest.mark.django_db
+class TestDoubleBooking:
+    def test_overlapping_booking_is_rejected(self):
+        """Test that a second overlapping appointment for a technician is refused."""
+        technician = TechnicianFactory()
+        first = AppointmentFactory(technician=technician, appointment_date=DAY, start_time=time(9), end_time=time(11))
+
+        with pytest.raises(BookingConflict) as excinfo:
+            appointment(technician, 10, 12).save()
+        assert excinfo.value.competing == first
+
+    def test_adjacent_cancelled_and_other_technicians_are_allowed(self):
+        """Test that touching, cancelled and other technicians' appointments do not conflict."""
+        technician = TechnicianFactory()
+        AppointmentFactory(technician=technician, appointment_date=DAY, start_time=time(9), end_time=time(11))
+        AppointmentFactory(technician=technician, appointment_date=DAY, start_time=time(11), end_time=time(12), status='cancelled')
+
+        appointment(technician, 11, 12).save()
+        appointment(TechnicianFactory(), 9, 11).save()
+        appointment(technician, 9, 11, status='cancelled').save()
+
+    def test_overnight_appointment_blocks_next_morning(self):
+        """Test that an appointment running past midnight conflicts with the next morning."""
+        technician = TechnicianFactory()
+        AppointmentFactory(technician=technician, appointment_date=DAY, start_time=time(22), end_time=time(2))
+
+        with pytest.raises(BookingConflict):
+            appointment(technician, 1, 3, day=date(2025, 6, 4)).save()
+
+    def test_rescheduling_does_not_conflict_with_itself(self):
+        """Test that updating an appointment ignores its own previous time."""
+        booked = AppointmentFactory(technician=TechnicianFactory(), appointment_date=DAY, start_time=time(9), end_time=time(11))
+        booked.end_time = time(12)
+        booked.save()
+
+    def test_api_returns_409_with_competing_appointment(self):
+        """Test that the API reports a double-booking as a structured 409."""
+        client = APIClient()
+        client.force_authenticate(user=UserFactory())
+        technician = TechnicianFactory()
+        first = AppointmentFactory(technician=technician, appointment_date=DAY, start_time=time(9), end_time=time(11))
+
+        response = client.post(reverse('appointment-list'), {
+            'customer_id': CustomerFactory().id,
+            'technician_id': technician.id,
+            'appointment_date': '2025-06-03',
+            'start_time': '10:00:00',
+            'end_time': '10:30:00',
+            'description': 'Second booking',
+        }, format='json')
+
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert response.data['code'] == 'booking_conflict'
+        assert response.data['competing_appointment']['id'] == first.id
+
+    def test_bulk_create_rejects_overlaps_within_batch(self):
+        """Test that a bulk batch cannot double-book a technician against itself."""
+        technician = TechnicianFactory()
+        customer = CustomerFactory()
+        with pytest.raises(BookingConflict):
+            Appointment.bulk_create_with_bills([
+                appointment(technician, 9, 11, customer=customer),
+                appointment(technician, 10, 12, customer=customer),
+            ])
+        assert not Appointment.objects.exists()
+
+
+@pytest.mark.django_db
+def test_technician_is_locked_in_the_database_before_the_overlap_check():
+    """Test that booking locks the technician in the database, so the lock holds across processes until commit."""
+    technician = TechnicianFactory()
+    customer = CustomerFactory()
+    with CaptureQueriesContext(connection) as ctx:
+        appointment(technician, 9, 10, customer=customer).save()
+
+    statements = [query['sql'] for query in ctx.captured_queries]
+    lock = {'postgresql': 'pg_advisory_xact_lock', 'sqlite': 'UPDATE "appointments_technician"'}.get(
+        connection.vendor, 'FOR UPDATE')
+    first_lock = next(index for index, sql in enumerate(statements) if lock in sql)
+    first_check = next(index for index, sql in enumerate(statements) if 'FROM "appointments_appointment"' in sql)
+    assert first_lock < first_check
+
+
+@pytest.mark.django_db(transaction=True)
+def test_parallel_bookings_for_one_slot_have_one_winner():
+    """Test that many concurrent bookings of the same slot produce exactly one appointment."""
+    technician = TechnicianFactory()
+    customer = CustomerFactory()
+    attempts = 8
+    barrier = threading.Barrier(attempts)
+    outcomes = []
+
+    def book():
+        try:
+            barrier.wait()
+            appointment(technician, 9, 10, customer=customer).save()
+            outcomes.append('booked')
+        except BookingConflict:
+            outcomes.append('conflict')
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=book) for _ in range(attempts)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(outcomes) == ['booked'] + ['conflict'] * (attempts - 1)
+    assert Appointment.objects.filter(technician=technician).count() == 1
@@ -0,0 +1,135 @@
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from appointments.models import Customer
+from .factories import AppointmentFactory, CustomerFactory, PhotoFactory, UserFactory
+
+
+@pytest.mark.django_db
+class TestConditionalGet:
+    def setup_method(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=UserFactory())
+
+    def test_detail_not_modified(self, django_assert_num_queries):
+        """Test that a matching If-None-Match gets a 304 without serializing."""
+        customer = CustomerFactory()
+        url = reverse('customer-detail', kwargs={'pk': customer.id})
+        first = self.client.get(url)
+        assert first['ETag'] and first['Last-Modified']
+        assert 'no-cache' in first['Cache-Control']
+
+        # The object query only; photos are not loaded for a 304
+        with django_assert_num_queries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response['ETag'] == first['ETag']
+
+    def test_nested_change_moves_the_etag(self):
+        """Test that editing a rendered relation changes the parent's ETag."""
+        appointment = AppointmentFactory()
+        url = reverse('appointment-detail', kwargs={'pk': appointment.id})
+        etag = self.client.get(url)['ETag']
+
+        customer = appointment.customer
+        customer.first_name = 'Changed'
+        customer.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response['ETag'] != etag
+
+    def test_list_not_modified_with_one_query(self, django_assert_num_queries):
+        """Test that an unchanged list is answered from the probe query alone."""
+        CustomerFactory.create_batch(3)
+        url = reverse('customer-list')
+        etag = self.client.get(url)['ETag']
+
+        with django_assert_num_queries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert 'Last-Modified' not in response
+
+    def test_list_etag_changes_on_delete(self):
+        """Test that deleting a row changes the list ETag."""
+        customers = CustomerFactory.create_batch(3)
+        url = reverse('customer-list')
+        etag = self.client.get(url)['ETag']
+
+        Customer.objects.filter(pk=customers[0].pk).delete()
+
+        assert self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_200_OK
+
+    def test_photo_changes_move_the_owner_etag(self):
+        """Test that adding a photo changes the ETag of the object that shows it."""
+        customer = CustomerFactory()
+        url = reverse('customer-detail', kwargs={'pk': customer.id})
+        etag = self.client.get(url)['ETag']
+
+        PhotoFactory(content_type='customer', object_id=customer.id)
+
+        assert self.client.get(url)['ETag'] != etag
+
+    def test_user_name_changes_move_the_technician_etags(self):
+        """Test that renaming a technician's user changes the technician and appointment ETags, but a login does not."""
+        appointment = AppointmentFactory()
+        user = appointment.technician.user
+        urls = [reverse('technician-detail', kwargs={'pk': appointment.technician_id}),
+                reverse('appointment-detail', kwargs={'pk': appointment.id}), reverse('technician-list')]
+        etags = [self.client.get(url)['ETag'] for url in urls]
+
+        user.save(update_fields=['last_login'])
+        assert [self.client.get(url)['ETag'] for url in urls] == etags
+
+        user.last_name = 'Renamed'
+        user.save()
+        for url, etag in zip(urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            assert response.status_code == status.HTTP_200_OK
+            assert response['ETag'] != etag
+
+
+@pytest.mark.django_db
+class TestWritePreconditions:
+    def setup_method(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=UserFactory())
+        self.customer = CustomerFactory()
+        self.url = reverse('customer-detail', kwargs={'pk': self.customer.id})
+
+    def payload(self, first_name):
+        return {
+            'first_name': first_name,
+            'last_name': self.customer.last_name,
+            'email': self.customer.email,
+            'phone': self.customer.phone,
+            'address': self.customer.address,
+        }
+
+    def test_stale_if_match_is_rejected(self):
+        """Test that a write based on an outdated copy gets 412 and changes nothing."""
+        etag = self.client.get(self.url)['ETag']
+        assert self.client.put(self.url, self.payload('First'), HTTP_IF_MATCH=etag).status_code == status.HTTP_200_OK
+
+        response = self.client.put(self.url, self.payload('Second'), HTTP_IF_MATCH=etag)
+
+        assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
+        self.customer.refresh_from_db()
+        assert self.customer.first_name == 'First'
+
+    def test_current_if_match_is_accepted(self):
+        """Test that a write with the current ETag goes through."""
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.patch(self.url, {'first_name': 'Jane'}, HTTP_IF_MATCH=etag)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['first_name'] == 'Jane'
+
+    def test_writes_without_preconditions_are_unchanged(self):
+        """Test that clients that send no If-Match keep last-write-wins."""
+        response = self.client.put(self.url, self.payload('Jane'))
+
+        assert response.status_code == status.HTTP_200_OK
@@ -0,0 +1,103 @@
+from datetime import time, timedelta
+from decimal import Decimal
+
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from appointments import dashboard
+from appointments.models import Bill, BillLineItem
+from .factories import AppointmentFactory, BillFactory, UserFactory
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def bill_with_total(amount, **kwargs):
+    bill = BillFactory(appointment=None, customer=None, **kwargs)
+    BillLineItem.objects.create(bill=bill, description='Work', quantity=1, unit_price=amount, is_taxable=False)
+    return bill
+
+
+@pytest.mark.django_db
+class TestDashboardSummary:
+    def test_figures(self):
+        """Test that counts and money figures come out of the aggregates correctly."""
+        today = timezone.localdate()
+        AppointmentFactory(appointment_date=today, start_time=time(9), end_time=time(10), priority='high')
+        AppointmentFactory(appointment_date=today, start_time=time(11), end_time=time(12), status='cancelled')
+        AppointmentFactory(appointment_date=today + timedelta(days=1), start_time=time(9), end_time=time(10),
+                           status='completed', priority='low')
+        Bill.objects.all().delete()  # the appointments' draft bills
+        bill_with_total(Decimal('100.00'), status='sent', due_date=today + timedelta(days=10))
+        bill_with_total(Decimal('40.00'), status='sent', due_date=today - timedelta(days=1))
+        bill_with_total(Decimal('25.50'), status='overdue')
+        bill_with_total(Decimal('60.00'), status='paid')
+        bill_with_total(Decimal('999.00'), status='paid', type='estimate')
+
+        data = dashboard.summary(today)
+
+        assert data['appointments']['total'] == 3
+        assert data['appointments']['today'] == 1
+        assert data['appointments']['by_status'] == {
+            'scheduled': 1, 'in_progress': 0, 'completed': 1, 'cancelled': 1,
+        }
+        assert data['appointments']['by_priority'] == {'low': 1, 'medium': 1, 'high': 1, 'emergency': 0}
+        assert data['bills']['outstanding'] == {'count': 3, 'total': '165.50'}
+        assert data['bills']['overdue'] == {'count': 2, 'total': '65.50'}
+        assert data['revenue'] == {'last_7_days': '60.00', 'last_30_days': '60.00', 'last_365_days': '60.00'}
+
+    def test_repeated_loads_hit_the_cache(self, django_assert_num_queries):
+        """Test that a cached summary costs no queries."""
+        dashboard.cached_summary()
+        with django_assert_num_queries(0):
+            dashboard.cached_summary()
+
+    def test_model_changes_invalidate_after_commit(self, django_capture_on_commit_callbacks):
+        """Test that saving or deleting appointments, bills and line items drops the cached summary."""
+        assert dashboard.cached_summary()['appointments']['total'] == 0
+
+        with django_capture_on_commit_callbacks(execute=True):
+            appointment = AppointmentFactory(start_time=time(9), end_time=time(10))
+        assert dashboard.cached_summary()['appointments']['total'] == 1
+
+        bill = Bill.objects.get(appointment=appointment)
+        with django_capture_on_commit_callbacks(execute=True):
+            item = BillLineItem.objects.create(
+                bill=bill, description='Part', quantity=2, unit_price=Decimal('10.00'), is_taxable=False
+            )
+            Bill.objects.filter(pk=bill.pk).update(status='sent')
+        assert dashboard.cached_summary()['bills']['outstanding']['total'] == '20.00'
+
+        with django_capture_on_commit_callbacks(execute=True):
+            item.delete()
+        assert dashboard.cached_summary()['bills']['outstanding']['total'] == '0.00'
+
+    def test_uncommitted_changes_keep_the_cache(self, django_capture_on_commit_callbacks):
+        """Test that invalidation waits for the transaction to commit."""
+        dashboard.cached_summary()
+        with django_capture_on_commit_callbacks() as callbacks:
+            AppointmentFactory(start_time=time(9), end_time=time(10))
+        assert callbacks
+        assert dashboard.cached_summary()['appointments']['total'] == 0
+
+
+@pytest.mark.django_db
+def test_summary_endpoint():
+    """Test that the endpoint returns the summary."""
+    client = APIClient()
+    client.force_authenticate(user=UserFactory())
+
+    response = client.get(reverse('dashboard-summary'))
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['appointments']['total'] == 0
+    assert response.data['revenue']['last_30_days'] == '0.00'
+    assert response.data['date'] == timezone.localdate()
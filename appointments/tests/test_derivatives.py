@@ -0,0 +1,97 @@
+import io
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from appointments import derivatives, imaging
+from appointments.models import AppointmentPhoto, Photo
+from .conftest import jpeg
+from .factories import AppointmentFactory, CustomerFactory, UserFactory
+
+ROTATE_90 = 6  # EXIF orientation: rotate 90 degrees clockwise to display
+
+
+def test_render_applies_orientation_and_strips_exif():
+    """Test that derivatives are upright, bounded by their size and carry no EXIF."""
+    images = imaging.render(jpeg(orientation=ROTATE_90), [('thumbnail', 320), ('medium', 1280)])
+
+    with Image.open(io.BytesIO(images['thumbnail'])) as thumbnail:
+        assert thumbnail.format == 'WEBP'
+        assert thumbnail.size == (160, 320)
+        assert not thumbnail.getexif()
+    with Image.open(io.BytesIO(images['medium'])) as medium:
+        assert medium.size == (640, 1280)
+
+
+def test_render_does_not_enlarge():
+    """Test that images smaller than a size keep their dimensions."""
+    images = imaging.render(jpeg(200, 100), [('thumbnail', 320)], image_format='JPEG')
+
+    with Image.open(io.BytesIO(images['thumbnail'])) as thumbnail:
+        assert (thumbnail.format, thumbnail.size) == ('JPEG', (200, 100))
+
+
+@pytest.mark.django_db
+class TestDerivatives:
+    def test_upload_generates_derivatives_after_commit(self, media, django_capture_on_commit_callbacks):
+        """Test that an uploaded photo gets thumbnail and medium URLs once the upload commits."""
+        client = APIClient()
+        client.force_authenticate(user=UserFactory())
+        customer = CustomerFactory()
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.post(reverse('photo-upload'), {
+                'content_type': 'customer',
+                'object_id': customer.id,
+                'photo': SimpleUploadedFile('site.jpg', jpeg(), content_type='image/jpeg'),
+            }, format='multipart')
+        assert response.status_code == status.HTTP_201_CREATED
+
+        data = client.get(reverse('photo-detail', kwargs={'pk': response.data['id']})).data
+        assert data['thumbnail_url'].endswith('_thumbnail.webp')
+        assert data['medium_url'].endswith('_medium.webp')
+
+    def test_appointment_photos_get_derivatives(self, media, django_capture_on_commit_callbacks):
+        """Test that appointment photos are processed like generic photos."""
+        with django_capture_on_commit_callbacks(execute=True):
+            photo = AppointmentPhoto.objects.create(
+                appointment=AppointmentFactory(), photo=ContentFile(jpeg(), name='job.jpg')
+            )
+
+        photo.refresh_from_db()
+        with Image.open(photo.thumbnail.path) as thumbnail:
+            assert max(thumbnail.size) == 320
+
+    def test_replaced_photo_discards_stale_derivatives(self, media):
+        """Test that derivatives rendered from an image that was replaced meanwhile are not stored."""
+        photo = Photo.objects.create(content_type='customer', object_id=1, photo=ContentFile(jpeg(), name='a.jpg'))
+        images = imaging.render(*derivatives.render_args(jpeg()))
+        stale = Photo.objects.get(pk=photo.pk)
+        Photo.objects.filter(pk=photo.pk).update(photo='photos/b.jpg')
+
+        assert derivatives.store(stale, images) is False
+        assert not Photo.objects.get(pk=photo.pk).thumbnail
+        assert not list(media.glob('photos/*_thumbnail.webp'))
+
+    def test_backfill_command(self, media):
+        """Test that process_photos fills in missing derivatives through the process pool."""
+        photos = [
+            Photo(content_type='customer', object_id=1, photo=f'photos/old{n}.jpg') for n in range(3)
+        ]
+        (media / 'photos').mkdir()
+        for photo in photos:
+            (media / photo.photo.name).write_bytes(jpeg(orientation=ROTATE_90))
+        Photo.objects.bulk_create(photos)
+
+        call_command('process_photos', '--workers', '2', '--batch-size', '2')
+
+        for photo in Photo.objects.all():
+            with Image.open(photo.thumbnail.path) as thumbnail:
+                assert thumbnail.size == (160, 320)
+            assert photo.medium
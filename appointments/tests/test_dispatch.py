@@ -0,0 +1,256 @@
+import random
+import time as clock
+from datetime import date, time
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from appointments import availability, dispatch
+from appointments.models import Appointment, Customer, Technician
+from .factories import AppointmentFactory, CustomerFactory, TechnicianFactory, UserFactory
+
+User = get_user_model()
+TUESDAY = date(2025, 6, 3)
+PORTLAND = (Decimal('43.661471'), Decimal('-70.255326'))
+BANGOR = (Decimal('44.801182'), Decimal('-68.777814'))
+
+
+@pytest.fixture(autouse=True)
+def empty_index():
+    availability.index.clear()
+    yield
+    availability.index.clear()
+
+
+def technician_at(location, **kwargs):
+    return TechnicianFactory(home_latitude=location[0], home_longitude=location[1], **kwargs)
+
+
+def job(location, start_hour, end_hour, technician=None, **kwargs):
+    customer = CustomerFactory(latitude=location[0], longitude=location[1])
+    return AppointmentFactory(
+        customer=customer,
+        technician=technician,
+        appointment_date=TUESDAY,
+        start_time=time(start_hour),
+        end_time=time(end_hour),
+        **kwargs
+    )
+
+
+def assigned(plan):
+    return {item['appointment_id']: item['technician_id'] for item in plan['assignments']}
+
+
+def test_distance_matrix_is_symmetric_great_circle_distance():
+    """Test that the vectorized matrix matches the known Portland-Bangor distance."""
+    matrix = dispatch.distance_matrix([PORTLAND[0], BANGOR[0]], [PORTLAND[1], BANGOR[1]])
+    assert matrix[0][0] == 0
+    assert matrix[0][1] == pytest.approx(matrix[1][0])
+    assert matrix[0][1] == pytest.approx(173, abs=2)
+
+
+@pytest.mark.django_db
+class TestPlanDispatch:
+    def test_jobs_go_to_the_nearest_technician(self):
+        """Test that each job is assigned to the technician with the shortest drive."""
+        portland_tech = technician_at(PORTLAND)
+        bangor_tech = technician_at(BANGOR)
+        portland_job = job(PORTLAND, 9, 10)
+        bangor_job = job(BANGOR, 9, 10)
+
+        plan = dispatch.plan_dispatch(TUESDAY)
+
+        assert assigned(plan) == {portland_job.id: portland_tech.id, bangor_job.id: bangor_tech.id}
+        assert plan['unassigned'] == []
+        assert plan['total_travel_km'] < 1
+
+    def test_required_skills_are_honored(self):
+        """Test that jobs only go to technicians holding every required skill."""
+        technician_at(PORTLAND)
+        electrician = technician_at(BANGOR, skills=['electrical'])
+        wiring = job(PORTLAND, 9, 10, required_skills=['electrical'])
+        gas = job(PORTLAND, 11, 12, required_skills=['gas'])
+
+        plan = dispatch.plan_dispatch(TUESDAY)
+
+        assert assigned(plan) == {wiring.id: electrician.id}
+        assert plan['unassigned'] == [{'appointment_id': gas.id, 'reason': 'no_qualified_technician'}]
+
+    def test_drive_time_and_existing_bookings_are_respected(self):
+        """Test that back-to-back jobs too far apart, or overlapping a booking, are not combined."""
+        technician = technician_at(PORTLAND)
+        job(PORTLAND, 13, 14, technician=technician)
+        first = job(PORTLAND, 9, 10)
+        too_far = job(BANGOR, 10, 11)
+        overlapping = job(PORTLAND, 13, 15)
+
+        plan = dispatch.plan_dispatch(TUESDAY)
+
+        assert assigned(plan) == {first.id: technician.id}
+        assert {item['appointment_id'] for item in plan['unassigned']} == {too_far.id, overlapping.id}
+
+    def test_higher_priority_jobs_win_contested_slots(self):
+        """Test that an emergency job is placed before a low-priority one in the same slot."""
+        technician = technician_at(PORTLAND)
+        low = job(PORTLAND, 9, 10, priority='low')
+        emergency = job(BANGOR, 9, 10, priority='emergency')
+
+        plan = dispatch.plan_dispatch(TUESDAY)
+
+        assert assigned(plan) == {emergency.id: technician.id}
+        assert plan['unassigned'] == [{'appointment_id': low.id, 'reason': 'no_feasible_slot'}]
+
+    def test_jobs_outside_working_hours_are_not_assigned(self):
+        """Test that jobs outside the default working hours are left unassigned."""
+        technician_at(PORTLAND)
+        late = job(PORTLAND, 19, 20)
+
+        plan = dispatch.plan_dispatch(TUESDAY)
+
+        assert plan['assignments'] == []
+        assert plan['unassigned'] == [{'appointment_id': late.id, 'reason': 'no_feasible_slot'}]
+
+    def test_missing_locations_are_reported(self):
+        """Test that jobs without customer coordinates are still planned but flagged."""
+        technician = technician_at(PORTLAND)
+        unknown = job((None, None), 9, 10)
+
+        plan = dispatch.plan_dispatch(TUESDAY)
+
+        assert assigned(plan) == {unknown.id: technician.id}
+        assert plan['missing_locations'] == [unknown.id]
+
+    def test_five_hundred_jobs_plan_quickly(self):
+        """Test that a 500-job day with 40 technicians is planned within a few seconds."""
+        rng = random.Random(7)
+        users = User.objects.bulk_create([User(username=f'tech{n}') for n in range(40)])
+        technicians = Technician.objects.bulk_create([
+            Technician(user=user, phone='1',
+                       home_latitude=Decimal('43.5') + Decimal(rng.randint(0, 1500)) / 1000,
+                       home_longitude=Decimal('-70.5') + Decimal(rng.randint(0, 2000)) / 1000)
+            for user in users
+        ])
+        customers = Customer.objects.bulk_create([
+            Customer(first_name='C', last_name=str(n), email=f'c{n}@example.com', phone='1', address='x',
+                     latitude=Decimal('43.5') + Decimal(rng.randint(0, 1500)) / 1000,
+                     longitude=Decimal('-70.5') + Decimal(rng.randint(0, 2000)) / 1000)
+            for n in range(500)
+        ])
+        Appointment.objects.bulk_create([
+            Appointment(customer=customer, appointment_date=TUESDAY, start_time=time(8 + n % 8),
+                        end_time=time(8 + n % 8, 30), description='Job',
+                        priority=rng.choice(['low', 'medium', 'high', 'emergency']))
+            for n, customer in enumerate(customers)
+        ])
+
+        started = clock.perf_counter()
+        plan = dispatch.plan_dispatch(TUESDAY)
+        elapsed = clock.perf_counter() - started
+
+        assert elapsed < 5
+        assert len(plan['assignments']) + len(plan['unassigned']) == 500
+        assert {route['technician_id'] for route in plan['routes']} <= {technician.id for technician in technicians}
+        for route in plan['routes']:
+            visits = route['visits']
+            for previous, visit in zip(visits, visits[1:]):
+                # Every leg leaves enough time to drive to the next visit
+                gap = (visit['start'] - previous['end']).total_seconds() / 60
+                assert gap >= visit['travel_minutes'] - 0.1
+
+
+@pytest.mark.django_db
+class TestDispatchAPI:
+    def setup_method(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=UserFactory())
+        self.url = reverse('appointment-dispatch-plan')
+
+    def test_preview_does_not_assign(self):
+        """Test that GET returns the proposal without changing any appointment."""
+        technician = technician_at(PORTLAND)
+        pending = job(PORTLAND, 9, 10)
+
+        response = self.client.get(self.url, {'date': '2025-06-03'})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['assignments'][0]['appointment_id'] == pending.id
+        assert response.data['assignments'][0]['technician_id'] == technician.id
+        pending.refresh_from_db()
+        assert pending.technician_id is None
+
+    def test_apply_computed_plan(self):
+        """Test that POST with only a date computes and applies the plan."""
+        technician = technician_at(PORTLAND)
+        pending = job(PORTLAND, 9, 10)
+
+        response = self.client.post(self.url, {'date': '2025-06-03'}, format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['applied'] == [{'appointment_id': pending.id, 'technician_id': technician.id}]
+        pending.refresh_from_db()
+        assert pending.technician_id == technician.id
+
+    def test_apply_previewed_assignments(self):
+        """Test that the assignments from a preview can be posted back as-is."""
+        technician_at(PORTLAND)
+        pending = job(PORTLAND, 9, 10)
+        preview = self.client.get(self.url, {'date': '2025-06-03'}).data
+
+        response = self.client.post(self.url, {'assignments': preview['assignments']}, format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+        pending.refresh_from_db()
+        assert pending.technician_id == preview['assignments'][0]['technician_id']
+
+    def test_apply_rejects_stale_assignments(self):
+        """Test that assignments for appointments that were assigned meanwhile are refused."""
+        technician = technician_at(PORTLAND)
+        taken = job(PORTLAND, 9, 10, technician=technician)
+
+        response = self.client.post(self.url, {
+            'assignments': [{'appointment_id': taken.id, 'technician_id': technician.id}]
+        }, format='json')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_apply_reports_double_booking(self):
+        """Test that applying an assignment that double-books a technician returns 409."""
+        technician = technician_at(PORTLAND)
+        job(PORTLAND, 9, 11, technician=technician)
+        pending = job(PORTLAND, 10, 12)
+
+        response = self.client.post(self.url, {
+            'assignments': [{'appointment_id': pending.id, 'technician_id': technician.id}]
+        }, format='json')
+
+        assert response.status_code == status.HTTP_409_CONFLICT
+
+    def test_date_is_required(self):
+        """Test that a missing or malformed date is a 400."""
+        assert self.client.get(self.url).status_code == status.HTTP_400_BAD_REQUEST
+        assert self.client.get(self.url, {'date': 'tuesday'}).status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_apply_does_not_overwrite_an_assignment_made_after_the_plan(self, monkeypatch):
+        """Test that a job assigned by hand between the check and the UPDATE keeps its technician."""
+        planned, other = technician_at(PORTLAND), technician_at(BANGOR)
+        pending = job(PORTLAND, 9, 10)
+        preview = self.client.get(self.url, {'date': '2025-06-03'}).data
+        booking = dispatch.booking
+
+        def assigned_meanwhile(appointments):
+            Appointment.objects.filter(pk=pending.pk).update(technician=other)
+            return booking(appointments)
+        monkeypatch.setattr(dispatch, 'booking', assigned_meanwhile)
+
+        response = self.client.post(self.url, {'assignments': preview['assignments']}, format='json')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert str(pending.id) in str(response.data['assignments'])
+        # The hand assignment shares the test's connection, so it is rolled back with the refused apply
+        pending.refresh_from_db()
+        assert pending.technician_id != planned.id
@@ -0,0 +1,164 @@
+import csv
+import datetime
+import io
+import json
+from decimal import Decimal
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from appointments.models import Bill
+from .factories import (
+    AppointmentFactory, BillFactory, BillLineItemFactory, SettingsFactory, TechnicianFactory, UserFactory,
+)
+
+
+def read_csv(content):
+    return list(csv.DictReader(io.StringIO(content.decode())))
+
+
+def read_ndjson(content):
+    return [json.loads(line) for line in content.decode().splitlines()]
+
+
+@pytest.mark.django_db
+class TestExports:
+    def setup_method(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=UserFactory())
+
+    def export(self, name, params=None):
+        response = self.client.get(reverse(f'export-{name}'), params or {})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.streaming
+        return response, b''.join(response.streaming_content)
+
+    def test_line_items_carry_amount_and_share_of_tax(self):
+        SettingsFactory(id=1, sales_tax_rate=Decimal('0.10'))
+        bill = BillFactory(status='sent')
+        part = BillLineItemFactory(bill=bill, quantity=Decimal('2'), unit_price=Decimal('10.25'))
+        labor = BillLineItemFactory(bill=bill, quantity=Decimal('1.5'), unit_price=Decimal('50.00'),
+                                    is_labor=True, is_taxable=False, technician=bill.appointment.technician)
+
+        response, content = self.export('line-items', {'status': 'sent'})
+        assert response['Content-Type'] == 'text/csv; charset=utf-8'
+        assert response['Content-Disposition'] == 'attachment; filename="line_items.csv"'
+        rows = {int(row['id']): row for row in read_csv(content)}
+        # Plus the bill's default labor line
+        assert {part.id, labor.id} < set(rows)
+        assert (rows[part.id]['amount'], rows[part.id]['tax'], rows[part.id]['is_taxable']) == ('20.50', '2.05', 'true')
+        assert (rows[labor.id]['amount'], rows[labor.id]['tax']) == ('75.00', '0.00')
+        assert rows[labor.id]['technician_name'] == bill.appointment.technician.user.get_full_name()
+
+    def test_bills_as_ndjson_filtered_by_date_status_and_technician(self):
+        technician = TechnicianFactory()
+        day = datetime.date(2025, 3, 3)
+        paid, draft, old = [
+            BillFactory(status=bill_status, appointment=AppointmentFactory(
+                technician=technician, appointment_date=day + datetime.timedelta(days=offset),
+                start_time=datetime.time(9), end_time=datetime.time(10)))
+            for offset, bill_status in enumerate(['paid', 'draft', 'paid'])
+        ]
+        BillFactory(status='paid')
+        Bill.objects.filter(pk=old.pk).update(created_at=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc))
+
+        today = paid.created_at.date().isoformat()
+        response, content = self.export('bills', {
+            'output': 'ndjson', 'status': 'paid,overdue', 'technician': technician.id, 'start': today, 'end': today,
+        })
+        assert response['Content-Type'] == 'application/x-ndjson'
+        [record] = read_ndjson(content)
+        paid.refresh_from_db()
+        assert record['id'] == paid.id
+        assert record['technician_id'] == technician.id
+        assert record['total'] == str(paid.total)
+        assert record['created_at'].endswith('Z')
+
+    def test_appointments_guard_formulas_and_join_skills(self):
+        appointment = AppointmentFactory(description='=HYPERLINK("http://example.com")',
+                                         required_skills=['hvac', 'electrical'],
+                                         appointment_date=datetime.date(2025, 3, 4))
+        AppointmentFactory(appointment_date=datetime.date(2025, 4, 1))
+
+        _, content = self.export('appointments', {'start': '2025-03-01', 'end': '2025-03-31'})
+        [row] = read_csv(content)
+        assert row['id'] == str(appointment.id)
+        assert row['description'] == '\'=HYPERLINK("http://example.com")'
+        assert row['required_skills'] == 'hvac; electrical'
+        assert row['appointment_date'] == '2025-03-04'
+
+    def test_query_count_does_not_grow_with_rows(self, settings):
+        settings.EXPORT_CHUNK_SIZE = 2
+        for bill in BillFactory.create_batch(5):
+            BillLineItemFactory.create_batch(2, bill=bill)
+
+        for name in ('bills', 'line-items', 'appointments'):
+            with CaptureQueriesContext(connection) as ctx:
+                _, content = self.export(name, {'output': 'ndjson'})
+            assert len(read_ndjson(content)) >= 5
+            assert len(ctx.captured_queries) == 1, [query['sql'] for query in ctx.captured_queries]
+
+    @pytest.mark.parametrize('params', [
+        {'output': 'xlsx'}, {'start': '2025-13-01'}, {'start': '2025-02-01', 'end': '2025-01-01'},
+        {'technician': 'bob'},
+    ])
+    def test_invalid_params(self, params):
+        response = self.client.get(reverse('export-bills'), params)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_requires_authentication(self):
+        response = APIClient().get(reverse('export-bills'))
+        assert response.status_code in (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('url', [reverse('export-line-items'), reverse('sync-list')])
+def test_streams_chunk_by_chunk_over_asgi(settings, url):
+    """Test that under ASGI the response is an async stream rather than a body read into memory first."""
+    settings.EXPORT_CHUNK_SIZE = 2
+    for bill in BillFactory.create_batch(3):
+        BillLineItemFactory(bill=bill)
+    headers = {'Authorization': f'Token {Token.objects.create(user=UserFactory()).key}'}
+
+    async def fetch(client):
+        response = await client.get(url, headers=headers)
+        return response, b''.join([chunk async for chunk in response.streaming_content])
+
+    response, content = async_to_sync(fetch)(AsyncClient())
+    assert response.status_code == status.HTTP_200_OK
+    assert response.is_async
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=headers['Authorization'])
+    expected = b''.join(client.get(url).streaming_content)
+    if url == reverse('sync-list'):
+        # The token is minted per request
+        content, expected = json.loads(content), json.loads(expected)
+        content.pop('token'), expected.pop('token')
+    assert content == expected
+
+
+@pytest.mark.django_db
+def test_export_records_command(tmp_path):
+    bill = BillFactory(status='sent')
+    BillLineItemFactory(bill=bill)
+    lines = list(bill.line_items.all())
+    path = tmp_path / 'line_items.ndjson'
+
+    out = io.StringIO()
+    call_command('export_records', 'line_items', '--format', 'ndjson', '--status', 'sent',
+                 '--output', str(path), stdout=out)
+    assert {record['id'] for record in read_ndjson(path.read_bytes())} == {line.id for line in lines}
+    assert f'Exported {len(lines)} rows' in out.getvalue()
+
+    out, err = io.StringIO(), io.StringIO()
+    call_command('export_records', 'bills', '--status', 'sent', stdout=out, stderr=err)
+    assert [row['id'] for row in read_csv(out.getvalue().encode())] == [str(bill.id)]
+    assert 'Exported 1 rows' in err.getvalue()
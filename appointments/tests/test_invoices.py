@@ -0,0 +1,164 @@
+import io
+import os
+import re
+import zipfile
+import zlib
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from appointments import invoice_pdf, invoices
+from appointments.models import Bill, Settings
+from .factories import BillFactory, BillLineItemFactory
+
+
+def page_text(pdf):
+    """The decompressed content streams of a PDF, one per page."""
+    streams = re.findall(rb'stream\n(.*?)\nendstream', pdf, re.S)
+    return [zlib.decompress(stream).decode('cp1252') for stream in streams]
+
+
+@pytest.fixture(autouse=True)
+def cache(settings, tmp_path):
+    settings.INVOICE_CACHE_DIR = str(tmp_path / 'invoices')
+    return tmp_path / 'invoices'
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    calls = []
+    render = invoice_pdf.render
+
+    def counting_render(invoice):
+        calls.append(invoice['title'])
+        return render(invoice)
+    monkeypatch.setattr(invoice_pdf, 'render', counting_render)
+    return calls
+
+
+def test_render_paginates_long_invoices():
+    """Test that rows that do not fit on a page continue on the next, with the table heading repeated."""
+    invoice = {
+        'title': 'Bill #7',
+        'fields': [('Customer', 'Ada (Lovelace)')],
+        'items': [(f'Part {n}', 'P-1', '1', '$1.00', '$1.00') for n in range(80)],
+        'totals': [('Total', '$80.00')],
+    }
+
+    pdf = invoice_pdf.render(invoice)
+
+    assert pdf.startswith(b'%PDF-1.4') and pdf.endswith(b'%%EOF\n')
+    assert b'/Count 2' in pdf
+    first, second = page_text(pdf)
+    assert '(Customer: Ada \\(Lovelace\\))' in first and '(Part 0)' in first
+    assert '(Unit Price)' in second and '(Part 79)' in second and '($80.00)' in second
+
+
+def test_wrap_breaks_long_text():
+    lines = invoice_pdf.wrap('word ' * 30 + 'x' * 80, 100, 10)
+
+    assert len(lines) > 3
+    assert all(invoice_pdf.text_width(line, 10) <= 100 for line in lines)
+
+
+@pytest.mark.django_db
+class TestInvoicePDF:
+    def setup_method(self):
+        self.client = APIClient()
+        self.bill = BillFactory()
+        self.item = BillLineItemFactory(bill=self.bill, description='Compressor', quantity=2, unit_price=Decimal('50'))
+        self.url = reverse('bill-pdf', kwargs={'pk': self.bill.pk})
+
+    def test_pdf_is_rendered_once(self, renders):
+        """Test that the PDF shows the bill and a second request is served from the cache."""
+        response = self.client.get(self.url)
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Type'] == 'application/pdf'
+        text = page_text(b''.join(response.streaming_content))[0]
+        assert f'(Bill #{self.bill.pk})' in text and '(Compressor)' in text and '($100.00)' in text
+
+        again = self.client.get(self.url)
+        assert b''.join(again.streaming_content).startswith(b'%PDF')
+        assert renders == [f'Bill #{self.bill.pk}']
+        assert self.client.get(self.url, HTTP_IF_NONE_MATCH=again['ETag']).status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_edits_change_the_version(self, renders, cache):
+        """Test that a line item edit renders again and replaces the old file."""
+        first = self.client.get(self.url)['ETag']
+
+        self.item.quantity = 3
+        self.item.save()
+        second = self.client.get(self.url)['ETag']
+
+        assert first != second
+        assert len(renders) == 2
+        assert len(os.listdir(cache / str(self.bill.pk))) == 1
+
+    def test_tax_line_uses_the_rate_the_tax_was_computed_at(self, renders):
+        """Test that a Settings rate change shows on the PDF only once the bill's totals use it."""
+        Settings.objects.update_or_create(pk=1, defaults={'sales_tax_rate': Decimal('0.05')})
+        self.item.is_taxable = True
+        self.item.save()
+        first = self.client.get(self.url)
+
+        Settings.objects.filter(pk=1).update(sales_tax_rate=Decimal('0.07'))
+        unchanged = self.client.get(self.url)
+        assert unchanged['ETag'] == first['ETag']
+        text = page_text(b''.join(unchanged.streaming_content))[0]
+        assert '(Tax \(5%\))' in text and '($5.00)' in text
+
+        self.item.quantity = 3
+        self.item.save()
+        text = page_text(b''.join(self.client.get(self.url).streaming_content))[0]
+        assert '(Tax \(7%\))' in text and '($10.50)' in text
+        assert len(renders) == 2
+
+    def test_batch_returns_a_zip(self, renders):
+        """Test that the batch endpoint zips the requested bills, rendering only those not cached."""
+        other = BillFactory()
+        self.client.get(self.url)
+
+        response = self.client.post(reverse('bill-pdf-batch'), {'ids': [self.bill.pk, other.pk]}, format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as archive:
+            assert archive.namelist() == [f'Bill_{self.bill.pk}.pdf', f'Bill_{other.pk}.pdf']
+        assert renders == [f'Bill #{self.bill.pk}', f'Bill #{other.pk}']
+
+    def test_batch_is_limited(self, settings):
+        settings.INVOICE_BATCH_LIMIT = 1
+        BillFactory()
+
+        response = self.client.post(reverse('bill-pdf-batch'), {}, format='json')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_deleted_bill_drops_its_pdfs(self, cache, django_capture_on_commit_callbacks):
+        self.client.get(self.url)
+        bill_id = self.bill.pk
+        assert (cache / str(bill_id)).exists()
+
+        with django_capture_on_commit_callbacks(execute=True):
+            self.bill.delete()
+
+        assert not (cache / str(bill_id)).exists()
+
+
+@pytest.mark.django_db
+def test_render_invoices_command(tmp_path, capsys):
+    """Test that the command renders through the process pool, copies the files and skips cached bills."""
+    bills = [BillFactory(status='sent') for _ in range(3)]
+    BillFactory(status='draft')
+
+    call_command('render_invoices', '--status', 'sent', '--workers', '2', '--chunk-size', '2',
+                 '--output', str(tmp_path / 'out'))
+    assert '3 invoices ready (3 rendered, 0 cached)' in capsys.readouterr().out
+    assert sorted(os.listdir(tmp_path / 'out')) == sorted(f'Bill_{bill.pk}.pdf' for bill in bills)
+
+    call_command('render_invoices', '--status', 'sent')
+    assert '(0 rendered, 3 cached)' in capsys.readouterr().out
+    assert invoices.render_bills(Bill.objects.filter(status='sent'))[1] == 0
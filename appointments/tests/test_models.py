@@ -1,7 +1,10 @@
 import pytest
+from decimal import Decimal
+from io import StringIO
 from django.core.exceptions import ValidationError
-from appointments.models import Customer
-from .factories import CustomerFactory
+from django.core.management import call_command
+from appointments.models import Bill, Customer, Settings
+from .factories import BillFactory, BillLineItemFactory, CustomerFactory, SettingsFactory
 
 @pytest.mark.django_db
 class TestCustomerModel:
@@ -51,4 +54,72 @@ class TestCustomerModel:
                 first_name="Test",
                 last_name="Customer",
                 # phone and email are required
-            ) 
\ No newline at end of file
+            ) 
+
+
+@pytest.mark.django_db
+class TestBillTotals:
+    def test_totals_follow_line_item_changes(self):
+        """Test that stored totals are updated when line items are saved and deleted."""
+        SettingsFactory(id=1, sales_tax_rate=Decimal('0.05'))
+        bill = BillFactory()
+        part = BillLineItemFactory(bill=bill, quantity=2, unit_price=Decimal('10.00'), is_taxable=True)
+        BillLineItemFactory(bill=bill, quantity=1, unit_price=Decimal('30.00'), is_taxable=False)
+
+        bill.refresh_from_db()
+        assert bill.subtotal == Decimal('50.00')
+        assert bill.taxable_subtotal == Decimal('20.00')
+        assert bill.tax == Decimal('1.00')
+        assert bill.total == Decimal('51.00')
+
+        part.delete()
+        bill.refresh_from_db()
+        assert bill.subtotal == Decimal('30.00')
+        assert bill.tax == Decimal('0.00')
+        assert bill.total == Decimal('30.00')
+
+    def test_saving_bill_does_not_overwrite_totals(self):
+        """Test that saving a stale bill instance keeps the stored totals."""
+        bill = BillFactory()
+        stale = Bill.objects.get(pk=bill.pk)
+        BillLineItemFactory(bill=bill, quantity=1, unit_price=Decimal('12.00'), is_taxable=False)
+
+        stale.notes = 'Updated'
+        stale.save()
+        bill.refresh_from_db()
+        assert bill.notes == 'Updated'
+        assert bill.total == Decimal('12.00')
+
+    def test_rebuild_bill_totals_command(self):
+        """Test that the rebuild command recomputes totals in bulk."""
+        SettingsFactory(id=1, sales_tax_rate=Decimal('0.10'))
+        bill = BillFactory()
+        BillLineItemFactory(bill=bill, quantity=1, unit_price=Decimal('100.00'), is_taxable=True)
+        Bill.objects.update(subtotal=0, taxable_subtotal=0, tax=0, total=0)
+
+        call_command('rebuild_bill_totals', chunk_size=1, stdout=StringIO())
+        bill.refresh_from_db()
+        assert bill.subtotal == Decimal('100.00')
+        assert bill.tax == Decimal('10.00')
+        assert bill.total == Decimal('110.00')
+
+    def test_bills_keep_the_tax_rate_they_were_computed_at(self):
+        """Test that a tax rate change reaches a bill when its lines change or totals are rebuilt."""
+        SettingsFactory(id=1, sales_tax_rate=Decimal('0.05'))
+        bill = BillFactory()
+        item = BillLineItemFactory(bill=bill, quantity=1, unit_price=Decimal('100.00'), is_taxable=True)
+        other = BillFactory()
+        BillLineItemFactory(bill=other, quantity=1, unit_price=Decimal('100.00'), is_taxable=True)
+        Settings.objects.filter(pk=1).update(sales_tax_rate=Decimal('0.08'))
+
+        bill.refresh_from_db()
+        assert (bill.tax_rate, bill.tax) == (Decimal('0.0500'), Decimal('5.00'))
+
+        item.quantity = 2
+        item.save()
+        bill.refresh_from_db()
+        assert (bill.tax_rate, bill.tax, bill.total) == (Decimal('0.0800'), Decimal('16.00'), Decimal('216.00'))
+
+        call_command('rebuild_bill_totals', stdout=StringIO())
+        other.refresh_from_db()
+        assert (other.tax_rate, other.tax) == (Decimal('0.0800'), Decimal('8.00'))
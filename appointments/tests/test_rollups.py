@@ -0,0 +1,238 @@
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from appointments import rollups
+from appointments.models import BillLineItem, CustomerDailyRollup, TechnicianDailyRollup
+from .factories import BillFactory, TechnicianFactory, UserFactory
+
+
+def snapshot(model, key_field):
+    """Non-empty rollup rows as ``{(day, key): (hours, labor, parts, taxable, bills)}``."""
+    rows = {}
+    for row in model.objects.all():
+        values = (row.labor_hours, row.labor_revenue, row.parts_revenue, row.taxable_amount, row.bill_count)
+        if any(values):
+            rows[(row.day, getattr(row, key_field))] = tuple(Decimal(value) for value in values)
+    return rows
+
+
+def technician_rows():
+    return snapshot(TechnicianDailyRollup, 'technician_id')
+
+
+def customer_rows():
+    return snapshot(CustomerDailyRollup, 'customer_id')
+
+
+def line(bill, quantity, unit_price, **kwargs):
+    return BillLineItem.objects.create(
+        bill=bill, description='Line', quantity=Decimal(quantity), unit_price=Decimal(unit_price), **kwargs
+    )
+
+
+@pytest.mark.django_db
+class TestRollupMaintenance:
+    def setup_method(self):
+        self.technician = TechnicianFactory()
+        self.today = timezone.localdate()
+
+    def issued_bill(self, **kwargs):
+        kwargs.setdefault('status', 'sent')
+        bill = BillFactory(**kwargs)
+        bill.line_items.get().delete()  # drop the empty default labor line
+        return bill
+
+    def test_lines_of_issued_bills_are_rolled_up(self):
+        """Test that labor and parts lines add to the technician and customer rows."""
+        bill = self.issued_bill()
+        line(bill, '2', '50', is_labor=True, is_taxable=False, technician=self.technician)
+        line(bill, '1', '30.25', is_taxable=True)
+
+        assert technician_rows() == {
+            (self.today, self.technician.id): (Decimal('2'), Decimal('100'), Decimal('0'), Decimal('0'), 1),
+            (self.today, None): (Decimal('0'), Decimal('0'), Decimal('30.25'), Decimal('30.25'), 1),
+        }
+        assert customer_rows() == {
+            (self.today, bill.customer_id): (Decimal('2'), Decimal('100'), Decimal('30.25'), Decimal('30.25'), 1),
+        }
+
+    def test_line_edits_and_deletes_apply_deltas(self):
+        """Test that changing or deleting a line moves only the difference."""
+        bill = self.issued_bill()
+        labor = line(bill, '2', '50', is_labor=True, is_taxable=False, technician=self.technician)
+        part = line(bill, '1', '10', is_taxable=True)
+
+        labor.quantity = Decimal('3')
+        labor.save()
+        part.delete()
+
+        assert customer_rows() == {
+            (self.today, bill.customer_id): (Decimal('3'), Decimal('150'), Decimal('0'), Decimal('0'), 1),
+        }
+
+    def test_status_changes_add_and_remove_the_bill(self):
+        """Test that only issued bills count, and that status changes move them in and out."""
+        bill = BillFactory(status='draft')
+        line(bill, '1', '80', technician=self.technician)
+        assert technician_rows() == {}
+
+        bill.status = 'paid'
+        bill.save()
+        assert technician_rows()[(self.today, self.technician.id)][2] == Decimal('80')
+
+        bill.status = 'cancelled'
+        bill.save()
+        assert technician_rows() == {}
+
+    def test_deleting_a_bill_removes_it(self):
+        """Test that deleting an issued bill takes its contribution out."""
+        bill = self.issued_bill()
+        line(bill, '1', '80', technician=self.technician)
+
+        bill.delete()
+
+        assert technician_rows() == {}
+        assert customer_rows() == {}
+
+    def test_api_bill_edits_keep_rollups_current(self):
+        """Test that the bulk line item diff in the bill API is tracked as one delta."""
+        client = APIClient()
+        client.force_authenticate(user=UserFactory())
+        bill = self.issued_bill()
+        keep = line(bill, '1', '40', technician=self.technician)
+        line(bill, '1', '99')
+
+        response = client.put(reverse('bill-detail', kwargs={'pk': bill.id}), {
+            'type': 'bill',
+            'status': 'sent',
+            'line_items': [
+                {'id': keep.id, 'description': 'Line', 'quantity': '2', 'unit_price': '40',
+                 'technician': self.technician.id},
+                {'description': 'New', 'quantity': '1', 'unit_price': '5', 'is_labor': True, 'is_taxable': False},
+            ],
+        }, format='json')
+
+        assert response.status_code == status.HTTP_200_OK, response.data
+        assert technician_rows() == {
+            (self.today, self.technician.id): (Decimal('0'), Decimal('0'), Decimal('80'), Decimal('80'), 1),
+            (self.today, None): (Decimal('1'), Decimal('5'), Decimal('0'), Decimal('0'), 1),
+        }
+
+    def test_bill_is_locked_before_its_contribution_is_read(self):
+        """Test that concurrent edits of one bill take turns instead of both starting from the same totals."""
+        bill = self.issued_bill()
+        with CaptureQueriesContext(connection) as ctx:
+            line(bill, '1', '80', technician=self.technician)
+
+        statements = [query['sql'] for query in ctx.captured_queries]
+        lock = 'UPDATE "appointments_bill"' if connection.vendor == 'sqlite' else 'FOR UPDATE'
+        first_lock = next(index for index, sql in enumerate(statements) if lock in sql)
+        first_read = next(index for index, sql in enumerate(statements) if 'FROM "appointments_billlineitem"' in sql)
+        assert first_lock < first_read
+
+    def test_deleting_a_customer_moves_their_bills_to_the_empty_key(self):
+        """Test that a deleted customer's totals stay in the rollups, as their bills do."""
+        anonymous = self.issued_bill(customer=None)
+        line(anonymous, '1', '20', technician=self.technician)
+        bill = self.issued_bill()
+        line(bill, '2', '50', is_labor=True, is_taxable=False, technician=self.technician)
+
+        bill.customer.delete()
+
+        assert customer_rows() == {
+            (self.today, None): (Decimal('2'), Decimal('100'), Decimal('20'), Decimal('20'), 2),
+        }
+        call_command('rebuild_rollups')
+        assert customer_rows() == {
+            (self.today, None): (Decimal('2'), Decimal('100'), Decimal('20'), Decimal('20'), 2),
+        }
+
+    def test_deleting_a_technician_moves_their_lines_to_the_empty_key(self):
+        """Test that a deleted technician's lines join the unassigned row, counting each bill once."""
+        bill = self.issued_bill()
+        line(bill, '1', '20')
+        line(bill, '2', '50', is_labor=True, is_taxable=False, technician=self.technician)
+
+        self.technician.delete()
+
+        expected = {(self.today, None): (Decimal('2'), Decimal('100'), Decimal('20'), Decimal('20'), 1)}
+        assert technician_rows() == expected
+        call_command('rebuild_rollups')
+        assert technician_rows() == expected
+
+    def test_rebuild_matches_incremental_rollups(self):
+        """Test that rebuild_rollups reproduces the incrementally maintained rows."""
+        other = TechnicianFactory()
+        for n in range(5):
+            bill = self.issued_bill(status=['sent', 'paid', 'overdue', 'draft', 'paid'][n])
+            line(bill, '1.5', '60', is_labor=True, is_taxable=False, technician=self.technician)
+            line(bill, str(n + 1), '12.34', is_taxable=n % 2 == 0, technician=other if n % 2 else None)
+        technicians, customers = technician_rows(), customer_rows()
+
+        TechnicianDailyRollup.objects.update(labor_hours=999)
+        CustomerDailyRollup.objects.all().delete()
+        call_command('rebuild_rollups', '--chunk-days', '1')
+
+        assert technician_rows() == technicians
+        assert customer_rows() == customers
+
+
+@pytest.mark.django_db
+class TestReportAPI:
+    def setup_method(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=UserFactory())
+        self.technician = TechnicianFactory()
+        self.bill = BillFactory(status='paid')
+        line(self.bill, '2', '50', is_labor=True, is_taxable=False, technician=self.technician)
+        line(self.bill, '1', '20', is_taxable=True)
+        self.today = timezone.localdate().isoformat()
+
+    def get(self, name, **params):
+        params.setdefault('start', self.today)
+        params.setdefault('end', self.today)
+        return self.client.get(reverse(f'report-{name}'), params)
+
+    def test_technician_report(self):
+        """Test that revenue per technician is summed from the rollups."""
+        response = self.get('technicians')
+
+        assert response.status_code == status.HTTP_200_OK
+        by_technician = {row['technician_id']: row for row in response.data}
+        assert by_technician[self.technician.id]['labor_hours'] == '2.00'
+        assert by_technician[self.technician.id]['revenue'] == '100.00'
+        assert by_technician[self.technician.id]['technician_name'] == str(self.technician)
+        assert by_technician[None]['parts_revenue'] == '20.00'
+
+    def test_customer_and_daily_reports(self):
+        """Test that the customer and per-day reports include the whole bill."""
+        customers = self.get('customers').data
+        assert [(row['customer_id'], row['revenue'], row['bill_count']) for row in customers] == [
+            (self.bill.customer_id, '120.00', 1)
+        ]
+        daily = self.get('daily').data
+        assert [(str(row['day']), row['taxable_amount']) for row in daily] == [(self.today, '20.00')]
+
+    def test_range_outside_data_is_empty(self):
+        """Test that days without bills return no rows."""
+        assert self.get('daily', start='2001-01-01', end='2001-12-31').data == []
+
+    def test_dates_are_validated(self):
+        """Test that missing or reversed dates are rejected."""
+        assert self.client.get(reverse('report-daily')).status_code == status.HTTP_400_BAD_REQUEST
+        assert self.get('daily', start='2025-02-01', end='2025-01-01').status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_counted_statuses_match_bill_choices():
+    """Test that every counted status is a real bill status."""
+    from appointments.models import Bill
+    choices = {value for value, _ in Bill._meta.get_field('status').choices}
+    assert set(rollups.COUNTED_STATUSES) <= choices
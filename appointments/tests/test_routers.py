@@ -0,0 +1,103 @@
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from appointments import routers
+from appointments.models import Appointment
+from .factories import AppointmentFactory, UserFactory
+
+
+@pytest.fixture
+def replica_reads(monkeypatch):
+    """
+    Record each read the router sends to the replica and serve it from the
+    primary, so routing is observable with one test database.
+    """
+    reads = []
+    route = routers.ReplicaRouter.db_for_read
+
+    def db_for_read(self, model, **hints):
+        alias = route(self, model, **hints)
+        if alias == 'replica':
+            reads.append(model)
+            return 'default'
+        return alias
+    monkeypatch.setattr(routers, 'replica_alias', lambda: 'replica')
+    monkeypatch.setattr(routers.ReplicaRouter, 'db_for_read', db_for_read)
+    return reads
+
+
+def test_router_uses_the_replica_only_for_replica_views(monkeypatch):
+    monkeypatch.setattr(routers, 'replica_alias', lambda: 'replica')
+    router = routers.ReplicaRouter()
+    assert router.db_for_read(Appointment) == 'default'
+
+    state, token = routers.start_request(pinned=False)
+    try:
+        assert router.db_for_read(Appointment) == 'default'
+        state.replica_view = True
+        assert router.db_for_read(Appointment) == 'replica'
+        assert router.db_for_write(Appointment) == 'default'
+        # Reads after a write see it
+        assert router.db_for_read(Appointment) == 'default'
+    finally:
+        routers.end_request(token)
+
+    assert router.allow_migrate('replica', 'appointments') is False
+    assert router.allow_migrate('default', 'appointments') is True
+
+
+def test_no_replica_configured_reads_from_the_primary():
+    state, token = routers.start_request(pinned=False)
+    state.replica_view = True
+    try:
+        assert routers.ReplicaRouter().db_for_read(Appointment) == 'default'
+    finally:
+        routers.end_request(token)
+
+
+@pytest.mark.django_db
+class TestReplicaMiddleware:
+    def setup_method(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=UserFactory())
+
+    def test_list_detail_and_report_reads_use_the_replica(self, replica_reads):
+        appointment = AppointmentFactory()
+
+        assert self.client.get(reverse('appointment-list')).status_code == status.HTTP_200_OK
+        assert self.client.get(reverse('appointment-detail', kwargs={'pk': appointment.pk})).status_code == 200
+        assert self.client.get(reverse('report-daily'), {'start': '2025-01-01', 'end': '2025-01-31'}).status_code == 200
+        assert len(replica_reads) >= 3
+
+    def test_other_actions_read_from_the_primary(self, replica_reads):
+        response = self.client.get(reverse('appointment-dispatch-plan'), {'date': '2025-06-03'})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert replica_reads == []
+
+    def test_cache_filling_reads_use_the_primary(self, replica_reads):
+        """Test that the dashboard summary cache and the typeahead index are never built from the replica."""
+        AppointmentFactory()
+
+        assert self.client.get(reverse('dashboard-summary')).status_code == status.HTTP_200_OK
+        assert self.client.get(reverse('typeahead-list'), {'q': 'a'}).status_code == status.HTTP_200_OK
+        assert replica_reads == []
+
+    def test_clients_that_write_stick_to_the_primary(self, replica_reads, settings):
+        settings.REPLICA_PIN_SECONDS = 30
+        appointment = AppointmentFactory(description='Old')
+
+        response = self.client.patch(
+            reverse('appointment-detail', kwargs={'pk': appointment.pk}), {'description': 'New'}, format='json',
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.cookies['fieldmaster_primary']['max-age'] == 30
+
+        assert self.client.get(reverse('appointment-detail', kwargs={'pk': appointment.pk})).data['description'] == 'New'
+        assert replica_reads == []
+
+        del self.client.cookies['fieldmaster_primary']
+        self.client.get(reverse('appointment-list'))
+        assert replica_reads
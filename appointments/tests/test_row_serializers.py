@@ -0,0 +1,109 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+from django.urls import reverse
+from django.utils.translation import gettext_lazy
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from appointments.mixins import RowListMixin
+from appointments.models import Appointment, Bill
+from appointments.renderers import ORJSONRenderer
+from appointments.row_serializers import RowSerializer, UnsupportedField
+from .factories import (
+    AppointmentFactory, BillFactory, BillLineItemFactory, CustomerFactory, PhotoFactory, UserFactory,
+)
+from .query_counts import assert_query_ceiling
+
+
+@pytest.mark.django_db
+class TestRowLists:
+    def setup_method(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=UserFactory())
+
+    def regular(self, monkeypatch, url, params=None):
+        with monkeypatch.context() as patch:
+            patch.setattr(RowListMixin, 'get_row_serializer', lambda self: None)
+            return self.client.get(url, params)
+
+    def assert_same(self, monkeypatch, url, params=None):
+        response = self.client.get(url, params)
+        assert response.status_code == 200
+        assert response.content == self.regular(monkeypatch, url, params).content
+        return response
+
+    def test_lists_match_the_serializers_byte_for_byte(self, monkeypatch, capsys):
+        """Test that the row serializer renders what the model serializers render, in every shape."""
+        customer = CustomerFactory(latitude=Decimal('44.123456'))
+        PhotoFactory.create_batch(2, content_type='customer', object_id=customer.id, thumbnail='photos/t.jpg')
+        appointments = AppointmentFactory.create_batch(3, customer=customer)
+        AppointmentFactory(technician=None, description='Line\u2028separator “quoted”')
+        PhotoFactory(content_type='appointment', object_id=appointments[0].id, uploaded_by=None)
+        bill = BillFactory(appointment=appointments[0], due_date=datetime.date(2025, 3, 1))
+        BillLineItemFactory.create_batch(2, bill=bill)
+        BillFactory(appointment=None, customer=None)
+
+        for params in [None, {'expand': 'customer.photos'}, {'fields': 'id,customer.first_name,photos'},
+                       {'fields': 'id,customer,technician.user', 'expand': 'photos'}]:
+            self.assert_same(monkeypatch, reverse('appointment-list'), params)
+        for params in [None, {'ordering': '-total'}, {'fields': 'id,total,total_amount,line_items'},
+                       {'expand': 'appointment.customer.photos'}]:
+            self.assert_same(monkeypatch, reverse('bill-list'), params)
+        self.assert_same(monkeypatch, reverse('customer-list'))
+        self.assert_same(monkeypatch, reverse('technician-list'))
+        assert 'DEBUG' not in capsys.readouterr().out
+
+    def test_pages_and_cursors_match(self, monkeypatch):
+        AppointmentFactory.create_batch(5)
+
+        first = self.assert_same(monkeypatch, reverse('appointment-list'), {'page_size': 2}).json()
+        second = self.assert_same(monkeypatch, first['next']).json()
+        assert len(second['results']) == 2 and second['next']
+        bills = self.assert_same(monkeypatch, reverse('bill-list'), {'page_size': 2, 'ordering': '-total'}).json()
+        self.assert_same(monkeypatch, bills['next'])
+
+    def test_query_count_does_not_grow_with_rows(self):
+        """Test that nested relations cost one query each, whatever the number of rows."""
+        for bill in BillFactory.create_batch(10):
+            BillLineItemFactory(bill=bill)
+            PhotoFactory(content_type='appointment', object_id=bill.appointment_id)
+
+        # ETag probe, bills with their joins, line items, and the photos of bills, appointments and both customers
+        response = assert_query_ceiling(self.client, reverse('bill-list'), 7)
+        assert len(response.json()) == Bill.objects.count()
+
+
+def test_unknown_fields_are_unsupported():
+    class WithMethod(serializers.ModelSerializer):
+        label = serializers.SerializerMethodField()
+
+        class Meta:
+            model = Appointment
+            fields = ['id', 'label']
+
+    with pytest.raises(UnsupportedField):
+        RowSerializer(WithMethod())
+
+
+@pytest.mark.parametrize('data', [
+    {'total': Decimal('12.50'), 'day': datetime.date(2025, 1, 2), 'at': datetime.time(9, 30, 0, 125)},
+    {'when': datetime.datetime(2025, 1, 2, 3, 4, 5, 6, tzinfo=datetime.timezone.utc)},
+    {'when': datetime.datetime(2025, 1, 2, 3, 4, tzinfo=datetime.timezone(datetime.timedelta(hours=-5)))},
+    {'label': gettext_lazy('Scheduled'), 'text': 'café \u2028 \u2029 \x00 \U0001f600', 'none': None},
+    [1.5, 1e16, 1e-7, 2 ** 70],
+    {1: 'integer key'},
+    [{'nested': [True, False, 0.1]}],
+])
+def test_orjson_renderer_writes_the_same_bytes(data):
+    assert ORJSONRenderer().render(data) == JSONRenderer().render(data)
+
+
+def test_orjson_renderer_indents_like_json_renderer():
+    data = {'items': [1, 2], 'empty': {}}
+
+    assert ORJSONRenderer().render(data, 'application/json; indent=4') == \
+        JSONRenderer().render(data, 'application/json; indent=4')
+    assert ORJSONRenderer().render(None) == b''
@@ -0,0 +1,96 @@
+import pytest
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from appointments import search
+from appointments.models import Customer
+from .factories import (
+    AppointmentFactory, BillFactory, BillLineItemFactory, CustomerFactory, UserFactory,
+)
+
+
+def test_phone_like_queries_become_digits():
+    assert search.parse('(555) 123-45') == ['55512345']
+    assert search.parse('Jane  DOE') == ['jane', 'doe']
+
+
+@pytest.mark.django_db
+class TestSearch:
+    def setup_method(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=UserFactory())
+        self.url = reverse('search-list')
+
+    def get(self, **params):
+        response = self.client.get(self.url, params)
+        assert response.status_code == status.HTTP_200_OK, response.data
+        return response.data['results']
+
+    def test_results_are_grouped_by_type(self):
+        """Test that one query finds customers, appointments, bills and part numbers."""
+        customer = CustomerFactory(first_name='Harold', last_name='Furnace', phone='(555) 010-2233')
+        appointment = AppointmentFactory(customer=customer, description='Furnace inspection', notes='')
+        bill = BillFactory(appointment=appointment, description='Furnace repair')
+        part = BillLineItemFactory(bill=bill, part_number='FURN-20', description='Igniter')
+        AppointmentFactory(description='Water heater flush', notes='')
+
+        results = self.get(q='furn')
+
+        assert [row['id'] for row in results['customers']['results']] == [customer.id]
+        assert [row['id'] for row in results['appointments']['results']] == [appointment.id]
+        # Appointments open a bill with their description, so the job's own bill matches too
+        assert bill.id in [row['id'] for row in results['bills']['results']]
+        assert all('Furnace' in row['description'] for row in results['bills']['results'])
+        assert [row['id'] for row in results['parts']['results']] == [part.id]
+        assert results['parts']['results'][0]['bill_id'] == bill.id
+
+    def test_every_term_must_match_and_name_ranks_first(self):
+        """Test that all words must match and a name match outranks an address match."""
+        by_address = CustomerFactory(first_name='Ann', last_name='Smith', address='12 Baker Street')
+        by_name = CustomerFactory(first_name='Ann', last_name='Baker', address='3 Elm Road')
+        CustomerFactory(first_name='Bob', last_name='Baker', address='9 Oak Lane')
+
+        rows = self.get(q='ann baker', type='customers')['customers']['results']
+
+        assert [row['id'] for row in rows] == [by_name.id, by_address.id]
+        assert rows[0]['rank'] > rows[1]['rank']
+
+    def test_phone_digits_match_any_formatting(self):
+        """Test that a phone is found from its start, without its area code, or by its last four digits."""
+        customer = CustomerFactory(phone='(207) 555-0199')
+
+        for query in ('207-555-01', '555-0199', '0199'):
+            rows = self.get(q=query, type='customers')['customers']['results']
+            assert [row['id'] for row in rows] == [customer.id], query
+
+    @pytest.mark.skipif(connection.vendor != 'postgresql', reason="The search_vector columns are PostgreSQL only")
+    def test_phone_suffixes_are_indexed(self):
+        customer = CustomerFactory(phone='(207) 555-0199')
+
+        vector = Customer.objects.filter(pk=customer.pk).values_list(
+            RawSQL('search_vector::text', []), flat=True
+        ).get()
+
+        # Lexemes are listed as 'lexeme':positions
+        assert all(f"'{digits}':" in vector for digits in ('2075550199', '5550199', '0199'))
+
+    def test_pages_within_a_type(self):
+        """Test that a group with more matches links to its next page."""
+        customers = [CustomerFactory(last_name='Pagewood') for _ in range(3)]
+
+        first = self.get(q='pagewood', page_size=2)['customers']
+        assert len(first['results']) == 2 and 'type=customers' in first['next']
+        second = self.client.get(first['next']).data['results']
+
+        assert list(second) == ['customers']
+        assert second['customers']['next'] is None
+        ids = [row['id'] for row in first['results'] + second['customers']['results']]
+        assert sorted(ids) == sorted(customer.id for customer in customers)
+
+    def test_query_is_validated(self):
+        assert self.client.get(self.url, {'q': 'a'}).status_code == status.HTTP_400_BAD_REQUEST
+        assert self.client.get(self.url, {'q': 'abc', 'type': 'users'}).status_code == status.HTTP_400_BAD_REQUEST
+        assert self.client.get(self.url, {'q': 'abc', 'page': '0'}).status_code == status.HTTP_400_BAD_REQUEST
@@ -0,0 +1,137 @@
+import json
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from appointments import sync
+from appointments.models import BillLineItem, Tombstone
+from .factories import AppointmentFactory, BillFactory, CustomerFactory, PhotoFactory, UserFactory
+
+
+def read(response):
+    assert response.status_code == status.HTTP_200_OK
+    return json.loads(b''.join(response.streaming_content))
+
+
+def ids(records):
+    return sorted(record['id'] for record in records)
+
+
+@pytest.mark.django_db
+class TestSync:
+    @pytest.fixture(autouse=True)
+    def no_commit_window(self, settings):
+        settings.SYNC_COMMIT_WINDOW = 0
+
+    def setup_method(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=UserFactory())
+        self.url = reverse('sync-list')
+
+    def sync(self, token=None):
+        return read(self.client.get(self.url, {'since': token} if token else {}))
+
+    def test_full_sync_returns_everything_flat(self):
+        """Test that a sync without a token returns every record with relations as ids."""
+        appointment = AppointmentFactory()
+        bill = BillFactory(appointment=appointment, customer=appointment.customer)
+        photo = PhotoFactory(content_type='customer', object_id=appointment.customer_id)
+
+        data = self.sync()
+
+        assert data['full'] is True
+        assert data['token'] and data['deleted'] == []
+        assert ids(data['appointments']) == [appointment.id]
+        assert data['appointments'][0]['customer'] == appointment.customer_id
+        assert bill.id in ids(data['bills'])
+        assert set(ids(data['line_items'])) == set(BillLineItem.objects.values_list('id', flat=True))
+        customer = next(record for record in data['customers'] if record['id'] == appointment.customer_id)
+        assert customer['photos'] == [photo.id]
+        assert ids(data['photos']) == [photo.id]
+
+    def test_delta_returns_only_changes(self):
+        """Test that a token-based sync returns saves and deletes made after the token."""
+        kept, changed, removed = CustomerFactory.create_batch(3)
+        token = self.sync()['token']
+
+        changed.first_name = 'Changed'
+        changed.save()
+        removed_id = removed.id
+        removed.delete()
+        added = CustomerFactory()
+
+        data = self.sync(token)
+
+        assert data['full'] is False
+        assert ids(data['customers']) == sorted([changed.id, added.id])
+        assert data['appointments'] == [] and data['bills'] == []
+        assert [(row['type'], row['id']) for row in data['deleted']] == [('customer', removed_id)]
+
+    def test_cascaded_deletes_leave_tombstones(self):
+        """Test that deleting a bill records its line items as deleted too."""
+        bill = BillFactory(appointment=None, customer=None)
+        bill_id, line_ids = bill.id, list(bill.line_items.values_list('id', flat=True))
+        token = self.sync()['token']
+
+        bill.delete()
+
+        deleted = {(row['type'], row['id']) for row in self.sync(token)['deleted']}
+        assert deleted == {('bill', bill_id)} | {('line_item', line_id) for line_id in line_ids}
+
+    def test_unchanged_sync_is_cheap(self, django_assert_num_queries):
+        """Test that a sync with nothing new runs one query per resource and no serialization."""
+        CustomerFactory.create_batch(5)
+        token = self.sync()['token']
+
+        with django_assert_num_queries(len(sync.RESOURCES) + 1):
+            data = self.sync(token)
+        assert all(data[key] == [] for key, *_ in sync.RESOURCES)
+
+    def test_large_results_are_chunked(self, settings, django_assert_max_num_queries):
+        """Test that records are streamed in primary-key chunks without losing any."""
+        settings.SYNC_CHUNK_SIZE = 4
+        customers = CustomerFactory.create_batch(10)
+
+        with django_assert_max_num_queries(20):
+            data = self.sync()
+        assert ids(data['customers']) == sorted(customer.id for customer in customers)
+
+    def test_line_item_amounts_are_rendered(self):
+        """Test that records carry the same values as the regular API."""
+        bill = BillFactory(appointment=None, customer=None)
+        item = BillLineItem.objects.create(bill=bill, description='Part', quantity=2, unit_price=Decimal('3.50'))
+
+        record = next(row for row in self.sync()['line_items'] if row['id'] == item.id)
+
+        assert record['bill'] == bill.id
+        assert record['unit_price'] == '3.50'
+
+    def test_bad_tokens(self):
+        """Test that forged tokens are rejected and tokens older than the tombstones expire."""
+        assert self.client.get(self.url, {'since': 'forged'}).status_code == status.HTTP_400_BAD_REQUEST
+
+        stale = sync.make_token(timezone.now() - timedelta(days=31))
+        response = self.client.get(self.url, {'since': stale})
+        assert response.status_code == status.HTTP_410_GONE
+
+    def test_requires_authentication(self):
+        """Test that anonymous clients cannot sync."""
+        assert APIClient().get(self.url).status_code in (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN)
+
+
+@pytest.mark.django_db
+def test_prune_tombstones():
+    """Test that pruning drops only tombstones past the retention."""
+    old = Tombstone.objects.create(resource='customer', object_id=1, deleted_at=timezone.now() - timedelta(days=40))
+    recent = Tombstone.objects.create(resource='customer', object_id=2)
+
+    call_command('prune_tombstones')
+
+    assert list(Tombstone.objects.values_list('id', flat=True)) == [recent.id]
+    assert not Tombstone.objects.filter(id=old.id).exists()
@@ -0,0 +1,164 @@
+import threading
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from appointments import taskqueue
+from appointments.cron import Cron, CronError
+from appointments.models import ScheduledTask, Task
+from .factories import UserFactory
+
+calls = []
+
+
+@taskqueue.task('tests.record')
+def record(value):
+    calls.append(value)
+
+
+@taskqueue.task('tests.flaky', max_attempts=2)
+def flaky():
+    raise RuntimeError('boom')
+
+
+@pytest.fixture(autouse=True)
+def clear_calls():
+    calls.clear()
+
+
+def test_cron_next_after():
+    moment = datetime(2026, 3, 6, 10, 7, 30, tzinfo=ZoneInfo('America/New_York'))
+
+    assert Cron('*/15 * * * *').next_after(moment) == moment.replace(minute=15, second=0)
+    assert Cron('30 3 * * *').next_after(moment) == datetime(2026, 3, 7, 3, 30, tzinfo=moment.tzinfo)
+    # Weekdays only: Friday 18:00 is followed by Monday 08:00
+    assert Cron('0 8-18 * * 1-5').next_after(moment.replace(hour=18)) == datetime(2026, 3, 9, 8, 0, tzinfo=moment.tzinfo)
+    assert Cron('0 0 29 2 *').next_after(moment).year == 2028
+    with pytest.raises(CronError):
+        Cron('61 * * * *')
+    with pytest.raises(CronError):
+        Cron('* * *')
+
+
+@pytest.mark.django_db
+class TestTaskQueue:
+    def test_tasks_run_in_priority_order(self):
+        taskqueue.enqueue('tests.record', value='late', priority=5)
+        taskqueue.enqueue('tests.record', value='first', priority=-1)
+        taskqueue.enqueue('tests.record', value='future', run_at=timezone.now() + timedelta(hours=1))
+
+        assert taskqueue.run_pending() == 2
+
+        assert calls == ['first', 'late']
+        assert Task.objects.filter(status=Task.SUCCEEDED).count() == 2
+        assert Task.objects.get(status=Task.QUEUED).kwargs == {'value': 'future'}
+
+    def test_failures_retry_with_backoff_then_fail(self, settings):
+        settings.TASK_RETRY_DELAY = 60
+        task = taskqueue.enqueue('tests.flaky')
+
+        taskqueue.run_pending()
+        task.refresh_from_db()
+        assert task.status == Task.QUEUED and task.attempts == 1
+        assert 'RuntimeError: boom' in task.last_error
+        assert task.run_at >= timezone.now() + timedelta(seconds=25)
+        # Not due yet, so nothing runs
+        assert taskqueue.run_pending() == 0
+
+        Task.objects.filter(pk=task.pk).update(run_at=timezone.now())
+        taskqueue.run_pending()
+        task.refresh_from_db()
+        assert task.status == Task.FAILED and task.attempts == 2
+        assert task.finished_at is not None
+
+    def test_claimed_task_is_not_claimed_again(self):
+        taskqueue.enqueue('tests.record', value='once')
+
+        assert taskqueue.claim('a') is not None
+        assert taskqueue.claim('b') is None
+
+    def test_stale_running_tasks_are_requeued(self, settings):
+        settings.TASK_LEASE = 60
+        task = taskqueue.enqueue('tests.record', value='again')
+        taskqueue.claim('gone')
+        Task.objects.filter(pk=task.pk).update(started_at=timezone.now() - timedelta(minutes=5))
+
+        assert taskqueue.requeue_stale() == 1
+        assert taskqueue.run_pending() == 1
+        assert calls == ['again']
+
+    def test_schedule_enqueues_each_run_once(self, settings):
+        settings.TASK_SCHEDULE = {'record': {'task': 'tests.record', 'cron': '*/10 * * * *', 'kwargs': {'value': 1}}}
+        now = timezone.now()
+
+        assert taskqueue.enqueue_due(now) == 0
+        row = ScheduledTask.objects.get(key='record')
+        assert now < row.next_run_at <= now + timedelta(minutes=10)
+
+        later = row.next_run_at + timedelta(seconds=1)
+        assert taskqueue.enqueue_due(later) == 1
+        assert taskqueue.enqueue_due(later) == 0
+        assert Task.objects.get().kwargs == {'value': 1}
+        assert ScheduledTask.objects.get(key='record').next_run_at == row.next_run_at + timedelta(minutes=10)
+
+    def test_stats_endpoint(self, settings):
+        settings.TASK_SCHEDULE = {}
+        taskqueue.enqueue('tests.record', value=1, run_at=timezone.now() - timedelta(minutes=1))
+        taskqueue.enqueue('tests.flaky')
+        client = APIClient()
+        url = reverse('task-stats')
+
+        client.force_authenticate(user=UserFactory())
+        assert client.get(url).status_code == status.HTTP_403_FORBIDDEN
+
+        client.force_authenticate(user=UserFactory(is_staff=True))
+        data = client.get(url).data
+        assert data['queued'] == 2 and data['due'] == 2
+        assert data['oldest_due_seconds'] >= 60
+        assert {row['name'] for row in data['tasks']} == {'tests.record', 'tests.flaky'}
+
+        taskqueue.run_pending()
+        data = client.get(url).data
+        assert data['succeeded_last_hour'] == 1 and data['retrying'] == 1
+        assert data['latency_seconds'] >= 0
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.skipif(connection.vendor == 'sqlite' and connection.is_in_memory_db(),
+                    reason="A shared in-memory SQLite database fails concurrent writers instead of making them wait")
+def test_run_tasks_command_drains_the_queue_with_concurrent_workers(settings):
+    settings.TASK_SCHEDULE = {}
+    for value in range(12):
+        taskqueue.enqueue('tests.record', value=value)
+
+    call_command('run_tasks', '--threads', '--concurrency', '3', '--once')
+
+    assert sorted(calls) == list(range(12))
+    assert Task.objects.filter(status=Task.SUCCEEDED).count() == 12
+
+
+@pytest.mark.django_db(transaction=True)
+def test_worker_keeps_polling_when_an_outcome_cannot_be_saved(settings, monkeypatch):
+    settings.TASK_SCHEDULE = {}
+    first, second = (taskqueue.enqueue('tests.record', value=value) for value in (1, 2))
+    execute = taskqueue.execute
+
+    def execute_once_broken(task):
+        if task.pk == first.pk:
+            raise OperationalError('database is locked')
+        return execute(task)
+    monkeypatch.setattr(taskqueue, 'execute', execute_once_broken)
+
+    taskqueue.Worker(threading.Event(), poll_interval=0).run(once=True)
+
+    assert calls == [2]
+    # Left running for the lease to queue again
+    assert Task.objects.get(pk=first.pk).status == Task.RUNNING
+    assert Task.objects.get(pk=second.pk).status == Task.SUCCEEDED
@@ -0,0 +1,137 @@
+import threading
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from appointments import typeahead
+from appointments.models import Customer
+from .factories import CustomerFactory, TechnicianFactory, UserFactory
+
+
+@pytest.fixture(autouse=True)
+def fresh_index():
+    typeahead.index.clear()
+    yield
+    typeahead.index.clear()
+
+
+def labels(results):
+    return [result['label'] for result in results]
+
+
+@pytest.mark.django_db
+class TestTypeahead:
+    def setup_method(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=UserFactory())
+        self.url = reverse('typeahead-list')
+
+    def test_matches_names_email_and_phone(self):
+        """Test that customers are found by any name prefix, email words and phone digits."""
+        jane = CustomerFactory(first_name='Jane', last_name='Doe', email='jd@acme.test', phone='(207) 555-0142')
+        CustomerFactory(first_name='John', last_name='Dodd', email='john@other.test', phone='207-555-0199')
+
+        assert labels(typeahead.index.lookup('jan')) == ['Jane Doe']
+        assert labels(typeahead.index.lookup('do ja')) == ['Jane Doe']
+        assert labels(typeahead.index.lookup('acme')) == ['Jane Doe']
+        assert labels(typeahead.index.lookup('0142')) == ['Jane Doe']
+        assert sorted(labels(typeahead.index.lookup('207555'))) == ['Jane Doe', 'John Dodd']
+        assert typeahead.index.lookup('jan')[0]['id'] == jane.id
+
+    def test_lookups_do_not_query(self):
+        """Test that only the first lookup loads the index."""
+        CustomerFactory(first_name='Jane')
+        typeahead.index.lookup('jane')
+
+        with CaptureQueriesContext(connection) as queries:
+            for prefix in ('j', 'ja', 'jan', 'jane'):
+                typeahead.index.lookup(prefix)
+
+        assert len(queries) == 0
+
+    def test_signals_keep_the_index_current(self, django_capture_on_commit_callbacks):
+        """Test that saves, renames and deletes show up without reloading."""
+        customer = CustomerFactory(first_name='Jane', last_name='Doe', email='jd@example.com')
+        technician = TechnicianFactory(user=UserFactory(first_name='Theo', last_name='Wrench'))
+        typeahead.index.lookup('x')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            CustomerFactory(first_name='Janet', last_name='Roe')
+            customer.last_name = 'Smith'
+            customer.save()
+            technician.user.first_name = 'Teddy'
+            technician.user.save()
+
+        with CaptureQueriesContext(connection) as queries:
+            assert sorted(labels(typeahead.index.lookup('jan'))) == ['Jane Smith', 'Janet Roe']
+            assert labels(typeahead.index.lookup('doe')) == []
+            assert labels(typeahead.index.lookup('ted')) == ['Teddy Wrench']
+        assert len(queries) == 0
+
+        with django_capture_on_commit_callbacks(execute=True):
+            customer.delete()
+        assert labels(typeahead.index.lookup('jan')) == ['Janet Roe']
+
+    def test_endpoint_filters_by_type_and_limit(self):
+        CustomerFactory(first_name='Sam', last_name='One')
+        CustomerFactory(first_name='Sam', last_name='Two')
+        TechnicianFactory(user=UserFactory(first_name='Sam', last_name='Tech'))
+
+        response = self.client.get(self.url, {'q': 'sam', 'type': 'technician'})
+        assert response.status_code == status.HTTP_200_OK
+        assert labels(response.data['results']) == ['Sam Tech']
+
+        response = self.client.get(self.url, {'q': 'sam', 'limit': 2})
+        assert len(response.data['results']) == 2
+        assert self.client.get(self.url, {'q': 'sam', 'type': 'bill'}).status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_rebuild_keeps_serving_and_keeps_changes_made_meanwhile(self, monkeypatch):
+        """Test that lookups do not wait for a rebuild, and saves committed during it survive the swap."""
+        CustomerFactory(first_name='Jane', last_name='Doe')
+        typeahead.index.lookup('jane')
+        read = typeahead.index._read
+        during = {}
+
+        def slow_read():
+            rows = read()
+            lookup = threading.Thread(target=lambda: during.update(results=typeahead.index.lookup('jane')))
+            lookup.start()
+            lookup.join(timeout=5)
+            # Saved by another request after the tables were read
+            typeahead.index.update_customer(CustomerFactory.build(id=999, first_name='Janine', last_name='Late'))
+            return rows
+        monkeypatch.setattr(typeahead.index, '_read', slow_read)
+
+        typeahead.index.rebuild()
+
+        assert labels(during['results']) == ['Jane Doe']
+        assert sorted(labels(typeahead.index.lookup('jan'))) == ['Jane Doe', 'Janine Late']
+
+
+@pytest.mark.django_db(transaction=True)
+def test_background_load_and_refresh(settings, monkeypatch):
+    """Test that the first request loads the index in the background and stale lookups answer without querying."""
+    settings.TYPEAHEAD_BACKGROUND_LOAD = True
+    customer = CustomerFactory(first_name='Jane', last_name='Doe', email='jd@example.com')
+
+    typeahead.index.warm()
+    typeahead.index.start_rebuild().wait(timeout=10)
+    assert labels(typeahead.index.lookup('jane')) == ['Jane Doe']
+
+    # Renamed by another process: no signal reaches this one
+    Customer.objects.filter(pk=customer.pk).update(first_name='Joan')
+    typeahead.index._loaded_at -= typeahead.index.ttl + 1
+    read, gate = typeahead.index._read, threading.Event()
+    monkeypatch.setattr(typeahead.index, '_read', lambda: gate.wait(timeout=10) and read())
+
+    with CaptureQueriesContext(connection) as queries:
+        # Answered from the current lists while the rebuild waits
+        assert labels(typeahead.index.lookup('jane')) == ['Jane Doe']
+    assert len(queries) == 0
+    gate.set()
+    typeahead.index.start_rebuild().wait(timeout=10)
+    assert labels(typeahead.index.lookup('joan')) == ['Joan Doe']
@@ -0,0 +1,233 @@
+import base64
+import hashlib
+import io
+import os
+from datetime import timedelta
+
+import pytest
+from django.conf import settings
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from appointments import uploads
+from appointments.exceptions import UploadOffsetMismatch
+from appointments.models import Photo, UploadSession
+from .factories import CustomerFactory, UserFactory
+
+
+def jpeg_bytes():
+    output = io.BytesIO()
+    Image.effect_noise((400, 300), 64).convert('RGB').save(output, 'JPEG')
+    return output.getvalue()
+
+
+def content_digest(data):
+    return 'sha-256=:%s:' % base64.b64encode(hashlib.sha256(data).digest()).decode()
+
+
+@pytest.fixture(autouse=True)
+def upload_dirs(settings, tmp_path):
+    settings.FILE_UPLOAD_TEMP_DIR = str(tmp_path / 'partial')
+    settings.MEDIA_ROOT = str(tmp_path / 'media')
+    os.makedirs(settings.FILE_UPLOAD_TEMP_DIR)
+    return tmp_path
+
+
+@pytest.mark.django_db
+class TestResumableUpload:
+    def setup_method(self):
+        self.user = UserFactory()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.customer = CustomerFactory()
+        self.data = jpeg_bytes()
+
+    def start(self, **overrides):
+        payload = {
+            'filename': 'site.jpg',
+            'size': len(self.data),
+            'sha256': hashlib.sha256(self.data).hexdigest(),
+            'content_type': 'customer',
+            'object_id': self.customer.id,
+            **overrides,
+        }
+        response = self.client.post(reverse('upload-list'), payload, format='json')
+        assert response.status_code == status.HTTP_201_CREATED, response.data
+        return reverse('upload-detail', kwargs={'pk': response.data['id']})
+
+    def put(self, url, offset, chunk, **headers):
+        return self.client.put(
+            url, chunk, content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset), **headers
+        )
+
+    def test_chunks_resume_and_finalize_into_a_photo(self):
+        """Test that a file sent in chunks, with a resume in between, becomes a Photo."""
+        url = self.start(description='Panel')
+        first, rest = self.data[:4000], self.data[4000:]
+
+        response = self.put(url, 0, first, HTTP_CONTENT_DIGEST=content_digest(first))
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Upload-Offset'] == '4000'
+
+        # The client reconnects and asks where to carry on
+        assert self.client.get(url).data['offset'] == 4000
+        assert self.put(url, 4000, rest).status_code == status.HTTP_200_OK
+
+        response = self.client.post(url + 'finalize/')
+        assert response.status_code == status.HTTP_201_CREATED, response.data
+        photo = Photo.objects.get(pk=response.data['id'])
+        assert (photo.content_type, photo.object_id, photo.description) == ('customer', self.customer.id, 'Panel')
+        assert photo.uploaded_by == self.user
+        with photo.photo.open('rb') as stored:
+            assert stored.read() == self.data
+        assert not UploadSession.objects.exists()
+        assert not os.listdir(settings.FILE_UPLOAD_TEMP_DIR)
+
+    def test_file_hash_is_kept_across_chunks_and_processes(self):
+        """Test that the file's SHA-256 is built chunk by chunk, catching up on chunks another process wrote."""
+        url = self.start()
+        session = UploadSession.objects.get()
+        self.put(url, 0, self.data[:3000])
+        # The next chunk lands on another worker, which never saw the first
+        uploads._hashes.clear()
+        self.put(url, 3000, self.data[3000:6000])
+        self.put(url, 6000, self.data[6000:])
+
+        assert uploads._hashes[session.pk][0] == len(self.data)
+        assert uploads._hashes[session.pk][1].hexdigest() == hashlib.sha256(self.data).hexdigest()
+        assert self.client.post(url + 'finalize/').status_code == status.HTTP_201_CREATED
+        assert session.pk not in uploads._hashes
+
+    def test_invalid_content_length_is_a_bad_request(self):
+        url = self.start()
+
+        response = self.put(url, 0, self.data[:100], CONTENT_LENGTH='many')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'Content-Length' in response.data
+
+    def test_wrong_offset_is_a_conflict(self):
+        """Test that a chunk for the wrong offset is refused with the offset to resume from."""
+        url = self.start()
+        self.put(url, 0, self.data[:100])
+
+        response = self.put(url, 0, self.data[:100])
+
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert response.data['offset'] == 100
+
+    def test_bad_chunk_digest_is_rolled_back(self):
+        """Test that a chunk that fails its Content-Digest leaves the offset where it was."""
+        url = self.start()
+
+        response = self.put(url, 0, self.data[:100], HTTP_CONTENT_DIGEST=content_digest(b'other'))
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert self.client.get(url).data['offset'] == 0
+        assert os.path.getsize(uploads.temp_path(UploadSession.objects.get())) == 0
+
+    def test_short_body_is_rolled_back(self):
+        """Test that a chunk whose body ends before its Content-Length is not kept."""
+        self.start()
+        session = UploadSession.objects.get()
+
+        # The client goes away after 50 of the 100 bytes it announced
+        with pytest.raises(uploads.UploadError):
+            uploads.write_chunk(session, 0, io.BytesIO(self.data[:50]), 100)
+
+        session.refresh_from_db()
+        assert session.received == 0
+        assert os.path.getsize(uploads.temp_path(session)) == 0
+
+    def test_losing_a_race_leaves_the_winners_chunk(self):
+        """Test that requests that read the same offset cannot overwrite or cut off the chunk that claimed it."""
+        self.start()
+        first, second, third = (UploadSession.objects.get() for _ in range(3))
+        uploads.write_chunk(first, 0, io.BytesIO(self.data[:100]), 100)
+
+        with pytest.raises(uploads.UploadError):
+            uploads.write_chunk(second, 0, io.BytesIO(b'x' * 50), 50, digest=hashlib.sha256(b'other').digest())
+        with pytest.raises(UploadOffsetMismatch):
+            uploads.write_chunk(third, 0, io.BytesIO(b'y' * 50), 50)
+
+        with open(uploads.temp_path(first), 'rb') as partial:
+            assert partial.read() == self.data[:100]
+        assert UploadSession.objects.get().received == 100
+
+    def test_failed_finalize_can_be_retried(self, monkeypatch):
+        """Test that the received file survives a Photo save that fails after storing it."""
+        url = self.start()
+        self.put(url, 0, self.data)
+        save = Photo.save
+
+        def failing_save(photo, *args, **kwargs):
+            save(photo, *args, **kwargs)
+            raise RuntimeError("Database went away")
+        monkeypatch.setattr(Photo, 'save', failing_save)
+        with pytest.raises(RuntimeError):
+            uploads.finish(UploadSession.objects.get())
+        monkeypatch.setattr(Photo, 'save', save)
+
+        assert UploadSession.objects.get().received == len(self.data)
+        response = self.client.post(url + 'finalize/')
+        assert response.status_code == status.HTTP_201_CREATED, response.data
+        with Photo.objects.get().photo.open('rb') as stored:
+            assert stored.read() == self.data
+        assert not os.listdir(settings.FILE_UPLOAD_TEMP_DIR)
+
+    def test_checksum_mismatch_discards_the_upload(self):
+        """Test that a file that does not match its sha256 is not turned into a photo."""
+        url = self.start(sha256='0' * 64)
+        self.put(url, 0, self.data)
+
+        response = self.client.post(url + 'finalize/')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not Photo.objects.exists()
+        assert not UploadSession.objects.exists()
+
+    def test_incomplete_upload_cannot_be_finalized(self):
+        """Test that finalizing before every byte arrived is refused and keeps the session."""
+        url = self.start()
+        self.put(url, 0, self.data[:10])
+
+        assert self.client.post(url + 'finalize/').status_code == status.HTTP_400_BAD_REQUEST
+        assert UploadSession.objects.get().received == 10
+
+    def test_sessions_are_private(self):
+        """Test that another user cannot see or write to a session."""
+        url = self.start()
+        other = APIClient()
+        other.force_authenticate(user=UserFactory())
+
+        assert other.get(url).status_code == status.HTTP_404_NOT_FOUND
+        assert other.put(url, b'x', content_type='application/octet-stream',
+                         HTTP_UPLOAD_OFFSET='0').status_code == status.HTTP_404_NOT_FOUND
+
+    def test_oversized_uploads_are_refused(self, settings):
+        """Test that the declared size is checked against UPLOAD_MAX_SIZE."""
+        settings.UPLOAD_MAX_SIZE = 10
+        response = self.client.post(reverse('upload-list'), {
+            'filename': 'big.jpg', 'size': 11, 'sha256': '0' * 64, 'content_type': 'customer', 'object_id': 1,
+        }, format='json')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_clean_uploads_removes_expired_sessions():
+    """Test that the cleanup command drops only expired sessions and their files."""
+    user = UserFactory()
+    expired = uploads.start(user, 'a.jpg', 10, '0' * 64, 'customer', 1)
+    active = uploads.start(user, 'b.jpg', 10, '0' * 64, 'customer', 1)
+    UploadSession.objects.filter(pk=expired.pk).update(expires_at=timezone.now() - timedelta(minutes=1))
+
+    call_command('clean_uploads')
+
+    assert list(UploadSession.objects.values_list('pk', flat=True)) == [active.pk]
+    assert not os.path.exists(uploads.temp_path(expired))
+    assert os.path.exists(uploads.temp_path(active))
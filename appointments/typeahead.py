@@ -0,0 +1,237 @@
+"""
+Typeahead lookup of customers and technicians.
+
+Each process keeps a prefix index: one sorted list of ``(token, kind, id)``
+keys, where the tokens of a customer are the words of their name and
+email address and their phone digits (also the last 7 and 4),
+and those of a technician are the words of their name. A lookup bisects to
+the first key starting with the query's longest word and walks forward
+until it has ``limit`` entries that match every other word too, so it
+costs microseconds and no query.
+
+The first request a process serves starts loading the index in a background
+thread; a lookup waits for it only if it arrives before the load is done.
+The receivers in ``receivers.py`` then keep it current. Changes made by
+other processes are picked up by a rebuild ``TYPEAHEAD_INDEX_TTL`` seconds
+(default 300) after the last one: it runs in a background thread while
+lookups go on against the current lists, which are swapped for the new
+ones at the end. With ``TYPEAHEAD_BACKGROUND_LOAD = False`` (the tests)
+loads and rebuilds run in the calling thread instead.
+"""
+import bisect
+import logging
+import re
+import threading
+from time import monotonic
+
+from django.conf import settings
+from django.db import connections
+
+from .models import Customer, Technician
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('customer', 'technician')
+WORD = re.compile(r'\w+')
+# Keys walked per lookup at most, so a one-letter query over a huge table stays cheap
+MAX_SCAN = 5000
+
+
+def normalize(text):
+    return [word.lower() for word in WORD.findall(text or '')]
+
+
+def customer_entry(customer):
+    tokens = set(normalize(f'{customer.first_name} {customer.last_name}'))
+    tokens.update(normalize(customer.email))
+    digits = re.sub(r'\D', '', customer.phone or '')
+    if digits:
+        tokens.update({digits, digits[-7:], digits[-4:]})
+    data = {
+        'type': 'customer',
+        'id': customer.id,
+        'label': f'{customer.first_name} {customer.last_name}',
+        'email': customer.email,
+        'phone': customer.phone,
+    }
+    return tokens, data
+
+
+def technician_entry(technician, user):
+    name = f'{user.first_name} {user.last_name}'.strip() or user.username
+    tokens = set(normalize(name)) | set(normalize(user.username))
+    data = {
+        'type': 'technician',
+        'id': technician.id,
+        'label': name,
+        'phone': technician.phone,
+        'is_available': technician.is_available,
+    }
+    return tokens, data
+
+
+def background_load():
+    return getattr(settings, 'TYPEAHEAD_BACKGROUND_LOAD', True)
+
+
+class TypeaheadIndex:
+    """Sorted prefix keys over customer and technician entries, updated incrementally."""
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl if ttl is not None else getattr(settings, 'TYPEAHEAD_INDEX_TTL', 300)
+        self.lock = threading.RLock()
+        # One rebuild at a time; lookups only need ``lock``
+        self.build_lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self._keys = []  # sorted (token, kind, id)
+            self._entries = {}  # (kind, id) -> (tokens, data)
+            self._loaded_at = None
+            self._pending = None  # changes made while a rebuild reads the tables
+            self._build_done = None  # Event of the latest background rebuild
+
+    def warm(self):
+        """Start loading in the background if nothing is loaded; called on every request, so cheap."""
+        if self._loaded_at is None and background_load():
+            self.start_rebuild()
+
+    def ensure_loaded(self):
+        if self._loaded_at is None:
+            if background_load():
+                self.start_rebuild().wait()
+            if self._loaded_at is None:
+                # Not loading in the background, or that load failed
+                self.rebuild()
+        elif monotonic() - self._loaded_at > self.ttl:
+            if background_load():
+                self.start_rebuild()
+            else:
+                self.rebuild()
+
+    def start_rebuild(self):
+        """Rebuild in a background thread unless one is running. Return the Event set when it ends."""
+        with self.lock:
+            if self._build_done is None or self._build_done.is_set():
+                self._build_done = threading.Event()
+                threading.Thread(
+                    target=self._rebuild_in_background, args=(self._build_done,), name='typeahead-index', daemon=True,
+                ).start()
+            return self._build_done
+
+    def _rebuild_in_background(self, done):
+        try:
+            self.rebuild()
+        except Exception:
+            logger.exception("Could not rebuild the typeahead index")
+        finally:
+            connections.close_all()
+            done.set()
+
+    def rebuild(self):
+        """Read both tables without holding ``lock``, then swap the new lists in."""
+        with self.build_lock:
+            with self.lock:
+                self._pending = []
+            try:
+                keys, entries = self._read()
+            except BaseException:
+                with self.lock:
+                    self._pending = None
+                raise
+            with self.lock:
+                # Saves and deletes committed while reading may be missing from it
+                for key, entry in self._pending:
+                    self._apply(keys, entries, key, entry)
+                self._keys, self._entries, self._loaded_at = keys, entries, monotonic()
+                self._pending = None
+
+    def _read(self):
+        keys = []
+        entries = {}
+        customers = Customer.objects.only('id', 'first_name', 'last_name', 'email', 'phone')
+        technicians = Technician.objects.select_related('user').only(
+            'id', 'phone', 'is_available', 'user__username', 'user__first_name', 'user__last_name'
+        )
+        rows = [customer_entry(customer) for customer in customers.iterator()]
+        rows += [technician_entry(technician, technician.user) for technician in technicians.iterator()]
+        for tokens, data in rows:
+            key = (data['type'], data['id'])
+            entries[key] = (tokens, data)
+            keys.extend((token, *key) for token in tokens)
+        keys.sort()
+        return keys, entries
+
+    def update_customer(self, customer):
+        self._put(*customer_entry(customer))
+
+    def update_technician(self, technician):
+        self._put(*technician_entry(technician, technician.user))
+
+    def update_user(self, user):
+        """Re-index the technician of ``user``, whose name it shows."""
+        if self._loaded_at is None and self._pending is None:
+            return
+        technician = Technician.objects.filter(user=user).first()
+        if technician is not None:
+            self._put(*technician_entry(technician, user))
+
+    def remove(self, kind, pk):
+        self._change((kind, pk), None)
+
+    def _put(self, tokens, data):
+        self._change((data['type'], data['id']), (tokens, data))
+
+    def _change(self, key, entry):
+        with self.lock:
+            if self._pending is not None:
+                self._pending.append((key, entry))
+            if self._loaded_at is not None:
+                # Otherwise the load reads it from the database anyway
+                self._apply(self._keys, self._entries, key, entry)
+
+    @staticmethod
+    def _apply(keys, entries, key, entry):
+        """Put ``entry`` under ``key`` in ``keys`` and ``entries``, or remove it if ``entry`` is None."""
+        old = entries.pop(key, None)
+        if old is not None:
+            for token in old[0]:
+                position = bisect.bisect_left(keys, (token, *key))
+                if position < len(keys) and keys[position] == (token, *key):
+                    del keys[position]
+        if entry is not None:
+            entries[key] = entry
+            for token in entry[0]:
+                bisect.insort(keys, (token, *key))
+
+    def lookup(self, query, limit=10, kinds=KINDS):
+        """Return up to ``limit`` entries whose tokens start with every word of ``query``."""
+        words = normalize(query)
+        if not words:
+            return []
+        self.ensure_loaded()
+        # The longest word has the fewest completions
+        probe = max(words, key=len)
+        others = [word for word in words if word is not probe]
+        results = []
+        seen = set()
+        with self.lock:
+            keys = self._keys
+            start = bisect.bisect_left(keys, (probe,))
+            for position in range(start, min(len(keys), start + MAX_SCAN)):
+                token, kind, pk = keys[position]
+                if not token.startswith(probe):
+                    break
+                if kind not in kinds or (kind, pk) in seen:
+                    continue
+                seen.add((kind, pk))
+                tokens, data = self._entries[(kind, pk)]
+                if all(any(candidate.startswith(word) for candidate in tokens) for word in others):
+                    results.append(data)
+                    if len(results) == limit:
+                        break
+        return results
+
+
+index = TypeaheadIndex()
@@ -0,0 +1,289 @@
+"""
+Resumable photo uploads.
+
+A client opens an ``UploadSession`` with the file's size and SHA-256, sends
+the bytes in any number of ``PUT`` requests, each starting at the offset the
+server has acknowledged, and finalizes the session to get a ``Photo``. After
+a dropped connection it asks for the session's offset and carries on from
+there.
+
+Each chunk is copied from the request stream in small blocks to a scratch
+file, so neither the chunk nor the file is held in memory, and from there
+to the session's temporary file once the request has claimed its offset.
+The claim is the update of the session's offset, and its row lock is held
+until the bytes are in place, so a request that loses a race for the same
+offset, or whose chunk fails its checks, never writes to the file. A chunk
+sent with a ``Content-Digest: sha-256=:<base64>:`` header is hashed while it
+is received and dropped if it does not match.
+
+The SHA-256 of the whole file is computed incrementally as well: each
+process keeps a running hash per session and feeds it every chunk it writes.
+hashlib cannot save a hash's state to the database, so when a chunk
+arrives at a process whose hash is behind (another worker or host took the
+chunks in between, or the process restarted), it first hashes only the
+bytes it missed from the file. Finalizing compares the running hash,
+caught up the same way, with the session's SHA-256 and moves a second
+link to the file into storage, so the temporary file is still there for a
+retry if the ``Photo`` is not saved; when one process received the last
+chunks the file is not read again for it.
+
+The temporary files live in ``FILE_UPLOAD_TEMP_DIR`` (default: the system
+temporary directory), which must be shared if several hosts serve the API.
+"""
+import base64
+import binascii
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+from PIL import Image
+
+from .exceptions import UploadOffsetMismatch
+from .models import Photo, UploadSession
+
+BLOCK_SIZE = 64 * 1024
+DIGEST_PATTERN = re.compile(r'sha-256=:([A-Za-z0-9+/=]+):')
+
+# Session id -> (bytes hashed, running SHA-256) in this process
+_hashes = {}
+_hashes_lock = threading.Lock()
+
+
+class UploadError(ValueError):
+    pass
+
+
+def session_ttl():
+    return timedelta(seconds=getattr(settings, 'UPLOAD_SESSION_TTL', 24 * 60 * 60))
+
+
+def max_upload_size():
+    return getattr(settings, 'UPLOAD_MAX_SIZE', 50 * 1024 * 1024)
+
+
+def max_chunk_size():
+    return getattr(settings, 'UPLOAD_MAX_CHUNK_SIZE', 8 * 1024 * 1024)
+
+
+def temp_path(session):
+    directory = settings.FILE_UPLOAD_TEMP_DIR or tempfile.gettempdir()
+    return os.path.join(directory, f'fieldmaster-upload-{session.pk}.part')
+
+
+def start(user, filename, size, sha256, content_type, object_id, description=''):
+    """Open a session and create its empty temporary file."""
+    if size > max_upload_size():
+        raise UploadError(f"Uploads are limited to {max_upload_size()} bytes")
+    session = UploadSession.objects.create(
+        uploaded_by=user,
+        filename=filename,
+        size=size,
+        sha256=sha256.lower(),
+        content_type=content_type,
+        object_id=object_id,
+        description=description,
+        expires_at=timezone.now() + session_ttl(),
+    )
+    open(temp_path(session), 'wb').close()
+    return session
+
+
+def parse_digest(header):
+    """Return the SHA-256 bytes from a ``Content-Digest`` header, or None if there is none."""
+    if not header:
+        return None
+    match = DIGEST_PATTERN.search(header)
+    if match is None:
+        raise UploadError("Content-Digest must include a sha-256 value")
+    try:
+        return base64.b64decode(match.group(1), validate=True)
+    except binascii.Error:
+        raise UploadError("Content-Digest is not valid base64")
+
+
+def write_chunk(session, offset, stream, length, digest=None):
+    """
+    Copy ``length`` bytes from ``stream`` into the session's file at
+    ``offset`` and return the new offset. Nothing is kept if the stream ends
+    early or ``digest`` (from ``parse_digest``) does not match.
+    """
+    if offset != session.received:
+        raise UploadOffsetMismatch(session.received)
+    if length > max_chunk_size():
+        raise UploadError(f"Chunks are limited to {max_chunk_size()} bytes")
+    if offset + length > session.size:
+        raise UploadError("The chunk runs past the declared size")
+
+    hasher = hashlib.sha256() if digest is not None else None
+    running = running_hash(session, offset)
+    path = temp_path(session)
+    with tempfile.TemporaryFile(dir=os.path.dirname(path)) as scratch:
+        remaining = length
+        while remaining:
+            block = stream.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            scratch.write(block)
+            running.update(block)
+            if hasher is not None:
+                hasher.update(block)
+            remaining -= len(block)
+        if remaining or (hasher is not None and hasher.digest() != digest):
+            raise UploadError("Chunk incomplete" if remaining else "Chunk does not match its Content-Digest")
+
+        new_offset = offset + length
+        with transaction.atomic():
+            # Claims the offset; the row stays locked until the chunk is in the file
+            advanced = UploadSession.objects.filter(pk=session.pk, received=offset).update(
+                received=new_offset, expires_at=timezone.now() + session_ttl()
+            )
+            if not advanced:
+                # Another request for the same offset got there first
+                received = UploadSession.objects.values_list('received', flat=True).get(pk=session.pk)
+                raise UploadOffsetMismatch(received)
+            scratch.seek(0)
+            with open(path, 'r+b') as target:
+                target.seek(offset)
+                shutil.copyfileobj(scratch, target, BLOCK_SIZE)
+                # Drop bytes left over from an earlier attempt that failed past this point
+                target.truncate()
+    with _hashes_lock:
+        _hashes[session.pk] = (new_offset, running)
+    session.received = new_offset
+    return new_offset
+
+
+def running_hash(session, offset):
+    """
+    Return a SHA-256 over the first ``offset`` bytes of the session's file:
+    a copy of this process's running hash, fed any bytes other processes
+    wrote since it last saw the session.
+    """
+    with _hashes_lock:
+        hashed, hasher = _hashes.get(session.pk, (0, None))
+    if hasher is None or hashed > offset:
+        hashed, hasher = 0, hashlib.sha256()
+    else:
+        hasher = hasher.copy()
+    if hashed < offset:
+        with open(temp_path(session), 'rb') as source:
+            source.seek(hashed)
+            remaining = offset - hashed
+            while remaining:
+                block = source.read(min(BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                hasher.update(block)
+                remaining -= len(block)
+    return hasher
+
+
+class _SessionFile(File):
+    # Lets FileSystemStorage move the file into place instead of copying it
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def finish(session):
+    """
+    Check the complete file and turn it into a ``Photo``. A file that fails
+    the checks is discarded with its session, since the client has to start
+    over anyway.
+    """
+    path = temp_path(session)
+    with transaction.atomic():
+        # Serialises concurrent finalize requests for the same session
+        session = UploadSession.objects.select_for_update().filter(pk=session.pk).first()
+        if session is None:
+            raise UploadError("This upload has already been finalized")
+        if session.received != session.size:
+            raise UploadError(f"Only {session.received} of {session.size} bytes have been received")
+        problem = _check(session, path)
+        if problem is None:
+            photo = Photo(
+                content_type=session.content_type,
+                object_id=session.object_id,
+                description=session.description,
+                uploaded_by=session.uploaded_by,
+            )
+            staged = _link(path)
+            try:
+                with open(staged, 'rb') as source:
+                    photo.photo = _SessionFile(source, name=get_valid_filename(session.filename))
+                    # Checked above, so the blob store need not hash the file again
+                    photo.photo.file.sha256 = session.sha256
+                    photo.save()
+            finally:
+                # Still there if the content was already stored or the save failed
+                _remove(staged)
+            session_id = session.pk
+            session.delete()
+    if problem is not None:
+        discard(session)
+        raise UploadError(problem)
+    _forget_hash(session_id)
+    _remove(path)
+    return photo
+
+
+def _check(session, path):
+    """Return why the received file cannot become a photo, or None."""
+    if running_hash(session, session.size).hexdigest() != session.sha256:
+        return "The file does not match its sha256"
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except Exception:
+        return "The file is not an image"
+    return None
+
+
+def discard(session):
+    path = temp_path(session)
+    session_id = session.pk
+    session.delete()
+    _forget_hash(session_id)
+    _remove(path)
+
+
+def clean_expired(now=None):
+    """Delete sessions past their expiry and their files. Return how many were removed."""
+    expired = UploadSession.objects.filter(expires_at__lt=now or timezone.now())
+    count = 0
+    for session in expired.iterator():
+        discard(session)
+        count += 1
+    return count
+
+
+def _link(path):
+    """Return a second name for ``path`` that storage can move away, leaving ``path`` in place."""
+    staged = f'{path}.{uuid.uuid4().hex}'
+    try:
+        os.link(path, staged)
+    except OSError:
+        # The filesystem has no hard links
+        shutil.copyfile(path, staged)
+    return staged
+
+
+def _forget_hash(session_id):
+    with _hashes_lock:
+        _hashes.pop(session_id, None)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -11,7 +11,15 @@ router.register(r'bills', views.BillViewSet)
 router.register(r'settings', views.SettingsViewSet)
 router.register(r'user-settings', views.UserSettingsViewSet)
 router.register(r'photos', views.PhotoViewSet)
+router.register(r'uploads', views.UploadViewSet, basename='upload')
 router.register(r'users', views.UserViewSet, basename='user')
+router.register(r'dashboard', views.DashboardViewSet, basename='dashboard')
+router.register(r'reports', views.ReportViewSet, basename='report')
+router.register(r'sync', views.SyncViewSet, basename='sync')
+router.register(r'exports', views.ExportViewSet, basename='export')
+router.register(r'search', views.SearchViewSet, basename='search')
+router.register(r'typeahead', views.TypeaheadViewSet, basename='typeahead')
+router.register(r'tasks', views.TaskViewSet, basename='task')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -1,39 +1,110 @@
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+import os
+import tempfile
+import zipfile
+
+from django.http import FileResponse
 from django.shortcuts import render
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from .models import Customer, Technician, Appointment, AppointmentPhoto, Bill, BillLineItem, Settings, UserSettings, Photo
+from rest_framework.utils.urls import replace_query_param
+from .models import (
+    Customer, Technician, Appointment, AppointmentPhoto, Bill, BillLineItem, Settings, UserSettings, Photo,
+    CustomerDailyRollup, TechnicianDailyRollup, UploadSession,
+)
 from .serializers import (
     CustomerSerializer,
     TechnicianSerializer,
     AppointmentSerializer,
+    AppointmentBulkSerializer,
+    DispatchAssignmentSerializer,
     AppointmentPhotoSerializer,
     BillSerializer,
     BillLineItemSerializer,
     SettingsSerializer,
     UserSettingsSerializer,
     UserSerializer,
-    PhotoSerializer
+    PhotoSerializer,
+    UploadSessionSerializer,
 )
+from . import availability, dashboard, dispatch, exports, invoices, rollups, search, sync, taskqueue, typeahead, uploads
+from .exceptions import SyncTokenExpired
+from .mixins import ConditionalGetMixin, PhotoLoaderMixin, QueryPlanMixin, RowListMixin, StreamingMixin
 from rest_framework.permissions import IsAuthenticated
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 
 # Create your views here.
 
-class CustomerViewSet(viewsets.ModelViewSet):
+class CustomerViewSet(ConditionalGetMixin, RowListMixin, QueryPlanMixin, PhotoLoaderMixin, viewsets.ModelViewSet):
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
+    replica_actions = ('list', 'retrieve')
+    keyset_ordering = ('created_at', 'id')
     permission_classes = [permissions.AllowAny]
 
-class TechnicianViewSet(viewsets.ModelViewSet):
+class TechnicianViewSet(ConditionalGetMixin, RowListMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = Technician.objects.all()
     serializer_class = TechnicianSerializer
+    replica_actions = ('list', 'retrieve')
     permission_classes = [permissions.AllowAny]
+    max_availability_days = 62
+
+    @action(detail=False, methods=['get'])
+    def availability(self, request):
+        start = self.get_datetime_param('start')
+        end = self.get_datetime_param('end')
+        try:
+            duration = int(request.query_params.get('duration', 60))
+            limit = int(request.query_params.get('limit', 100))
+        except ValueError:
+            raise ValidationError({'duration': 'duration and limit must be whole numbers of minutes / slots.'})
 
-class AppointmentViewSet(viewsets.ModelViewSet):
+        if end <= start:
+            raise ValidationError({'end': 'end must be after start.'})
+        if (end - start).days > self.max_availability_days:
+            raise ValidationError({'end': f'The window may span at most {self.max_availability_days} days.'})
+        if not 1 <= duration <= 24 * 60:
+            raise ValidationError({'duration': 'duration must be between 1 and 1440 minutes.'})
+
+        slots = availability.free_slots(start, end, duration, limit=max(1, min(limit, 1000)))
+        return Response({
+            'start': start,
+            'end': end,
+            'duration': duration,
+            'slots': slots,
+        })
+
+    def get_datetime_param(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            raise ValidationError({name: 'This parameter is required.'})
+        try:
+            parsed = parse_datetime(value)
+            if parsed is None:
+                day = parse_date(value)
+                parsed = datetime.combine(day, datetime.min.time()) if day else None
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise ValidationError({name: 'Use an ISO 8601 date or date-time.'})
+        if timezone.is_aware(parsed):
+            # Appointment times are stored as local wall-clock times
+            parsed = timezone.make_naive(parsed)
+        return parsed
+
+class AppointmentViewSet(ConditionalGetMixin, RowListMixin, QueryPlanMixin, PhotoLoaderMixin, viewsets.ModelViewSet):
     queryset = Appointment.objects.all()
     serializer_class = AppointmentSerializer
+    replica_actions = ('list', 'retrieve')
+    keyset_ordering = ('appointment_date', 'start_time', 'id')
     permission_classes = [permissions.AllowAny]
 
     @action(detail=True, methods=['post'])
@@ -46,8 +117,83 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request):
+        serializer = AppointmentBulkSerializer(data=request.data, many=True, min_length=1, max_length=1000)
+        serializer.is_valid(raise_exception=True)
+        rows = serializer.validated_data
+
+        # One query each to resolve every referenced customer and technician
+        customer_ids = {row['customer_id'] for row in rows}
+        technician_ids = {row['technician_id'] for row in rows if row.get('technician_id')}
+        customers = Customer.objects.in_bulk(customer_ids)
+        technicians = Technician.objects.select_related('user').in_bulk(technician_ids)
+
+        errors = []
+        for row in rows:
+            row_errors = {}
+            if row['customer_id'] not in customers:
+                row_errors['customer_id'] = [f'Invalid pk "{row["customer_id"]}" - object does not exist.']
+            if row.get('technician_id') and row['technician_id'] not in technicians:
+                row_errors['technician_id'] = [f'Invalid pk "{row["technician_id"]}" - object does not exist.']
+            errors.append(row_errors)
+        if any(errors):
+            raise ValidationError(errors)
+
+        appointments = []
+        for row in rows:
+            technician_id = row.pop('technician_id', None)
+            appointments.append(Appointment(
+                customer=customers[row.pop('customer_id')],
+                technician=technicians.get(technician_id),
+                **row
+            ))
+        appointments = Appointment.bulk_create_with_bills(appointments)
+
+        output = self.get_serializer(appointments, many=True)
+        return Response(output.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get', 'post'], url_path='dispatch')
+    def dispatch_plan(self, request):
+        """
+        GET previews technician assignments for the unassigned appointments on
+        ``?date=``. POST applies them: either the ``assignments`` sent back
+        from a preview or, without them, a freshly computed plan for ``date``.
+        """
+        params = request.query_params if request.method == 'GET' else request.data
+        if request.method == 'POST' and 'assignments' in request.data:
+            serializer = DispatchAssignmentSerializer(data=request.data['assignments'], many=True)
+            serializer.is_valid(raise_exception=True)
+            assignments = serializer.validated_data
+            plan = {'date': None, 'assignments': assignments, 'unassigned': []}
+        else:
+            try:
+                day = parse_date(str(params.get('date', '')))
+            except ValueError:
+                day = None
+            if day is None:
+                raise ValidationError({'date': 'A date in YYYY-MM-DD format is required.'})
+            plan = dispatch.plan_dispatch(day)
+            if request.method == 'GET':
+                return Response(plan)
+
+        try:
+            dispatch.apply_assignments(
+                (assignment['appointment_id'], assignment['technician_id']) for assignment in plan['assignments']
+            )
+        except ValueError as error:
+            raise ValidationError({'assignments': str(error)})
+        return Response({
+            'date': plan['date'],
+            'applied': [
+                {'appointment_id': assignment['appointment_id'], 'technician_id': assignment['technician_id']}
+                for assignment in plan['assignments']
+            ],
+            'unassigned': plan['unassigned'],
+        })
+
     def get_queryset(self):
-        queryset = Appointment.objects.all()
+        queryset = super().get_queryset()
         customer = self.request.query_params.get('customer', None)
         technician = self.request.query_params.get('technician', None)
         status = self.request.query_params.get('status', None)
@@ -73,17 +219,29 @@ class AppointmentPhotoViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(appointment_id=appointment)
         return queryset
 
-class BillViewSet(viewsets.ModelViewSet):
+class BillViewSet(ConditionalGetMixin, RowListMixin, QueryPlanMixin, PhotoLoaderMixin, viewsets.ModelViewSet):
     queryset = Bill.objects.all()
     serializer_class = BillSerializer
+    replica_actions = ('list', 'retrieve')
     permission_classes = [permissions.AllowAny]
+    ordering_fields = ('created_at', 'subtotal', 'tax', 'total')
+
+    @property
+    def keyset_ordering(self):
+        # ?ordering=-total etc.; the id tie-breaker follows the same direction
+        ordering = self.request.query_params.get('ordering', '')
+        if ordering.lstrip('-') in self.ordering_fields:
+            return (ordering, '-id' if ordering.startswith('-') else 'id')
+        return ('created_at', 'id')
 
     def get_queryset(self):
-        queryset = Bill.objects.all()
+        queryset = super().get_queryset()
         customer = self.request.query_params.get('customer', None)
         appointment = self.request.query_params.get('appointment', None)
         bill_type = self.request.query_params.get('type', None)
         status = self.request.query_params.get('status', None)
+        min_total = self.get_decimal_param('min_total')
+        max_total = self.get_decimal_param('max_total')
         
         if customer:
             queryset = queryset.filter(customer_id=customer)
@@ -93,8 +251,21 @@ class BillViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(type=bill_type)
         if status:
             queryset = queryset.filter(status=status)
+        if min_total is not None:
+            queryset = queryset.filter(total__gte=min_total)
+        if max_total is not None:
+            queryset = queryset.filter(total__lte=max_total)
         
-        return queryset
+        return queryset.order_by(*self.keyset_ordering)
+
+    def get_decimal_param(self, name):
+        value = self.request.query_params.get(name, None)
+        if not value:
+            return None
+        try:
+            return Decimal(value)
+        except InvalidOperation:
+            raise ValidationError({name: 'A valid number is required.'})
 
     def create(self, request, *args, **kwargs):
         line_items_data = request.data.pop('line_items', [])
@@ -120,21 +291,66 @@ class BillViewSet(viewsets.ModelViewSet):
         serializer.context['line_items'] = line_items_data
         
         self.perform_update(serializer)
+
+        if getattr(instance, '_prefetched_objects_cache', None):
+            # Line items may have changed, so drop the prefetched copies
+            instance._prefetched_objects_cache = {}
+
         return Response(serializer.data)
 
-class BillLineItemViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'])
+    def pdf(self, request, pk=None):
+        """The bill as a PDF, rendered once per version of its content and then served from disk."""
+        bill = self.get_object()
+        path = invoices.pdf_path(bill)
+        etag = '"%s"' % os.path.splitext(os.path.basename(path))[0]
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = FileResponse(open(path, 'rb'), content_type='application/pdf',
+                                    filename=f'Bill_{bill.pk}.pdf')
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    @action(detail=False, methods=['post'], url_path='pdf')
+    def pdf_batch(self, request):
+        """
+        A ZIP of the PDFs of the bills in ``ids``, or of every bill matching
+        the list filters, rendered in the invoice process pool.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        ids = request.data.get('ids')
+        if ids is not None:
+            if not isinstance(ids, list) or not all(isinstance(bill_id, int) for bill_id in ids):
+                raise ValidationError({'ids': 'A list of bill ids is required.'})
+            queryset = queryset.filter(pk__in=ids)
+        if queryset.count() > invoices.batch_limit():
+            raise ValidationError({'detail': f'At most {invoices.batch_limit()} bills can be exported at once; '
+                                             'use manage.py render_invoices for more.'})
+        paths, _ = invoices.render_bills(queryset)
+
+        archive = tempfile.SpooledTemporaryFile(max_size=10 * 1024 * 1024)
+        # PDF content streams are already compressed
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_STORED) as output:
+            for bill_id in sorted(paths):
+                output.write(paths[bill_id], f'Bill_{bill_id}.pdf')
+        archive.seek(0)
+        return FileResponse(archive, content_type='application/zip', as_attachment=True, filename='invoices.zip')
+
+class BillLineItemViewSet(ConditionalGetMixin, RowListMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = BillLineItem.objects.all()
     serializer_class = BillLineItemSerializer
+    replica_actions = ('list', 'retrieve')
     permission_classes = [permissions.AllowAny]
 
     def get_queryset(self):
-        queryset = BillLineItem.objects.all()
+        queryset = super().get_queryset()
         bill = self.request.query_params.get('bill', None)
         if bill:
             queryset = queryset.filter(bill_id=bill)
         return queryset
 
-class SettingsViewSet(viewsets.ModelViewSet):
+class SettingsViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Settings.objects.all()
     serializer_class = SettingsSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -147,9 +363,10 @@ class UserSettingsViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return UserSettings.objects.filter(user=self.request.user)
 
-class PhotoViewSet(viewsets.ModelViewSet):
+class PhotoViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Photo.objects.all()
     serializer_class = PhotoSerializer
+    replica_actions = ('list', 'retrieve')
     permission_classes = [permissions.IsAuthenticated]
 
     def list(self, request, *args, **kwargs):
@@ -158,6 +375,10 @@ class PhotoViewSet(viewsets.ModelViewSet):
         queryset = self.get_queryset()
         if content_type and object_id:
             queryset = queryset.filter(content_type=content_type, object_id=object_id)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True, context={'request': request})
+            return self.get_paginated_response(serializer.data)
         serializer = self.get_serializer(queryset, many=True, context={'request': request})
         return Response(serializer.data)
 
@@ -223,6 +444,285 @@ class PhotoViewSet(viewsets.ModelViewSet):
             instance.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+class UploadViewSet(viewsets.GenericViewSet):
+    """
+    Resumable photo uploads (see ``uploads.py``): ``POST`` opens a session,
+    ``PUT`` with an ``Upload-Offset`` header appends a chunk, ``GET``/``HEAD``
+    report the offset to resume from, ``finalize`` creates the ``Photo`` and
+    ``DELETE`` abandons the upload.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(uploaded_by=self.request.user)
+
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            session = uploads.start(request.user, **serializer.validated_data)
+        except uploads.UploadError as error:
+            raise ValidationError({'size': str(error)})
+        return self.session_response(session, status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk=None):
+        return self.session_response(self.get_object())
+
+    def update(self, request, pk=None):
+        session = self.get_object()
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            raise ValidationError({'Upload-Offset': 'The byte offset of the chunk is required.'})
+        # Read the raw body stream; request.data would buffer and parse it
+        try:
+            length = int(request.headers.get('Content-Length') or 0)
+        except ValueError:
+            raise ValidationError({'Content-Length': 'The length of the chunk in bytes is required.'})
+        try:
+            digest = uploads.parse_digest(request.headers.get('Content-Digest'))
+            if length:
+                uploads.write_chunk(session, offset, request.stream, length, digest)
+        except uploads.UploadError as error:
+            raise ValidationError({'detail': str(error)})
+        return self.session_response(session)
+
+    def destroy(self, request, pk=None):
+        uploads.discard(self.get_object())
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        try:
+            photo = uploads.finish(self.get_object())
+        except uploads.UploadError as error:
+            raise ValidationError({'detail': str(error)})
+        return Response(PhotoSerializer(photo, context={'request': request}).data, status=status.HTTP_201_CREATED)
+
+    def session_response(self, session, status_code=status.HTTP_200_OK):
+        response = Response(self.get_serializer(session).data, status=status_code)
+        response['Upload-Offset'] = str(session.received)
+        return response
+
+class DashboardViewSet(viewsets.ViewSet):
+    # Not on the replica: a summary built from a lagging replica would be cached until the next write
+    permission_classes = [permissions.AllowAny]
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        return Response(dashboard.cached_summary())
+
+class ReportViewSet(viewsets.ViewSet):
+    """Revenue reports over ``?start=`` and ``?end=`` (inclusive dates), read from the rollup tables."""
+    permission_classes = [permissions.AllowAny]
+    replica_actions = ('technicians', 'customers', 'daily')
+
+    @action(detail=False, methods=['get'])
+    def technicians(self, request):
+        rows = rollups.report(
+            TechnicianDailyRollup,
+            ('technician', 'technician__user__first_name', 'technician__user__last_name'),
+            *self.get_date_range(),
+        )
+        return Response([
+            {
+                'technician_id': row.pop('technician'),
+                'technician_name': f"{row.pop('technician__user__first_name') or ''} "
+                                   f"{row.pop('technician__user__last_name') or ''}".strip(),
+                **row,
+            }
+            for row in rows
+        ])
+
+    @action(detail=False, methods=['get'])
+    def customers(self, request):
+        rows = rollups.report(
+            CustomerDailyRollup,
+            ('customer', 'customer__first_name', 'customer__last_name'),
+            *self.get_date_range(),
+        )
+        return Response([
+            {
+                'customer_id': row.pop('customer'),
+                'customer_name': f"{row.pop('customer__first_name') or ''} "
+                                 f"{row.pop('customer__last_name') or ''}".strip(),
+                **row,
+            }
+            for row in rows
+        ])
+
+    @action(detail=False, methods=['get'])
+    def daily(self, request):
+        # Every issued bill has exactly one customer row (possibly the empty one)
+        return Response(list(rollups.report(CustomerDailyRollup, ('day',), *self.get_date_range())))
+
+    def get_date_range(self):
+        days = []
+        for name in ('start', 'end'):
+            value = self.request.query_params.get(name)
+            try:
+                day = parse_date(value) if value else None
+            except ValueError:
+                day = None
+            if day is None:
+                raise ValidationError({name: 'A date in YYYY-MM-DD format is required.'})
+            days.append(day)
+        if days[1] < days[0]:
+            raise ValidationError({'end': 'end must not be before start.'})
+        return days
+
+class SyncViewSet(StreamingMixin, viewsets.ViewSet):
+    """
+    Delta sync for offline clients: everything on the first call, then only
+    what changed or was deleted since ``?since=<token>``. See ``sync.py``.
+    """
+
+    def list(self, request):
+        since = request.query_params.get('since')
+        try:
+            moment = sync.read_token(since) if since else None
+        except sync.ExpiredToken:
+            raise SyncTokenExpired()
+        except sync.InvalidToken:
+            raise ValidationError({'since': 'Unrecognised sync token.'})
+        token, chunks = sync.feed(moment, request)
+        response = self.streaming_response(chunks, 'application/json')
+        # Also in the body; the header lets a client read it before the stream ends
+        response['X-Sync-Token'] = token
+        response['Cache-Control'] = 'no-store'
+        return response
+
+class ExportViewSet(StreamingMixin, viewsets.ViewSet):
+    """
+    Streamed exports for accounting: ``?output=csv`` (the default) or
+    ``ndjson``, filtered by optional ``start`` and ``end`` (inclusive dates),
+    ``status`` (comma-separated) and ``technician``. See ``exports.py``.
+    """
+
+    @action(detail=False, methods=['get'])
+    def bills(self, request):
+        return self.export('bills')
+
+    @action(detail=False, methods=['get'], url_path='line-items')
+    def line_items(self, request):
+        return self.export('line_items')
+
+    @action(detail=False, methods=['get'])
+    def appointments(self, request):
+        return self.export('appointments')
+
+    def export(self, name):
+        params = self.request.query_params
+        output = params.get('output', 'csv')
+        if output not in exports.OUTPUTS:
+            raise ValidationError({'output': f"Must be one of: {', '.join(exports.OUTPUTS)}."})
+        start, end = self.get_date_param('start'), self.get_date_param('end')
+        if start and end and end < start:
+            raise ValidationError({'end': 'end must not be before start.'})
+        technician = params.get('technician')
+        if technician is not None:
+            try:
+                technician = int(technician)
+            except ValueError:
+                raise ValidationError({'technician': 'A whole number is required.'})
+        statuses = [value for value in params.get('status', '').split(',') if value]
+
+        content_type, chunks = exports.stream(
+            name, output, start=start, end=end, statuses=statuses, technician=technician,
+        )
+        response = self.streaming_response(chunks, content_type)
+        response['Content-Disposition'] = f'attachment; filename="{name}.{exports.OUTPUTS[output][1]}"'
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    def get_date_param(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise ValidationError({name: 'A date in YYYY-MM-DD format is required.'})
+        return day
+
+class SearchViewSet(viewsets.ViewSet):
+    """
+    Ranked full-text search, grouped by type: ``?q=`` plus optional
+    ``type`` (one group only), ``page`` and ``page_size``. See ``search.py``.
+    """
+    page_size = 10
+    max_page_size = 50
+
+    def list(self, request):
+        query = request.query_params.get('q', '').strip()
+        if len(query) < 2 or len(query) > 200:
+            raise ValidationError({'q': 'Search for 2 to 200 characters.'})
+        only = request.query_params.get('type')
+        if only is not None and only not in search.TYPE_KEYS:
+            raise ValidationError({'type': f"Must be one of: {', '.join(search.TYPE_KEYS)}."})
+        page = self.get_int_param('page', 1, 1)
+        page_size = self.get_int_param('page_size', self.page_size, 1, self.max_page_size)
+
+        results = {}
+        for search_type in search.TYPES:
+            if only is not None and search_type.key != only:
+                continue
+            # One extra row tells whether there is a next page, without counting every match
+            rows = search.search(search_type, query, (page - 1) * page_size, page_size + 1)
+            next_link = None
+            if len(rows) > page_size:
+                next_link = replace_query_param(request.build_absolute_uri(), 'type', search_type.key)
+                next_link = replace_query_param(next_link, 'page', page + 1)
+            results[search_type.key] = {'results': rows[:page_size], 'next': next_link}
+        return Response({'query': query, 'results': results})
+
+    def get_int_param(self, name, default, minimum, maximum=None):
+        value = self.request.query_params.get(name)
+        if value is None:
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValidationError({name: 'A whole number is required.'})
+        if value < minimum:
+            raise ValidationError({name: f'Must be at least {minimum}.'})
+        return min(value, maximum) if maximum else value
+
+class TypeaheadViewSet(viewsets.ViewSet):
+    """
+    Customer and technician suggestions for select boxes, answered from the
+    in-process index in ``typeahead.py``: ``?q=`` plus optional ``type``
+    and ``limit``.
+    """
+    default_limit = 10
+    max_limit = 50
+
+    def list(self, request):
+        kinds = typeahead.KINDS
+        kind = request.query_params.get('type')
+        if kind is not None:
+            if kind not in typeahead.KINDS:
+                raise ValidationError({'type': f"Must be one of: {', '.join(typeahead.KINDS)}."})
+            kinds = (kind,)
+        try:
+            limit = int(request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            raise ValidationError({'limit': 'A whole number is required.'})
+        limit = max(1, min(limit, self.max_limit))
+        results = typeahead.index.lookup(request.query_params.get('q', ''), limit, kinds)
+        return Response({'results': results})
+
+class TaskViewSet(viewsets.ViewSet):
+    """Background task queue monitoring for staff: depth, failures and latency."""
+    permission_classes = [permissions.IsAdminUser]
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        return Response(taskqueue.stats())
+
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
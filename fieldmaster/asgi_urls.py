@@ -0,0 +1,12 @@
+"""
+URL configuration for requests served over ASGI (see
+``appointments.middleware.AsyncRoutesMiddleware``): the native async views
+first, then every regular route.
+"""
+from django.urls import include, path
+
+from .urls import urlpatterns as regular_urlpatterns
+
+urlpatterns = [
+    path('api/', include('appointments.async_urls')),
+] + regular_urlpatterns
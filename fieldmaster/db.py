@@ -0,0 +1,7 @@
+def check_connection(connection):
+    """
+    Health check for psycopg's pool, run before a pooled connection is handed
+    out: a connection the server dropped fails here and is replaced instead of
+    failing the request.
+    """
+    connection.execute('SELECT 1')
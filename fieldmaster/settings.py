@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 import os
 
+from .db import check_connection
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -46,6 +48,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'appointments.middleware.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,9 +56,12 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'appointments.middleware.AsyncRoutesMiddleware',
 ]
 
 ROOT_URLCONF = 'fieldmaster.urls'
+# Requests that arrive over ASGI: async views for the read-heavy endpoints, then ROOT_URLCONF
+ASYNC_ROOT_URLCONF = 'fieldmaster.asgi_urls'
 
 TEMPLATES = [
     {
@@ -86,9 +92,32 @@ DATABASES = {
         'PASSWORD': 'password',
         'HOST': 'localhost',
         'PORT': '5432',
+        'OPTIONS': {
+            # psycopg's connection pool (psycopg 3) instead of a new connection per request;
+            # each connection is checked before it is handed out
+            'pool': {
+                'min_size': int(os.environ.get('DATABASE_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.environ.get('DATABASE_POOL_MAX_SIZE', 10)),
+                'timeout': 10,
+                'check': check_connection,
+            },
+        },
     }
 }
 
+# Optional read replica for list, detail and report reads (see appointments/routers.py)
+if os.environ.get('DATABASE_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['DATABASE_REPLICA_HOST'],
+        'PORT': os.environ.get('DATABASE_REPLICA_PORT', '5432'),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['appointments.routers.ReplicaRouter']
+# Seconds a client that wrote reads from the primary, covering replication lag
+REPLICA_PIN_SECONDS = 15
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -140,6 +169,15 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # orjson-backed JSON with the same output as DRF's JSONRenderer
+    'DEFAULT_RENDERER_CLASSES': [
+        'appointments.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    # Keyset pagination, opt-in per request with ?page_size= or ?cursor=
+    'DEFAULT_PAGINATION_CLASS': 'appointments.pagination.KeysetPagination',
+    # Adds 409 responses for technician double-bookings and upload offset mismatches
+    'EXCEPTION_HANDLER': 'appointments.exceptions.exception_handler',
 }
 
 # CORS settings
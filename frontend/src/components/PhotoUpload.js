@@ -135,7 +135,7 @@ const PhotoUpload = ({ objectType, objectId }) => {
           >
             {console.log('DEBUG: Rendering photo with src:', photo.photo)}
             <img
-              src={photo.photo}
+              src={photo.thumbnail_url || photo.photo}
               alt="Uploaded"
               style={{
                 width: '100%',
@@ -13,7 +13,7 @@ import {
 import { Calendar, momentLocalizer } from 'react-big-calendar';
 import moment from 'moment';
 import 'react-big-calendar/lib/css/react-big-calendar.css';
-import { appointments as appointmentsApi } from '../services/api';
+import { appointments as appointmentsApi, dashboard as dashboardApi } from '../services/api';
 import { useNavigate } from 'react-router-dom';
 
 const localizer = momentLocalizer(moment);
@@ -34,20 +34,22 @@ function Dashboard() {
   useEffect(() => {
     const fetchAppointments = async () => {
       try {
-        const response = await appointmentsApi.getAll();
-        console.log('API Response:', response.data);
+        const [response, summary] = await Promise.all([
+          appointmentsApi.getAll(),
+          dashboardApi.getSummary(),
+        ]);
         setAppointments(response.data);
         setLoading(false);
-        
-        // Calculate statistics
-        const stats = {
-          total: response.data.length,
-          scheduled: response.data.filter(a => a.status === 'scheduled').length,
-          inProgress: response.data.filter(a => a.status === 'in_progress').length,
-          completed: response.data.filter(a => a.status === 'completed').length,
-          cancelled: response.data.filter(a => a.status === 'cancelled').length,
-        };
-        setStats(stats);
+
+        // Counts come precomputed (and cached) from the server
+        const byStatus = summary.data.appointments.by_status;
+        setStats({
+          total: summary.data.appointments.total,
+          scheduled: byStatus.scheduled,
+          inProgress: byStatus.in_progress,
+          completed: byStatus.completed,
+          cancelled: byStatus.cancelled,
+        });
       } catch (err) {
         console.error('API Error:', err);
         setError(err.message);
@@ -49,6 +49,20 @@ export const photos = {
     delete: (id) => api.delete(`/photos/${id}/`),
 };
 
+// Resumable uploads: create a session, put chunks at the acknowledged offset, then finalize
+export const uploads = {
+    start: (data) => api.post('/uploads/', data),
+    getStatus: (id) => api.get(`/uploads/${id}/`),
+    putChunk: (id, offset, chunk) => api.put(`/uploads/${id}/`, chunk, {
+        headers: {
+            'Content-Type': 'application/octet-stream',
+            'Upload-Offset': offset,
+        },
+    }),
+    finalize: (id) => api.post(`/uploads/${id}/finalize/`),
+    abort: (id) => api.delete(`/uploads/${id}/`),
+};
+
 export const appointments = {
     getAll: () => api.get('/appointments/'),
     getById: (id) => api.get(`/appointments/${id}/`),
@@ -73,6 +87,31 @@ export const technicians = {
     delete: (id) => api.delete(`/technicians/${id}/`),
 };
 
+export const search = {
+    // Grouped, ranked matches; pass { type, page } to page through one group
+    query: (q, params = {}) => api.get('/search/', { params: { q, ...params } }),
+};
+
+export const typeahead = {
+    // type is 'customer' or 'technician'; leave it out for both
+    suggest: (q, type, limit = 10) => api.get('/typeahead/', { params: { q, type, limit } }),
+};
+
+// Server-rendered invoice PDFs, returned as Blobs
+export const invoices = {
+    getPdf: (billId) => api.get(`/bills/${billId}/pdf/`, { responseType: 'blob' }),
+    getZip: (billIds) => api.post('/bills/pdf/', { ids: billIds }, { responseType: 'blob' }),
+};
+
+export const dashboard = {
+    getSummary: () => api.get('/dashboard/summary/'),
+};
+
+export const sync = {
+    // Pass the token from the previous response to get only what changed
+    getChanges: (since) => api.get('/sync/', { params: since ? { since } : {} }),
+};
+
 export const auth = {
     login: (credentials) => api.post('/auth/token/', credentials),
     logout: () => api.post('/auth/logout/'),